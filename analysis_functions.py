@@ -2,7 +2,7 @@
 
 ######################## LIST AND DICTIONARY GENERATION ##################################
 
-def create_label_order_dict(label_list):
+def create_label_order_dict(label_list, compiled=False):
 
     # this function will create a dictionary to apply new numbered lables to your data so that it orders correctly in tables
 
@@ -11,18 +11,24 @@ def create_label_order_dict(label_list):
     ## MANDATORY
     ### label_list is the list of labels for your category, which MUST be in desired order
 
+    ## OPTIONAL
+    ### compiled will return a LabelMapper (still a dictionary) that can map a whole column at once. defaults to False
+
     # create an empty dict
     order_dict = {}
 
     # iterating over the label_list
     for position, label in enumerate(label_list):
         # create a pair of the label and its numeric position
-        order_dict[label] = str(position)
+        order_dict[label] = position
+
+    if compiled == True:
+        return LabelMapper(order_dict, step_name='order')
 
     return order_dict
 
 
-def create_label_mapping(data_list, label_list):
+def create_label_mapping(data_list, label_list, compiled=False):
     
     # this function will create a dictionary to apply map your data values to you desired labels
     ## the two lists MUST be in the same order!!
@@ -33,704 +39,2786 @@ def create_label_mapping(data_list, label_list):
     ### data_list is the list of labels in your raw data, which MUST be in the same order as your label_list
     ### label_list is the list of labels for your category, which MUST be in desired order
 
+    ## OPTIONAL
+    ### compiled will return a LabelMapper (still a dictionary) that can map a whole column at once. defaults to False
+
     # a dictionary is created that matches the value from each list together
-    return dict(zip(data_list, label_list))
+    label_mapping = dict(zip(data_list, label_list))
 
+    if compiled == True:
+        return LabelMapper(label_mapping, step_name='label')
 
-######################## GROUPBY RESULTS ##################################
+    return label_mapping
 
 
-def simple_groupby(df, col_name, aggregations, index_mapping=None, index_ordered_list=None, index_name=None, stats_names=None,\
-    null_to_0=None):
+class LabelMapper(dict):
 
-    # this function will perform a simple groupby by the specified column (col_name) and has optional args for formatting
+    # this class is a label dictionary (ex: from create_label_mapping or create_label_order_dict) that can map a whole column at once
+    ## it factorizes the column once and only looks up each distinct value, so the cost grows with the number of
+    ## distinct values rather than the number of rows
+    ## every value missing from the mapping is reported together before anything is mapped
+    ## since it is still a dictionary, it can be passed anywhere a col_mapping or col_order dictionary is used
 
-    ## MANDATORY:
-    ### df is your dataframe to be analyzed
-    ### col_name is the column to perform the groupby with    
-    ### aggregations is the dictionary containing your analyses for the groupby
+    # ARGUMENTS
 
-    ## OPTIONAL:
-    ### index_mapping is the dictionary to map your values in your col_name column to their desired labels
-    ### index_ordered_list is the list of your col_name index values in their desired order
-    ####        if you are using index_mapping to change the index values, this list MUST match the new names!
-    ### index_name is the name of your index  
-    ### stats_names is the list of names of your columns containing your results
-    ####        this list MUST be in the same around as your aggregations!
-    ### null_to_0 is your list of columns (matching stats_names) to convert nulls to 0s. defaults to None
+    ## MANDATORY
+    ### mapping is the dictionary of your data values to their new values
 
-    # import pandas in case any aggregations require it (ex: pd.Series.nunique for unique counts)
-    import pandas as pd
+    ## OPTIONAL
+    ### step_name is what the new values are called in error messages (ex: 'label' or 'order'). defaults to 'label'
 
+    def __init__(self, mapping, step_name='label'):
+        dict.__init__(self, mapping)
+        # each step is checked separately so missing values are reported against the dictionary they are missing from
+        self.steps = [(step_name, dict(mapping))]
 
-    # groupby var needs to be cateogorical so all rows return data even if there is none, which needs to be categorical dtype
-    ## but categorical dtype cols cannot be sorted
-    ## create a copy var and set that as categorical type
-    df['copy'] = df[col_name]
-    df['copy'] = df['copy'].astype('category')    
+    def then(self, next_mapping):
 
-    # groupby the col_name and its copy
-    df = df.groupby([col_name, 'copy']).agg(aggregations)
+        # this method will chain another dictionary after this one (ex: labels and then their order) so both are mapped in one step
 
-    # reset the index
-    df.reset_index(inplace=True)
-    # get rid of duplicates by only keeping rows where the copy matches the col_name
-    df = df[df[col_name]==df['copy']]
-    # drop the copy column
-    df.drop(columns=['copy'],inplace=True)
-    # set the index back to just col_name
-    df.set_index(col_name, inplace=True)
+        if not isinstance(next_mapping, LabelMapper):
+            next_mapping = LabelMapper(next_mapping, step_name='order')
 
-    # renaming index values
-    if index_mapping == None:
-        pass 
-    else:
-        # if your index name is also the name of one of your columns (ex: you took a count of your groupby var)
-        if df.index.name in list(df.columns):
-            # temporarily rename results col
-            df.rename(columns={col_name:'temp'}, inplace=True)
-            # reset the index for manipulation
-            df.reset_index(inplace=True)
-            # map the desired values onto your index
-            df[col_name] = df[col_name].map(index_mapping)
-            # set the index back
-            df.set_index(col_name, inplace=True)
-            # change the name of the column back
-            df.rename(columns={'temp':col_name}, inplace=True)
-        else:
-           # reset the index for manipulation
-            df.reset_index(inplace=True)
-            # map the desired values onto your index
-            df[col_name] = df[col_name].map(index_mapping)
-            # set the index back
-            df.set_index(col_name, inplace=True)
+        chained = LabelMapper({key: next_mapping[value] for key, value in self.items() if value in next_mapping})
+        chained.steps = self.steps + next_mapping.steps
+        return chained
 
-    # reordering the index
-    if index_ordered_list == None:
-        pass 
-    else:
-        # if your index name is also the name of one of your columns (ex: you took a count of your groupby var)
-        if df.index.name in list(df.columns):
-            # temporarily rename results col
-            df.rename(columns={col_name:'temp'}, inplace=True)
-            # reset the index for manipulation
-            df.reset_index(inplace=True)
-            # assigning int value to each index value in ascending order
-            mapping = {index_order: i for i, index_order in enumerate(index_ordered_list)}
-            # mapping those int values onto the index variable to create a key
-            key = df[col_name].map(mapping)
-            # reordering the dataframe by the key
-            df = df.iloc[key.argsort()]
-            # set the index back
-            df.set_index(col_name, inplace=True)
-            # change the name of the column back
-            df.rename(columns={'temp':col_name}, inplace=True)
-        else:
-            # reset the index for manipulation
-            df.reset_index(inplace=True)
-            # assigning int value to each index value in ascending order
-            mapping = {index_order: i for i, index_order in enumerate(index_ordered_list)}
-            # mapping those int values onto the index variable to create a key
-            key = df[col_name].map(mapping)
-            # reordering the dataframe by the key
-            df = df.iloc[key.argsort()]
-            # set the index back
-            df.set_index(col_name, inplace=True)
+    def unmapped(self, values):
 
-    # renaming index
-    if index_name == None:
-        pass 
-    else:
-        df.index.name = index_name
+        # this method will return a dictionary of each step to the values that have no entry in it
 
-    # renaming results columns
-    if stats_names == None:
-        pass
-    else:
-        df.columns = stats_names
+        missing = {}
+        for step_name, step_mapping in self.steps:
+            step_missing = [value for value in values if value not in step_mapping]
+            if len(step_missing) > 0:
+                missing[step_name] = step_missing
+            values = [step_mapping[value] for value in values if value in step_mapping]
+        return missing
 
-    # replace nulls with 0
-    if null_to_0 == None:
-        pass
-    else:
-        for null_col_name in null_to_0:
-            for col_num, df_col_name in enumerate(df.columns):
-                if null_col_name == df_col_name:
-                    df[df_col_name] = df[df_col_name].fillna(0)         
+    def map(self, series):
 
-    return df
+        # this method will map every value in series and return the mapped series
 
+        import pandas as pd
 
-######################## PIVOTED RESULTS ##################################
+        # codes point each row at its distinct value, so the dictionary is only used once per distinct value
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
 
-#####       SINGLE ROW INDEX SINGLE HEADER ROW              #####
+        # report every value without a mapping up front
+        missing = self.unmapped(list(uniques))
+        if len(missing) > 0:
+            raise KeyError('values missing from the mapping: ' + \
+                '; '.join('no %s for %s' % (step_name, values) for step_name, values in missing.items()))
 
-def col_pivot_row_combined_index_results(df, col_name, index_ordered_list, aggregations, col_mapping=None, col_order=None, index_mapping=None, \
-    index_name=None, null_to_0=False):
+        # when the last step is an order dictionary, map to the labels and keep the order as categorical codes
+        if self.steps[-1][0] == 'order':
+            labels = list(uniques)
+            for step_name, step_mapping in self.steps[:-1]:
+                labels = [step_mapping[label] for label in labels]
+            # only labels that are in the data become categories, in the order of the order dictionary
+            used_labels = set(labels)
+            categories = [label for label in order_list_from_dict(self.steps[-1][1]) if label in used_labels]
+            label_codes = pd.Categorical(labels, categories=categories).codes
+            mapped = pd.Categorical.from_codes(label_codes.take(codes), categories=categories, ordered=True)
+            return pd.Series(mapped, index=series.index, name=series.name)
 
-    # this function will perform an analysis of the data by the col_name and index columns with groupby by col_name
-    # it will then reshape and clean the results table to a report-ready format
+        mapped_uniques = pd.Series([self[value] for value in uniques])
+        return pd.Series(mapped_uniques.array.take(codes), index=series.index, name=series.name)
+
+
+def compile_label_mapper(col_mapping=None, col_order=None):
+
+    # this function will combine your col_mapping and col_order into one LabelMapper for your col_name column
+    ## when col_order is given, mapping a column returns your labels as an ordered categorical, so sorting and grouping
+    ## follow col_order without ever sorting the labels themselves
+    ## returns None when neither is given
 
-    ## this function should be used when you have data in a column you wish to analyze by and then pivot so each
-    ## data label in that column is the heading of a column 
-    ###       ex: FY19-20, FY20-21, etc. that were in a single 'Fiscal Year' column
-    ## the data should also have values in multiple columns you wish to analyze and combine into one index
-    ###       ex: counts for 'inpatient', 'outpatient', 'emergency_care' columns to be combined into one 'Care Type' index
-     
     # ARGUMENTS
-    
-    ## MANDATORY:
-    ### df is your dataframe to be analyzed
-    ### col_name is the column to perform the groupby with and whose values will become your column headers    
-    ### index_ordered_list is the list of columns you wish to make your index after groupby, in their desired order
-    ####        if you are using index_mapping to change the column names, this list MUST match the new names!
-    ### aggregations is the dictionary containing your analyses for the groupby
-    ####        if you are using index_mapping to change the column names, this dictionary MUST match the new names!
-    
-    ## OPTIONAL:
+
+    ## OPTIONAL
     ### col_mapping is the dictionary to map your data values in col_name to you desired labels
     ### col_order is the dictionary to map your desired labels to their desired order
-    ####    if you are using col_mapping, this dcitionary MUST match the new names!
-    ### index_mapping is the dictionary to map your index col names in your data to their desired labels
-    ### index_name is the name of your index 
-    ### null_to_0 will convert all nulls to 0 if True. defaults to False          
 
-    import pandas as pd
+    label_mapper = None
 
-    # set up ordering for the pivot column
+    for step_name, step_mapping in [('label', col_mapping), ('order', col_order)]:
+        if step_mapping == None:
+            continue
+        if not isinstance(step_mapping, LabelMapper):
+            step_mapping = LabelMapper(step_mapping, step_name=step_name)
+        if label_mapper == None:
+            label_mapper = step_mapping
+        else:
+            label_mapper = label_mapper.then(step_mapping)
 
-    ## map the labels to the data values for the column
-    if col_mapping == None:
-        pass 
-    else:
-        # create a name_col with label values
-        df = df.assign(name_col=df[col_name].apply(lambda x: col_mapping[x]))
+    return label_mapper
 
-    ## map the order to the label values for the column
-    if col_order == None and col_mapping == None:
-        pass
-    elif col_mapping == None:
-        # if there is not col mapping but is col order, create a order_col based off col from raw data
-        df = df.assign(order_col=df[col_name].apply(lambda x: col_order[x]))
-    elif col_order != None:
-        # if there is a col mapping and col ordering, create order_col based off mapping
-        df = df.assign(order_col=df.name_col.apply(lambda x: col_order[x]))
-    else:
-        pass
 
-    ## drop the orginal data column and the one with names--will be remapped to the order column later
-    if col_mapping == None:
-        pass 
-    else:
-        # if there is no col order
-        if col_order == None:
-            # rename original column (code will break if you don't)
-            df.rename(columns={col_name:'temp'}, inplace=True)
-            # rename name_col to orignal column name
-            df.rename(columns={'name_col':col_name}, inplace=True)
-            # drop old column
-            df.drop(columns=['temp'], inplace=True)
-        else:
-            # if there IS an order column, then drop name_col
-            df.drop(columns=['name_col'], inplace=True)
-    
-    ## rename order column to original col name--order column should take precedence if it exists
-    if col_order == None:
-        pass 
-    else:
-        # rename original column (code will break if you don't)
-        df.rename(columns={col_name:'temp'}, inplace=True)
-        # rename order_col to orignal column name
-        df.rename(columns={'order_col':col_name}, inplace=True)
-        # drop old column
-        df.drop(columns=['temp'], inplace=True)
-
-    # rename index columns
-    if index_mapping == None:
-        pass 
-    else:
-        # rename index columns with index_mapping
-        df.rename(columns=index_mapping, inplace=True)
-
-    # groupby var needs to be cateogorical so all rows return data even if there is none, which needs to be categorical dtype
-    ## but categorical dtype cols cannot be sorted
-    ## create a copy var and set that as categorical type
-    df['copy'] = df[col_name]
-    df['copy'] = df['copy'].astype('category') 
-
-    # groupby analysis
-    df = df.groupby([col_name, 'copy']).agg(aggregations)
-
-    # reset the index
-    df.reset_index(inplace=True)
-    # get rid of duplicates by only keeping rows where the copy matches the col_name
-    df = df[df[col_name]==df['copy']]
-    # drop the copy column
-    df.drop(columns=['copy'],inplace=True)
-    # set the index back to just col_name
-    df.set_index(col_name, inplace=True)
-
-    # if you do not have col_mapping but you do have col_order
-    if col_mapping == None and col_order != None:
-        # reset index to manipulate it
-        df.reset_index(inplace=True)   
-        # sort by col_order values ascending 
-        df.sort_values(by=[col_name], inplace=True)
-        # set index back in place
-        df.set_index([col_name], inplace=True)
-        # create dictionary to return order name to original data labels
-        index_rename = {v: k for k, v in col_order.items()}
-        # rename index values with dictionary
-        df.rename(index=index_rename, level=0, inplace=True)
-    else:
-        pass
+######################## ORDERING ##################################
 
-    # reshaping data
+def order_list_from_dict(order_dict):
 
-    # code to convert from wide to long format, and then pivot so the timepoints are columns and locs are rows
+    # this function will turn an order dictionary (ex: from create_label_order_dict) back into a list of labels in their order
 
-    # the index must be reset to a normal column in order to manipulate the data
-    ## the inplace argument makes the change persist
-    df.reset_index(inplace=True)
+    # ARGUMENTS
 
-    # wide to long format--must be done before a pivot is possible
-    ## will output a dataframe that gives a row with the index column and stats per index category per col_name category
-    df = pd.melt(df, 
-                 id_vars=[col_name], 
-                 value_vars=index_ordered_list)
+    ## MANDATORY
+    ### order_dict is the dictionary to map your labels to their desired order
 
-    # pivot--will assign the col_name values to the columns and the index values to the index row
-    df = df.pivot(index='variable',columns=col_name,values='value')
-    
-    # cleaning up dataframe
+    return sorted(order_dict, key=lambda label: int(order_dict[label]))
 
-    # code to order the index values in the order they are meant to be in for visualization and reporting
 
-    # must reset index to manipulate it
-    df.reset_index(inplace=True)
-    
-    # assigning int value to each index value in ascending order
-    mapping = {index_order: i for i, index_order in enumerate(index_ordered_list)}
-    # mapping those int values onto the index variable to create a key
-    key = df['variable'].map(mapping)
-    # reordering the dataframe by the key
-    df = df.iloc[key.argsort()]
-    # setting index and renaming if necessary
-    if index_name == None:
-        # setting the index back to index var
-        df.set_index('variable', inplace=True)
-    else:
-        # rename index
-        df.rename(columns={'variable':index_name}, inplace=True)
-        # setting index back to index var
-        df.set_index(index_name, inplace=True)
+def order_codes(values, ordered_list):
 
-    if col_mapping == None:    
-        pass
-    elif col_order == None:
-        # putting labels back on columns when there is no col_order
-        df.rename(columns=col_mapping, inplace=True)
-    else:        
-        # reverse key and value pairs of col_order dict
-        col_rename = {v: k for k, v in col_order.items()}    
-
-        # putting labels back on columns
-        df.rename(columns=col_rename, inplace=True)
-
-    # replace nulls with 0
-    if null_to_0 == False:
-        pass
-    else:
-        for col_num, df_col_name in enumerate(df.columns):
-            df[df_col_name] = df[df_col_name].fillna(0) 
+    # this function will give each value its integer position in ordered_list
+    ## values that are not in ordered_list come after all of the listed values
 
-    return df
+    # ARGUMENTS
 
+    ## MANDATORY
+    ### values is the list, series or index of values to be ordered
+    ### ordered_list is the list of values in their desired order
 
-#####       TWO VAR ROW MULTIINDEX SINGLE HEADER ROW              #####
+    import pandas as pd
 
+    codes = pd.Categorical(values, categories=pd.Index(ordered_list).unique()).codes.astype('int64')
+    codes[codes == -1] = len(ordered_list)
+    return codes
 
-def col_pivot_row_combined_multiindex_results(df, col_name, index_ordered_list, index_col, aggregations, col_mapping=None, col_order=None, index_mapping=None, \
-    index2_ordered_list=None, index1_name=None, index2_name=None, reorder_row_indices=True, pct_index1cat=False, null_to_0=False):
 
-    # this function will perform an analysis of the data by the col_name and index columns with groupby by col_name and index_col
-    # it will then reshape and clean the results table to a report-ready format
+def ordered_positions(index, ordered_lists):
+
+    # this function will return the positions that put an index (or MultiIndex) in order
+    ## the first level is sorted first, then the second level within it, and so on
 
-    ## this function should be used when you have data in a column you wish to analyze by and then pivot so each
-    ## data label in that column is the heading of a column 
-    ###       ex: FY19-20, FY20-21, etc. that were in a single 'Fiscal Year' column
-    ## the data should also have values in multiple columns you wish to analyze and combine into one index
-    ###       ex: counts for 'inpatient', 'outpatient', 'emergency_care' columns to be combined into one 'Care Type' index
-    ## it should also have one categorical column to be used as index_col in the groupby (ex: a column for race or gender)
-     
     # ARGUMENTS
-    
-    ## MANDATORY:
-    ### df is your dataframe to be analyzed
-    ### col_name is the column to perform the groupby with and whose values will become your column headers    
-    ### index_ordered_list is the list of columns you wish to make your index after groupby, in their desired order
-    ####        if you are using index_mapping to change the column names, this list MUST match the new names!
-    ### aggregations is the dictionary containing your analyses for the groupby
-    ####        if you are using index_mapping to change the column names, this dictionary MUST match the new names!
-    
-    ## OPTIONAL:
-    ### col_mapping is the dictionary to map your data values in col_name to you desired labels
-    ### col_order is the dictionary to map your desired labels to their desired order
-    ####    if you are using col_mapping, this dcitionary MUST match the new names!
-    ### index_mapping is the dictionary to map your index col names in your data to their desired labels
-    ### index2_ordered_list is the list of your index 2 values in order. while not mandatatory, highly recommended
-    ### index1_name is the name of your first index (created from the index_ordered_list columns)
-    ### index2_name is the name of your second index (created from the index_col)
-    ### reorder_row_indices will reorder your results df in ascending order for both indices. defaults to True
-    ####        this will reorder accourding to index_ordered_list (always) and index2_ordered_list (when present)
-    ### pct_index1cat will convert your data into percentage form per category in index1 for each column. defaults to False
-    ### null_to_0 will convert all nulls to 0 if True. defaults to False
 
+    ## MANDATORY
+    ### index is the index to be ordered
+    ### ordered_lists is a list with one ordered list per index level
+    ####        use None for a level to keep its values together in their current order
+
+    import numpy as np
     import pandas as pd
 
-    if reorder_row_indices == True and index2_ordered_list == None:
-        index2_ordered_list = [value for value in pd.unique(df[index_col])]
+    keys = []
+    for level, ordered_list in enumerate(ordered_lists):
+        level_values = index.get_level_values(level)
+        if ordered_list == None:
+            # order of first appearance
+            keys.append(pd.factorize(level_values)[0])
+        else:
+            keys.append(order_codes(level_values, ordered_list))
 
-    # set up ordering for the pivot column
+    # lexsort sorts by its last key first and is stable
+    return np.lexsort(keys[::-1])
 
-    ## map the labels to the data values for the column
-    if col_mapping == None:
-        pass 
-    else:
-        # create a name_col with label values
-        df = df.assign(name_col=df[col_name].apply(lambda x: col_mapping[x]))
 
-    ## map the order to the label values for the column
-    if col_order == None and col_mapping == None:
-        pass
-    elif col_mapping == None:
-        # if there is not col mapping but is col order, create a order_col based off col from raw data
-        df = df.assign(order_col=df[col_name].apply(lambda x: col_order[x]))
-    elif col_order != None:
-        # if there is a col mapping and col ordering, create order_col based off mapping
-        df = df.assign(order_col=df.name_col.apply(lambda x: col_order[x]))
-    else:
-        pass
+def reorder_rows(df, ordered_lists):
 
-    ## drop the orginal data column and the one with names--will be remapped to the order column later
-    if col_mapping == None:
-        pass 
-    else:
-        # if there is no col order
-        if col_order == None:
-            # rename original column (code will break if you don't)
-            df.rename(columns={col_name:'temp'}, inplace=True)
-            # rename name_col to orignal column name
-            df.rename(columns={'name_col':col_name}, inplace=True)
-            # drop old column
-            df.drop(columns=['temp'], inplace=True)
-        else:
-            # if there IS an order column, then drop name_col
-            df.drop(columns=['name_col'], inplace=True)
-    
-    ## rename order column to original col name--order column should take precedence if it exists
-    if col_order == None:
-        pass 
-    else:
-        # rename original column (code will break if you don't)
-        df.rename(columns={col_name:'temp'}, inplace=True)
-        # rename order_col to orignal column name
-        df.rename(columns={'order_col':col_name}, inplace=True)
-        # drop old column
-        df.drop(columns=['temp'], inplace=True)
-
-    # rename index columns
-    if index_mapping == None:
-        pass 
-    else:
-        # rename index columns with index_mapping
-        df.rename(columns=index_mapping, inplace=True)
-
-    # groupby var needs to be cateogorical so all rows return data even if there is none, which needs to be categorical dtype
-    ## but categorical dtype cols cannot be sorted
-    ## create a copy var and set that as categorical type
-    df['copy'] = df[col_name]
-    df['copy'] = df['copy'].astype('category') 
-
-    df = df.groupby([col_name, 'copy', index_col]).agg(aggregations)
-
-    # reset the index
-    df.reset_index(inplace=True)
-    # get rid of duplicates by only keeping rows where the copy matches the col_name
-    df = df[df[col_name]==df['copy']]
-    # drop the copy column
-    df.drop(columns=['copy'],inplace=True)
-    # set the index back to just col_name
-    df.set_index([col_name, index_col], inplace=True)    
-
-    # if you do not have col_mapping but you do have col_order
-    if col_mapping == None and col_order != None:
-        # reset index to manipulate it
-        df.reset_index(inplace=True)   
-        # sort by col_order values ascending 
-        df.sort_values(by=[col_name], inplace=True)
-        # set index back in place
-        df.set_index([col_name], inplace=True)
-        # create dictionary to return order name to original data labels
-        index_rename = {v: k for k, v in col_order.items()}
-        # rename index values with dictionary
-        df.rename(index=index_rename, level=0, inplace=True)
-    else:
-        pass
+    # this function will reorder the rows of df in one step using integer codes for each index level
 
-    if pct_index1cat == False:
-        pass 
-    else:
-        df = df.groupby(level=0).apply(lambda x: x / x.sum())
+    # ARGUMENTS
 
-    # reshaping data
+    ## MANDATORY
+    ### df is your results dataframe
+    ### ordered_lists is a list with one ordered list (or None) per row index level
 
-    # code to convert from wide to long format, and then pivot so col_name values are columns and our two indices are rows
+    import numpy as np
 
-    # same as before, index must be reset to regular columns to manipulate
-    df.reset_index(inplace=True)
+    positions = ordered_positions(df.index, ordered_lists)
 
-    # wide to long
-    df = pd.melt(df, 
-            # in this, both col_name and index_cols are the categorical variables, but the values still come solely from index_ordered_list vars
-            id_vars=[col_name, index_col], 
-            value_vars=index_ordered_list)
- 
-    # pivot. this time, both our new categorical var from index_ordered_list and index_col are set as index, creating a multiindex
-    df = df.pivot(index=['variable',index_col],columns=col_name,values='value')
+    # skip the copy when the rows are already in order
+    if np.array_equal(positions, np.arange(len(positions))):
+        return df
 
-    # cleaning up dataframe
+    return df.iloc[positions]
 
-    # reordering row indices
-    if reorder_row_indices == False:
-        pass 
-    else:
-        # must reset index to manipulate it
-        df.reset_index(inplace=True)
-        
-        # assigning int value to each index value in ascending order
-        mapping1 = {index_order: i for i, index_order in enumerate(index_ordered_list)}
-        mapping2 = {index_order: i for i, index_order in enumerate(index2_ordered_list)}
-        
-        # mapping those int values onto the index variable to create a key
-        key1 = df['variable'].map(mapping1)
-        key2 = df[index_col].map(mapping2)
-        
-        # reordering the dataframe by the key
-        ## creating int columns based off key values (iloc method will not work for multiindex reordering more than one of the indices)
-        df['key1'] = key1
-        df['key2'] = key2
-
-        # sorting by the new columns and then dropping them
-        df.sort_values(by=['key1','key2'], inplace=True)
-        df.drop(['key1','key2'], axis=1, inplace=True)
-        # setting the index back
-        df.set_index(['variable',index_col], inplace=True)
 
-    # renaming indices
-    if index1_name == None:
-        pass 
-    else:
-        df.index.set_names(index1_name, level=0, inplace=True)
+def reorder_columns(df, ordered_lists):
 
-    if index2_name == None:
-        pass 
-    else:
-        df.index.set_names(index2_name, level=1, inplace=True)
+    # this function will reorder the columns of df in one step using integer codes for each column header level
 
-    # returning column lables
-    if col_mapping == None:    
-        pass
-    elif col_order == None:
-        # putting labels back on columns when there is no col_order
-        df.rename(columns=col_mapping, inplace=True)
-    else:        
-        # reverse key and value pairs of col_order dict
-        col_rename = {v: k for k, v in col_order.items()}    
-
-        # putting labels back on columns
-        df.rename(columns=col_rename, inplace=True) 
-
-    # replace nulls with 0
-    if null_to_0 == False:
-        pass
-    else:
-        for col_num, df_col_name in enumerate(df.columns):
-            df[df_col_name] = df[df_col_name].fillna(0) 
+    # ARGUMENTS
 
-      
-    return df
+    ## MANDATORY
+    ### df is your results dataframe
+    ### ordered_lists is a list with one ordered list (or None) per column header level
 
+    import numpy as np
 
-#####       SINGLE ROW INDEX DOUBLE HEADER ROW              #####
+    positions = ordered_positions(df.columns, ordered_lists)
 
-def col_pivot_row_index_dbl_header_results(df, col_name, index_col, stats_names, aggregations, col_mapping=None, col_order=None, \
-    index_mapping=None, index_order=None, index_name=None, null_to_0=None):
+    # skip the copy when the columns are already in order
+    if np.array_equal(positions, np.arange(len(positions))):
+        return df
 
-    # this function will perform an analysis of the data by the col_name and index_col with specificed aggregations 
-    # and groupby by col_name and index_col
-    ## it will then reshape and clean the results table to a report-ready format
+    return df.iloc[:, positions]
+
+
+def plain_labels(index):
+
+    # this function will turn any categorical levels of an index (or MultiIndex) back into plain labels
+    ## used at the end of each table function so the report has the same kind of headers whether or not col_order was used
 
-    ## this function should be used when you have data in a column you wish to analyze by and then pivot so each
-    ## data label in that column is the heading of a column 
-    ###       ex: FY19-20, FY20-21, etc. that were in a single 'Fiscal Year' column
-    ## the data should also have values in an index column
-    ###       ex: months in a month column for 'Jan', 'Feb', 'Mar' etc
-     
     # ARGUMENTS
-    
-    ## MANDATORY:
-    ### df is your dataframe to be analyzed
-    ### col_name is the column to perform the groupby with and whose values will become your column headers    
-    ### index_col is the column that will be your row index
-    ### stats_names is your list of what each analysis should be called in your able, in desired order
-    ####        MUST be in the same order as your aggregations!
-    ### aggregations is the dictionary containing your analyses for the groupby, in desired order
-    ####        MUST be in the same order as stats_names!
-    
-    ## OPTIONAL:
-    ### col_mapping is the dictionary to map your data values in col_name to you desired labels
-    ### col_order is the dictionary to map your desired labels to their desired order
-    ####    if you are using col_mapping, this dcitionary MUST match the new names!
-    ### index_mapping is the dictionary to map your index col names in your data to their desired labels
-    ### index_order is the list of index values in the order you want them to be in
-    ####    if you are changing your index values with index_mapping, they MUST match the new values!
-    ### index_name is the name of your index
-    # ### null_to_0 is your list of columns (matching stats_names) to convert nulls to 0s. defaults to None           
+
+    ## MANDATORY
+    ### index is the row index or column headers of your results dataframe
 
     import pandas as pd
 
-    # set up ordering for the pivot column
+    if isinstance(index, pd.MultiIndex):
+        levels = [plain_labels(level) for level in index.levels]
+        return index.set_levels(levels)
 
-    ## map the labels to the data values for the column
-    if col_mapping == None:
-        pass 
+    if isinstance(index, pd.CategoricalIndex):
+        return pd.Index(index.astype(index.categories.dtype), name=index.name)
+
+    return index
+
+
+######################## PROFILING ##################################
+
+# the functions called with a record of every stage the table functions run, while any are registered
+## when none are registered the table functions skip all of the timing, so profiling costs nothing when it is off
+PROFILE_CALLBACKS = []
+
+
+def add_profile_callback(callback):
+
+    # this function will register a function to be called with a record of every stage the table functions run
+    ## each record is a dictionary with:
+    ###   'function' - the function the stage ran in (ex: 'simple_groupby' or 'format_simple_groupby')
+    ###   'stage' - the stage name (ex: 'project_columns', 'label_mapping', 'groupby', 'reshape', 'null_to_0')
+    ###   'seconds' - the wall time of the stage
+    ###   'peak_bytes' - the most memory allocated during the stage, above what was allocated when it started
+    ####        only measured while tracemalloc is running (see profile_stages), otherwise None
+    ###   'rows_in' and 'rows_out' - the number of rows going into and coming out of the stage
+    ####        for the groupby stage rows_out is the number of groups
+    ## ex: add_profile_callback(lambda record: metrics.timing(record['function'] + '.' + record['stage'], record['seconds']))
+
+    PROFILE_CALLBACKS.append(callback)
+
+
+def remove_profile_callback(callback):
+
+    # this function will unregister a function registered with add_profile_callback
+
+    PROFILE_CALLBACKS.remove(callback)
+
+
+class StageTimer:
+
+    # this class will time the stages of one table function call and hand a record of each to PROFILE_CALLBACKS
+    ## call lap(stage_name, df) at the end of each stage: the stage runs from the previous lap (or the start)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### function_name is the name of the function the stages run in
+    ### df is the dataframe going into the first stage
+
+    def __init__(self, function_name, df):
+
+        import time
+        import tracemalloc
+
+        self.function_name = function_name
+        self.rows = len(df)
+        self.tracing = tracemalloc.is_tracing()
+        if self.tracing == True:
+            tracemalloc.reset_peak()
+            self.allocated = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+
+    def lap(self, stage_name, df):
+
+        import time
+        import tracemalloc
+
+        end = time.perf_counter()
+
+        peak_bytes = None
+        if self.tracing == True:
+            allocated, peak = tracemalloc.get_traced_memory()
+            peak_bytes = peak - self.allocated
+
+        record = {
+            'function': self.function_name,
+            'stage': stage_name,
+            'seconds': end - self.start,
+            'peak_bytes': peak_bytes,
+            'rows_in': self.rows,
+            'rows_out': len(df),
+        }
+        for callback in list(PROFILE_CALLBACKS):
+            callback(record)
+
+        # the next stage starts now, leaving out the time spent in the callbacks
+        self.rows = len(df)
+        if self.tracing == True:
+            tracemalloc.reset_peak()
+            self.allocated = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+
+
+class NoStageTimer:
+
+    # this class will stand in for StageTimer while profiling is off, doing nothing at each lap
+
+    def lap(self, stage_name, df):
+        pass
+
+
+NO_STAGE_TIMER = NoStageTimer()
+
+
+def stage_timer(function_name, df):
+
+    # this function will return a StageTimer for a table function call, or NO_STAGE_TIMER while profiling is off
+
+    if len(PROFILE_CALLBACKS) == 0:
+        return NO_STAGE_TIMER
+
+    return StageTimer(function_name, df)
+
+
+def profile_stages(callback=None, memory=False):
+
+    # this function will profile every table function call made inside a with block
+    ## ex: with profile_stages(memory=True) as records:
+    ##         report = col_pivot_row_multiindex_dbl_header_results(df, ...)
+    ##     pd.DataFrame(records).groupby('stage')['seconds'].sum()
+
+    # ARGUMENTS
+
+    ## OPTIONAL
+    ### callback is a function to call with each record as well (see add_profile_callback). defaults to None
+    ### memory will run tracemalloc in the with block to measure peak_bytes. defaults to False
+    ####        tracemalloc slows python down, so the seconds are longer than without it
+
+    # returns a context manager giving the list the records are collected into
+
+    import contextlib
+    import tracemalloc
+
+    @contextlib.contextmanager
+    def profiling():
+        records = []
+
+        def collect(record):
+            records.append(record)
+            if callback != None:
+                callback(record)
+
+        started_tracing = memory == True and tracemalloc.is_tracing() == False
+        if started_tracing == True:
+            tracemalloc.start()
+
+        add_profile_callback(collect)
+        try:
+            yield records
+        finally:
+            remove_profile_callback(collect)
+            if started_tracing == True:
+                tracemalloc.stop()
+
+    return profiling()
+
+
+######################## INPUT HANDLING ##################################
+
+def project_columns(df, columns, column_mapping=None):
+
+    # this function will create a lightweight frame holding only the columns a table function needs
+    ## the columns are referenced rather than copied, and adding or replacing columns on the new frame
+    ## will never change your original df
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### columns is the list of column names the table needs (col_name, index columns and aggregations keys)
+
+    ## OPTIONAL
+    ### column_mapping is the dictionary to rename your data columns (ex: index_mapping)
+    ####        a column is kept if its new name is in columns
+
+    import pandas as pd
+
+    if column_mapping == None:
+        column_mapping = {}
+
+    # pick out the needed columns under their new names
+    projected = {}
+    for df_col_name in df.columns:
+        new_name = column_mapping.get(df_col_name, df_col_name)
+        if new_name in columns and new_name not in projected:
+            projected[new_name] = df[df_col_name]
+
+    # copy=False builds the frame around the existing column data
+    return pd.DataFrame(projected, copy=False)
+
+
+######################## AGGREGATION PLANNING ##################################
+
+# the built-in pandas aggregations a one argument lambda can call as a method of its group (ex: lambda x: x.count())
+LAMBDA_METHODS = ['count', 'sum', 'mean', 'median', 'min', 'max', 'prod', 'std', 'var', 'sem', 'nunique']
+
+# the bytecode instructions that do nothing when reading a lambda's body (they differ between python versions)
+IGNORED_INSTRUCTIONS = ['RESUME', 'CACHE', 'PRECALL', 'PUSH_NULL', 'KW_NAMES', 'NOP', 'NOT_TAKEN']
+
+
+def fast_path_callables():
+
+    # this function will return the dictionary of callables that give the same results as a built-in aggregation, to its name
+    ## numpy's std and var are left out (they default to ddof=0, the built-ins to ddof=1), and so are np.median and python's sum,
+    ## min and max, which do not skip missing values (np.nanmedian does)
+
+    import numpy as np
+    import pandas as pd
+
+    names = {
+        'sum': ['sum', 'nansum'],
+        'mean': ['mean', 'nanmean'],
+        'median': ['nanmedian'],
+        'min': ['min', 'amin', 'nanmin'],
+        'max': ['max', 'amax', 'nanmax'],
+        'prod': ['prod', 'nanprod'],
+        'size': ['size'],
+    }
+    callables = {len: 'size'}
+    for agg_name, numpy_names in names.items():
+        for numpy_name in numpy_names:
+            if hasattr(np, numpy_name):
+                callables[getattr(np, numpy_name)] = agg_name
+    for agg_name in LAMBDA_METHODS:
+        callables[getattr(pd.Series, agg_name)] = agg_name
+    return callables
+
+
+def lambda_aggregation(agg_func):
+
+    # this function will return the built-in aggregation a one argument function's body is a plain call of, or None
+    ## (ex: 'count' for lambda x: x.count(), 'sum' for lambda x: np.sum(x) and 'size' for lambda x: len(x) or lambda x: x.size)
+    ## the body is read from its bytecode, so nothing is called
+
+    import builtins
+    import dis
+
+    code = agg_func.__code__
+    if code.co_argcount != 1 or code.co_kwonlyargcount != 0 or code.co_flags & 0x0C or len(code.co_freevars) > 0:
+        return None
+    arg_name = code.co_varnames[0]
+
+    # run the body on a stack of what each instruction loads: the argument, a global value, or a method of the argument
+    stack = []
+    for instruction in dis.get_instructions(agg_func):
+        opname = instruction.opname
+        if opname in IGNORED_INSTRUCTIONS:
+            continue
+        if opname.startswith('LOAD_FAST') and instruction.argval == arg_name:
+            stack.append(('arg', None))
+        elif opname == 'LOAD_GLOBAL':
+            if instruction.argval in agg_func.__globals__:
+                stack.append(('value', agg_func.__globals__[instruction.argval]))
+            elif hasattr(builtins, instruction.argval):
+                stack.append(('value', getattr(builtins, instruction.argval)))
+            else:
+                return None
+        elif opname in ['LOAD_ATTR', 'LOAD_METHOD'] and len(stack) > 0:
+            kind, value = stack.pop()
+            if kind == 'arg':
+                stack.append(('attribute', instruction.argval))
+            elif kind == 'value' and hasattr(value, instruction.argval):
+                stack.append(('value', getattr(value, instruction.argval)))
+            else:
+                return None
+        elif opname in ['CALL', 'CALL_METHOD', 'CALL_FUNCTION']:
+            if instruction.arg == 0 and len(stack) > 0 and stack[-1][0] == 'attribute' and stack[-1][1] in LAMBDA_METHODS:
+                stack[-1] = ('result', stack[-1][1])
+            elif instruction.arg == 1 and len(stack) > 1 and stack[-1][0] == 'arg' and stack[-2][0] == 'value':
+                stack.pop()
+                called = stack.pop()[1]
+                try:
+                    agg_name = fast_path_callables().get(called)
+                except TypeError:
+                    # unhashable
+                    agg_name = None
+                if agg_name == None:
+                    return None
+                stack.append(('result', agg_name))
+            else:
+                return None
+        elif opname == 'RETURN_VALUE' and len(stack) == 1:
+            kind, value = stack[0]
+            if kind == 'result':
+                return value
+            if kind == 'attribute' and value == 'size':
+                return 'size'
+            return None
+        else:
+            return None
+    return None
+
+
+def fast_path_aggregation(agg_func):
+
+    # this function will return the built-in aggregation name that gives the same results as agg_func, or None
+    ## built-in names are run by pandas' cythonized groupby on every group at once, where any other callable is called on each
+    ## group in python (ex: np.sum, pd.Series.nunique and lambda x: x.count() become 'sum', 'nunique' and 'count')
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### agg_func is one aggregation from your aggregations dictionary
+
+    import types
+
+    if isinstance(agg_func, str):
+        return agg_func
+    try:
+        agg_name = fast_path_callables().get(agg_func)
+    except TypeError:
+        # unhashable callables are never one of the fast path callables
+        agg_name = None
+    if agg_name == None and isinstance(agg_func, types.FunctionType):
+        agg_name = lambda_aggregation(agg_func)
+    return agg_name
+
+
+def slow_path_reason(agg_func):
+
+    # this function will return why an aggregation without a fast path has to be called on each group
+
+    import builtins
+    import types
+
+    import numpy as np
+
+    if agg_func in [builtins.sum, builtins.min, builtins.max]:
+        return "python's " + agg_func.__name__ + ' does not skip missing values like the built-in ' + repr(agg_func.__name__)
+    if agg_func is np.median:
+        return "np.median does not skip missing values like the built-in 'median' (np.nanmedian does)"
+    if agg_func in [np.std, np.var]:
+        return 'np.' + agg_func.__name__ + " defaults to ddof=0, the built-in " + repr(agg_func.__name__) + ' to ddof=1'
+    if isinstance(agg_func, types.FunctionType):
+        return 'its body is not a plain call of a built-in aggregation (ex: lambda x: x.count() or lambda x: np.sum(x))'
+    return 'it has no built-in aggregation that gives the same results'
+
+
+def plan_aggregations(aggregations, log=True):
+
+    # this function will rewrite the callables in aggregations that have a built-in equivalent into the built-in names
+    ## (see fast_path_aggregation), so they run on every group at once, and log the ones left on the slow path with why
+    ## approximate distinct counts are already run on every group at once (see sketched_aggregate), and exact ones become 'nunique'
+    ## the grouped results are given back the column labels of the original aggregations (see planned_labels)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    ## OPTIONAL
+    ### log will log each aggregation left on the slow path to the analysis_functions logger. defaults to True
+
+    import logging
+
+    logger = logging.getLogger(__name__)
+
+    def planned(agg_col, agg_func):
+        if isinstance(agg_func, ApproxNunique):
+            if agg_func.precision == None:
+                return 'nunique'
+            return agg_func
+        agg_name = fast_path_aggregation(agg_func)
+        if agg_name != None:
+            return agg_name
+        if log == True:
+            logger.info('aggregation %r on column %r is called on each group in python: %s', agg_func, agg_col, \
+                slow_path_reason(agg_func))
+        return agg_func
+
+    planned_aggregations = {}
+    for agg_col, agg_funcs in aggregations.items():
+        if isinstance(agg_funcs, (list, tuple)):
+            planned_aggregations[agg_col] = [planned(agg_col, agg_func) for agg_func in agg_funcs]
+        else:
+            planned_aggregations[agg_col] = planned(agg_col, agg_funcs)
+    return planned_aggregations
+
+
+def aggregation_labels(template, aggregations):
+
+    # this function will return the column labels pandas gives the grouped results of aggregations
+    ## (ex: 'sum' for np.sum and '<lambda_0>' for the first of many lambdas), read off a groupby with no groups so no
+    ## aggregation is called
+
+    import numpy as np
+
+    empty = template[list(aggregations)].iloc[:0]
+    return empty.groupby(np.zeros(0, dtype=np.int64)).agg(aggregations).columns
+
+
+def planned_labels(result, template, aggregations, planned_aggregations):
+
+    # this function will give grouped results from planned aggregations the column labels of the original aggregations
+
+    if aggregation_list(planned_aggregations) == aggregation_list(aggregations):
+        return result
+    return result.set_axis(aggregation_labels(template, aggregations), axis=1)
+
+
+######################## GROUPING CORE ##################################
+
+def category_values(series):
+
+    # this function will return the full set of categories for a grouping column, in groupby order
+    ## categorical columns keep all of their categories (even unused ones), other columns use their sorted unique values
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### series is the grouping column from your dataframe
+
+    import pandas as pd
+
+    # categorical columns keep their dtype, so an order put on them (ex: by col_order) is kept by the full index too
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return pd.CategoricalIndex(series.cat.categories, dtype=series.dtype)
+
+    values = pd.Index(pd.unique(series.dropna()))
+    try:
+        return values.sort_values()
+    except TypeError:
+        # mixed types cannot be sorted, so keep order of appearance
+        return values
+
+
+def empty_group_values(template, aggregations):
+
+    # this function will return a one row frame with the value each aggregation gives for an empty group
+    ## (ex: 0 for counts and sums, NaN for means), with the same columns and dtypes as the grouped results
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### template is a frame (can have zero rows) with the columns being aggregated and their dtypes
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    import pandas as pd
+
+    # aggregate an empty frame through a one category grouper, with the built-in aggregations where there are some
+    ## (ex: np.min cannot be called on an empty group)
+    empty_key = pd.Categorical([], categories=[0])
+    planned = plan_aggregations(aggregations, log=False)
+    empty = template[list(aggregations)].iloc[:0].groupby(empty_key, observed=False).agg(planned)
+    return planned_labels(empty, template, aggregations, planned)
+
+
+def fill_empty_groups(result, levels, template, aggregations):
+
+    # this function will reindex observed-only grouped results against every combination of categories
+    ## so every category still returns a row even if there is no data for it
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### result is your grouped results, indexed by the grouping columns
+    ### levels is the list of the full set of categories for each grouping column (ex: from category_values)
+    ### template is a frame (can have zero rows) with the columns being aggregated and their dtypes
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    import pandas as pd
+
+    # every combination of categories that should be in the table
+    group_cols = list(result.index.names)
+    if len(group_cols) == 1:
+        full_index = pd.Index(levels[0], name=group_cols[0])
+    else:
+        full_index = pd.MultiIndex.from_product(levels, names=group_cols)
+
+    # nothing to fill in when every combination was observed
+    if result.index.equals(full_index):
+        return result
+
+    missing = full_index.difference(result.index, sort=False)
+    if len(missing) > 0:
+        # one empty row per missing combination, keeping the dtypes of the empty results
+        empty = empty_group_values(template, aggregations)
+        filler = empty.iloc[[0] * len(missing)].set_axis(missing)
+        result = pd.concat([result, filler])
+
+    # put the rows in groupby order
+    return result.reindex(full_index)
+
+
+# the aggregations the dense kernel runs (see dense_aggregate), sums and means only on integer columns
+DENSE_AGGREGATIONS = ['count', 'size', 'sum', 'mean']
+
+# the most combinations of categories the dense kernel lays out, one slot each per aggregation
+DENSE_GROUP_LIMIT = 2 ** 20
+
+
+def dense_aggregate(df, group_cols, aggregations):
+
+    # this function will run counts and sizes, and sums and means of integers, straight into every combination of categories,
+    ## without a hash groupby
+    ## each grouping column is factorized to dense codes in category order, the codes are combined into one flat group number
+    ## (the row of that combination in the full table), and every aggregation is one np.bincount over the group numbers, so the
+    ## results come out already in groupby order with every combination filled in (see fill_empty_groups)
+    ## every result is exactly the one pandas gives: float sums and means are left to pandas, since its compensated sums cannot
+    ## be reproduced by np.bincount, and integer sums are only run while they are exact as floats
+    ## returns None when the groupby has to run the usual way instead: other aggregations, sums or means of anything but
+    ## integers, more than DENSE_GROUP_LIMIT combinations or grouping columns that cannot be sorted
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### group_cols is the list of columns to group by, starting with col_name
+    ### aggregations is the dictionary containing your analyses for the groupby, with built-in names (see plan_aggregations)
+
+    import numpy as np
+    import pandas as pd
+
+    pairs = aggregation_list(aggregations)
+    if len(pairs) == 0 or any(not isinstance(agg_func, str) or agg_func not in DENSE_AGGREGATIONS for agg_col, agg_func in pairs):
+        return None
+    for agg_col, agg_func in pairs:
+        dtype = df[agg_col].dtype
+        if agg_func in ['sum', 'mean'] and not (isinstance(dtype, np.dtype) and dtype.kind in 'iu'):
+            return None
+
+    # dense codes for every grouping column, in the order of category_values
+    codes = []
+    levels = []
+    for group_col in group_cols:
+        series = df[group_col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes.append(series.cat.codes.to_numpy())
+            levels.append(series.cat.categories)
+        else:
+            try:
+                col_codes, uniques = pd.factorize(series, sort=True)
+            except TypeError:
+                # mixed types cannot be sorted
+                return None
+            codes.append(col_codes)
+            levels.append(pd.Index(uniques))
+    n_groups = int(np.prod([len(level) for level in levels]))
+    if n_groups > DENSE_GROUP_LIMIT:
+        return None
+
+    # the flat group number of every row, in from_product order, leaving out rows with a missing key like pandas
+    groups = np.zeros(len(df), dtype=np.int64)
+    keep = np.ones(len(df), dtype=bool)
+    for col_codes, level in zip(codes, levels):
+        groups = groups * len(level) + col_codes
+        keep &= col_codes >= 0
+    if not keep.all():
+        groups = groups[keep]
+
+    sizes = np.bincount(groups, minlength=n_groups)
+    columns = []
+    for agg_col, agg_func in pairs:
+        if agg_func == 'size':
+            columns.append(sizes)
+            continue
+        values = df[agg_col].to_numpy()
+        if not keep.all():
+            values = values[keep]
+        valid = pd.notna(values)
+        counts = np.bincount(groups[valid], minlength=n_groups) if not valid.all() else sizes
+        if agg_func == 'count':
+            columns.append(counts)
+            continue
+
+        # float sums of integers are exact up to 2 ** 53
+        if len(values) > 0 and np.abs(values.astype(np.float64)).max() * len(values) > 2 ** 53:
+            return None
+        sums = np.bincount(groups, weights=values, minlength=n_groups)
+        if agg_func == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                columns.append(sums / counts)
+        elif values.dtype.kind == 'i':
+            columns.append(sums.astype(np.int64))
+        elif values.dtype.kind == 'u':
+            columns.append(sums.astype(np.uint64))
+
+    # the index fill_empty_groups gives: every combination, with categorical columns keeping their dtype (see category_values)
+    levels = [pd.CategoricalIndex(level, dtype=df[group_col].dtype) if isinstance(df[group_col].dtype, pd.CategoricalDtype) \
+        else level for group_col, level in zip(group_cols, levels)]
+    if len(group_cols) == 1:
+        index = pd.Index(levels[0], name=group_cols[0])
+    else:
+        index = pd.MultiIndex.from_product(levels, names=group_cols)
+
+    # the same column labels and dtypes as the pandas groupby
+    result = pd.DataFrame(dict(enumerate(columns)), index=index)
+    result = result.set_axis(aggregation_labels(df, aggregations), axis=1)
+    return pandas_result_dtypes(result, df, group_cols, aggregations)
+
+
+# the grouping backends the table functions can run their groupby on (see observed_aggregate)
+BACKENDS = ['pandas', 'arrow']
+
+# the aggregations the arrow backend runs, as pyarrow hash aggregation names
+ARROW_AGGREGATIONS = {
+    'count': 'count',
+    'size': 'count',
+    'sum': 'sum',
+    'min': 'min',
+    'max': 'max',
+    'mean': 'mean',
+    'nunique': 'count_distinct',
+}
+
+
+def arrow_aggregate(df, group_cols, aggregations):
+
+    # this function will run the observed-only groupby on pyarrow's multi-threaded hash aggregation
+    ## and hand back the same grouped frame as pandas (same index levels and dtypes, columns, dtypes and row order)
+    ## grouping columns are grouped by integer codes (categorical codes, or arrow dictionary codes for any other column,
+    ## which hash much faster than strings) and turned back into their values afterwards
+    ## sums and means can differ from pandas in the last floating point digits, since the values are added up differently
+    ## returns None when the groupby has to run on pandas instead: aggregations arrow does not have (ex: 'median' or a
+    ## lambda), no rows, or columns arrow cannot hold (ex: mixed python objects)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### group_cols is the list of columns to group by, starting with col_name
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    import numpy as np
+    import pandas as pd
+
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        raise ImportError("backend='arrow' needs the pyarrow package (pip install pyarrow)")
+
+    pairs = aggregation_list(aggregations)
+    agg_names = [aggregation_name(agg_func) for agg_col, agg_func in pairs]
+    if None in agg_names or len(df) == 0:
+        return None
+
+    # columns named key_i and value_i, since an aggregated column can also be a grouping column
+    columns = {}
+    dictionaries = {}
+    try:
+        for position, group_col in enumerate(group_cols):
+            if isinstance(df[group_col].dtype, pd.CategoricalDtype):
+                # missing values have a code of -1
+                codes = df[group_col].cat.codes.to_numpy()
+                columns['key_' + str(position)] = pa.array(codes, mask=codes == -1)
+            else:
+                values = pa.array(df[group_col], from_pandas=True)
+                if isinstance(values, pa.ChunkedArray):
+                    values = values.combine_chunks()
+                encoded = pc.dictionary_encode(values)
+                columns['key_' + str(position)] = encoded.indices
+                dictionaries[position] = encoded.dictionary
+        agg_cols = list(aggregations)
+        for position, agg_col in enumerate(agg_cols):
+            values = df[agg_col]
+            # arrow adds small integers up in their own width, pandas adds them up as int64
+            if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'iu' and values.dtype.itemsize < 8:
+                values = values.astype('int64' if values.dtype.kind == 'i' else 'uint64')
+            columns['value_' + str(position)] = pa.array(values, from_pandas=True)
+        table = pa.table(columns)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return None
+
+    # pandas leaves out groups with a missing key
+    keep = None
+    for position in range(len(group_cols)):
+        valid = pc.is_valid(table['key_' + str(position)])
+        keep = valid if keep is None else pc.and_(keep, valid)
+    table = table.filter(keep)
+
+    # counts and distinct counts skip missing values like pandas, size counts every row, sums of nothing are 0
+    arrow_aggs = []
+    for (agg_col, agg_func), agg_name in zip(pairs, agg_names):
+        value_name = 'value_' + str(agg_cols.index(agg_col))
+        if agg_name == 'size':
+            options = pc.CountOptions(mode='all')
+        elif agg_name in ['count', 'nunique']:
+            options = pc.CountOptions(mode='only_valid')
+        elif agg_name == 'sum':
+            options = pc.ScalarAggregateOptions(min_count=0)
+        else:
+            options = None
+        arrow_aggs.append((value_name, ARROW_AGGREGATIONS[agg_name], options))
+
+    grouped = table.group_by(['key_' + str(position) for position in range(len(group_cols))]).aggregate(arrow_aggs)
+
+    # the group keys back as pandas index levels with their original dtypes
+    keys = []
+    for position, group_col in enumerate(group_cols):
+        key = grouped['key_' + str(position)]
+        if isinstance(df[group_col].dtype, pd.CategoricalDtype):
+            keys.append(pd.Categorical.from_codes(key.to_numpy(), dtype=df[group_col].dtype))
+        else:
+            key_values = dictionaries[position].take(key.combine_chunks()).to_pandas()
+            keys.append(pd.array(key_values, dtype=df[group_col].dtype))
+    if len(group_cols) == 1:
+        index = pd.Index(keys[0], name=group_cols[0])
+    else:
+        index = pd.MultiIndex.from_arrays(keys, names=group_cols)
+
+    # the aggregated columns, in the same order as the pandas columns
+    ## (the output holds one column per aggregation, in order, plus the key columns)
+    key_names = ['key_' + str(position) for position in range(len(group_cols))]
+    agg_positions = [position for position, name in enumerate(grouped.column_names) if name not in key_names]
+    result = pd.DataFrame({position: grouped.column(agg_position).to_pandas() for position, agg_position in enumerate(agg_positions)})
+    result.index = index
+
+    # the same column labels and dtypes as the pandas groupby
+    result.columns = df.iloc[:0].groupby(group_cols, observed=True).agg(aggregations).columns
+    result = pandas_result_dtypes(result, df, group_cols, aggregations)
+
+    # groupby order
+    return result.sort_index()
+
+
+# the aggregations that give the same results on a downcast integer column as on the original column
+## (ex: sums of int8 values are added up as int64), so their measure columns can be downcast (see compact_columns)
+COMPACT_AGGREGATIONS = ['count', 'size', 'sum', 'mean', 'min', 'max', 'nunique', 'median', 'std', 'var', 'first', 'last']
+
+
+def compact_columns(df, group_cols, aggregations):
+
+    # this function will convert the grouping and measure columns of df to smaller dtypes before the groupby
+    ## grouping columns that are not categorical become categoricals, which group on small integer codes
+    ## (int8 for up to 127 values, int16 up to 32,767, ...) instead of hashing python strings
+    ## integer measure columns are downcast to the smallest integer dtype that holds all of their values, when every
+    ## aggregation on them is in COMPACT_AGGREGATIONS (a lambda could overflow the smaller dtype, so those are left alone)
+    ## float columns are left alone, since float32 sums and means would round differently
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed (only the columns being grouped and aggregated are converted)
+    ### group_cols is the list of columns to group by
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    # returns the converted frame and the dictionary of converted column name to its original dtype (see restore_dtypes)
+
+    import numpy as np
+    import pandas as pd
+
+    compacted = {}
+    conversions = {}
+
+    for group_col in group_cols:
+        series = df[group_col]
+        if group_col in aggregations or isinstance(series.dtype, pd.CategoricalDtype):
+            continue
+        # codes and categories in groupby order in one pass, skipping columns of mixed values that cannot be sorted
+        try:
+            codes, categories = pd.factorize(series, sort=True)
+        except TypeError:
+            continue
+        compacted[group_col] = pd.Categorical.from_codes(codes, categories=categories)
+        conversions[group_col] = series.dtype
+
+    for agg_col, agg_funcs in aggregations.items():
+        series = df[agg_col]
+        if agg_col in group_cols or not isinstance(series.dtype, np.dtype) or series.dtype.kind != 'i':
+            continue
+        if not isinstance(agg_funcs, (list, tuple)):
+            agg_funcs = [agg_funcs]
+        if not all(agg_func is pd.Series.nunique or (isinstance(agg_func, str) and agg_func in COMPACT_AGGREGATIONS) \
+            for agg_func in agg_funcs):
+            continue
+        downcast = pd.to_numeric(series, downcast='integer')
+        if downcast.dtype != series.dtype:
+            compacted[agg_col] = downcast
+            conversions[agg_col] = series.dtype
+
+    df = pd.DataFrame({df_col_name: compacted.get(df_col_name, df[df_col_name]) for df_col_name in df.columns}, copy=False)
+    return df, conversions
+
+
+def restore_dtypes(result, df, group_cols, aggregations, conversions):
+
+    # this function will turn grouped results of a frame from compact_columns back into the dtypes the original
+    ## columns would have given, so the table is the same as without compact_columns
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### result is the observed-only grouped results of the compacted frame
+    ### df is your original (not compacted) dataframe
+    ### group_cols is the list of columns the results were grouped by
+    ### aggregations is the dictionary containing your analyses for the groupby
+    ### conversions is the dictionary of converted column name to its original dtype from compact_columns
+
+    import pandas as pd
+
+    # index levels back to their original values
+    if isinstance(result.index, pd.MultiIndex):
+        levels = []
+        for group_col, level in zip(group_cols, result.index.levels):
+            if group_col in conversions:
+                level = original_labels(level, conversions[group_col])
+            levels.append(level)
+        result.index = result.index.set_levels(levels)
+    elif group_cols[0] in conversions:
+        result.index = original_labels(result.index, conversions[group_cols[0]])
+
+    # the same column dtypes as the original columns give
+    if any(agg_col in conversions for agg_col in aggregations):
+        result = pandas_result_dtypes(result, df, group_cols, aggregations)
+
+    return result
+
+
+def original_labels(labels, dtype):
+
+    # this function will turn categorical labels from compact_columns back into an index of the original dtype
+    ## the same way pandas builds group labels: object columns have their dtype inferred (ex: str for strings)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### labels is the categorical index (or categories) to turn back
+    ### dtype is the original dtype of the column
+
+    import numpy as np
+    import pandas as pd
+
+    if dtype == object:
+        return pd.Index(np.asarray(labels, dtype=object), name=labels.name)
+    return pd.Index(labels.astype(dtype), name=labels.name)
+
+
+def compacted_category_values(compacted, group_cols, conversions):
+
+    # this function will return category_values for each grouping column of a frame from compact_columns
+    ## converted columns already hold their sorted values as categories, so they are not looked for again
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### compacted is the frame from compact_columns
+    ### group_cols is the list of columns to group by
+    ### conversions is the dictionary of converted column name to its original dtype from compact_columns
+
+    levels = []
+    for group_col in group_cols:
+        level = category_values(compacted[group_col])
+        if group_col in conversions:
+            level = original_labels(level, conversions[group_col])
+        levels.append(level)
+    return levels
+
+
+def pandas_result_dtypes(result, df, group_cols, aggregations):
+
+    # this function will cast grouped results computed another way (ex: on arrow, or on compacted columns) to the dtypes
+    ## pandas gives when grouping df, taken from grouping its first row with pandas
+    ## pandas hands back sums of small integers in their own dtype only when every sum fits in it, otherwise as int64,
+    ## so integer results that do not fit the first row's dtype are left as they are
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### result is the grouped results, with the same columns as the pandas groupby
+    ### df is the dataframe pandas would have grouped
+    ### group_cols is the list of columns to group by
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    import numpy as np
+
+    pandas_sample = df.iloc[:1].groupby(group_cols, observed=True).agg(aggregations)
+
+    result = result.copy(deep=False)
+    for position, dtype in enumerate(pandas_sample.dtypes):
+        values = result.iloc[:, position]
+        if isinstance(dtype, np.dtype) and dtype.kind in 'iu' and values.dtype.kind in 'iu' and len(values) > 0:
+            limits = np.iinfo(dtype)
+            if values.min() < limits.min or values.max() > limits.max:
+                continue
+        result.isetitem(position, values.astype(dtype))
+
+    return result
+
+
+def observed_aggregate(df, group_cols, aggregations, backend='pandas'):
+
+    # this function will run the observed-only groupby (only the combinations actually in the data) on a backend
+    ## backend='arrow' runs it on pyarrow (see arrow_aggregate) and falls back to pandas for anything pyarrow cannot run
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### group_cols is the list of columns to group by, starting with col_name
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    ## OPTIONAL
+    ### backend is one of BACKENDS. defaults to 'pandas'
+
+    if backend not in BACKENDS:
+        raise ValueError('backend must be one of ' + ', '.join(BACKENDS) + ', not ' + repr(backend))
+
+    # approximate distinct counts are sketched for every group at once instead of being called on each group
+    if any(aggregation_name(agg_func) == 'approx_nunique' for agg_col, agg_func in aggregation_list(aggregations)):
+        return sketched_aggregate(df, group_cols, aggregations, backend)
+
+    if backend == 'arrow':
+        result = arrow_aggregate(df, group_cols, aggregations)
+        if result is not None:
+            return result
+
+    return df.groupby(group_cols, observed=True).agg(aggregations)
+
+
+def grouped_aggregate(df, group_cols, aggregations, backend='pandas', compact_dtypes=False):
+
+    # this function is the shared grouping core for all of the table functions
+    ## it groups only the combinations that are actually in the data (observed=True), and then reindexes against
+    ## the full set of categories so every category still returns a row even if there is no data for it
+    ## empty rows get the same value the aggregation gives for an empty group (ex: 0 for counts and sums, NaN for means)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### group_cols is the list of columns to group by, starting with col_name
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    ## OPTIONAL
+    ### backend is the grouping backend, one of BACKENDS (see observed_aggregate). defaults to 'pandas'
+    ### compact_dtypes will group on smaller dtypes and then restore the original ones (see compact_columns). defaults to False
+
+    # callables with a built-in equivalent run as the built-in (see plan_aggregations)
+    planned = plan_aggregations(aggregations)
+
+    # counts and sizes, and integer sums and means, over a modest number of combinations skip the hash groupby
+    ## (see dense_aggregate)
+    if backend == 'pandas':
+        result = dense_aggregate(df, group_cols, planned)
+        if result is not None:
+            return planned_labels(result, df, aggregations, planned)
+
+    # observed-only groupby, so we never build groups that will not end up in the table
+    if compact_dtypes == True:
+        compacted, conversions = compact_columns(df, group_cols, planned)
+        result = observed_aggregate(compacted, group_cols, planned, backend)
+        result = restore_dtypes(result, df, group_cols, planned, conversions)
+        levels = compacted_category_values(compacted, group_cols, conversions)
+    else:
+        result = observed_aggregate(df, group_cols, planned, backend)
+        levels = [category_values(df[group_col]) for group_col in group_cols]
+
+    result = planned_labels(result, df, aggregations, planned)
+    return fill_empty_groups(result, levels, df, aggregations)
+
+
+def aggregate_partition(df, group_cols, aggregations, backend='pandas'):
+
+    # this function will run the observed-only groupby on one partition of the rows (used by partitioned_grouped_aggregate)
+
+    return observed_aggregate(df, group_cols, aggregations, backend)
+
+
+def partitioned_grouped_aggregate(df, group_cols, aggregations, partition_cols, n_jobs, n_partitions=None, backend='pandas', \
+    compact_dtypes=False):
+
+    # this function will run grouped_aggregate in a pool of worker processes
+    ## the rows are hash partitioned by partition_cols, which MUST be grouping columns, so every group lands in exactly one
+    ## partition with its rows in their original order. each worker groups its partitions, and stacking the partition results
+    ## gives exactly the same values as a single groupby (bit for bit, since every group is aggregated from the same rows)
+    ## aggregations must be picklable to be sent to the workers (ex: a lambda is not), otherwise the groupby runs in this process
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### group_cols is the list of columns to group by, starting with col_name
+    ### aggregations is the dictionary containing your analyses for the groupby
+    ### partition_cols is the list of grouping columns to split the rows by (ex: the row index columns)
+    ### n_jobs is the number of worker processes
+
+    ## OPTIONAL
+    ### n_partitions is the number of pieces the rows are split into. defaults to 4 per worker
+    ### backend is the grouping backend each worker uses, one of BACKENDS. defaults to 'pandas'
+    ### compact_dtypes will send the workers smaller dtypes and then restore the original ones (see compact_columns).
+    ####        defaults to False
+
+    import concurrent.futures
+    import pickle
+
+    import numpy as np
+    import pandas as pd
+
+    # callables with a built-in equivalent are sent to the workers as the built-in (ex: a lambda that would not pickle)
+    planned = plan_aggregations(aggregations)
+
+    # what the dense kernel runs is grouped in this process, the same way as with grouped_aggregate (see dense_aggregate)
+    if backend == 'pandas':
+        result = dense_aggregate(df, group_cols, planned)
+        if result is not None:
+            return planned_labels(result, df, aggregations, planned)
+
+    try:
+        pickle.dumps(planned)
+    except Exception:
+        return grouped_aggregate(df, group_cols, aggregations, backend, compact_dtypes)
+
+    if n_partitions == None:
+        n_partitions = 4 * n_jobs
+
+    original = df
+    if compact_dtypes == True:
+        df, conversions = compact_columns(df, group_cols, planned)
+
+    # hash of the partition columns for every row, then the rows of each partition in their original order
+    partition_ids = pd.util.hash_pandas_object(df[partition_cols], index=False).to_numpy() % np.uint64(n_partitions)
+    order = np.argsort(partition_ids, kind='stable')
+    bounds = np.searchsorted(partition_ids[order], np.arange(n_partitions + 1, dtype=np.uint64))
+    partitions = [df.iloc[order[bounds[part]:bounds[part + 1]]] for part in range(n_partitions) if bounds[part + 1] > bounds[part]]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        results = list(executor.map(aggregate_partition, partitions, [group_cols] * len(partitions), \
+            [planned] * len(partitions), [backend] * len(partitions)))
+
+    # groups never span partitions, so stacking and sorting gives the single groupby result
+    result = pd.concat(results).sort_index()
+    if compact_dtypes == True:
+        result = restore_dtypes(result, original, group_cols, planned, conversions)
+        levels = compacted_category_values(df, group_cols, conversions)
+    else:
+        levels = [category_values(df[group_col]) for group_col in group_cols]
+
+    result = planned_labels(result, original, aggregations, planned)
+    return fill_empty_groups(result, levels, original, aggregations)
+
+
+######################## DISTINCT COUNT SKETCHES ##################################
+
+# HyperLogLog sketch precisions: a sketch has 2 ** precision registers and a relative standard error of 1.04 / sqrt(2 ** precision)
+## (precision 4 is about 26%, 10 is 3.3%, 14 is 0.81% and 18 is 0.2%)
+SKETCH_PRECISIONS = range(4, 19)
+
+# bits of each register's packed (register, rank) value that hold the rank (see sketch_registers)
+SKETCH_RANK_BITS = 6
+
+# the most registers (groups * 2 ** precision) a sketch pass holds in one dense array, 1 byte each
+SKETCH_DENSE_REGISTERS = 2 ** 25
+
+
+def sketch_precision(error):
+
+    # this function will return the smallest sketch precision whose relative standard error is at most error
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### error is the largest relative standard error you want (ex: 0.01 for 1%)
+
+    import math
+
+    precision = max(math.ceil(math.log2((1.04 / error) ** 2)), SKETCH_PRECISIONS[0])
+    if precision not in SKETCH_PRECISIONS:
+        raise ValueError('an error of ' + repr(error) + ' needs more than ' + str(SKETCH_PRECISIONS[-1]) + \
+            ' bits of precision, use error=0 for an exact distinct count')
+    return precision
+
+
+def sketch_stat(precision):
+
+    # this function will return the name of the partial stat holding a sketch of the given precision (ex: 'sketch_14')
+
+    return 'sketch_' + str(precision)
+
+
+def stat_precision(stat):
+
+    # this function will return the precision of a sketch partial stat, or None if the stat is not a sketch
+
+    if stat.startswith('sketch_'):
+        return int(stat[len('sketch_'):])
+    return None
+
+
+def sketch_hashes(values):
+
+    # this function will return a 64 bit hash of each value, the same for equal values in every batch and process
+    ## numbers are hashed as floats, so a column read as integers in one chunk and as floats in another (ex: a chunk with
+    ## missing values) still hashes each value the same way
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### values is the series of (non-missing) values to hash
+
+    import pandas as pd
+
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        values = values.astype('float64')
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def sketch_ranks(values, precision):
+
+    # this function will return the register and rank of each value for a HyperLogLog sketch
+    ## the first precision bits of each value's hash pick its register, and its rank is the position of the first 1 bit
+    ## in the rest of the hash (a register keeps the highest rank of the values that land in it)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### values is the series of (non-missing) values to sketch
+    ### precision is the sketch precision, one of SKETCH_PRECISIONS
+
+    import numpy as np
+
+    hashes = sketch_hashes(values)
+    register = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    remaining = hashes & np.uint64((1 << (64 - precision)) - 1)
+
+    # bit length of the rest of the hash, from its float log2 and corrected where rounding took it up to the next power of two
+    bit_length = np.zeros(len(remaining), dtype=np.int64)
+    nonzero = remaining > 0
+    bit_length[nonzero] = np.floor(np.log2(remaining[nonzero].astype(np.float64))).astype(np.int64) + 1
+    rounded_up = nonzero.copy()
+    rounded_up[nonzero] = (remaining[nonzero] >> (bit_length[nonzero] - 1).astype(np.uint64)) == 0
+    bit_length[rounded_up] -= 1
+
+    return register, (64 - precision) - bit_length + 1
+
+
+def group_codes(df, group_cols):
+
+    # this function will number the observed groups of df in groupby order
+    ## returns each row's group number (-1 for rows with a missing key) and the index of the groups, which is read off the first
+    ## row of each group so the grouping columns are only factorized once
+
+    import numpy as np
+    import pandas as pd
+
+    codes = df.groupby(group_cols, observed=True).ngroup().to_numpy(dtype=np.float64, na_value=-1).astype(np.int64)
+    n_groups = codes.max() + 1 if len(codes) > 0 else 0
+
+    first_rows = np.full(n_groups, len(codes), dtype=np.int64)
+    present = codes >= 0
+    np.minimum.at(first_rows, codes[present], np.flatnonzero(present))
+    keys = df[group_cols].iloc[first_rows]
+    if len(group_cols) == 1:
+        groups = pd.Index(keys[group_cols[0]], name=group_cols[0])
+    else:
+        groups = pd.MultiIndex.from_frame(keys)
+    return codes, groups
+
+
+def register_maxima(codes, register, rank, n_groups, precision):
+
+    # this function will keep the highest rank in each register of each group
+    ## returns the (group number, register, rank) arrays, one entry per register with a value in it
+    ## registers are held in one dense array when they fit in SKETCH_DENSE_REGISTERS, otherwise grouped by their key
+
+    import numpy as np
+    import pandas as pd
+
+    n_registers = 2 ** precision
+    keys = codes * n_registers + register
+
+    if n_groups * n_registers <= SKETCH_DENSE_REGISTERS:
+        dense = np.zeros(n_groups * n_registers, dtype=np.uint8)
+        np.maximum.at(dense, keys, rank.astype(np.uint8))
+        keys = np.flatnonzero(dense)
+        rank = dense[keys].astype(np.int64)
+    else:
+        maxima = pd.Series(rank).groupby(keys).max()
+        keys = maxima.index.to_numpy()
+        rank = maxima.to_numpy()
+
+    return keys // n_registers, keys % n_registers, rank
+
+
+def group_estimates(codes, rank, n_groups, precision):
+
+    # this function will estimate the distinct count of every group from the ranks of its registers (see register_maxima)
+    ## the HyperLogLog estimate, switching to linear counting while many of a group's registers are still empty, which keeps
+    ## small distinct counts close to exact
+
+    import numpy as np
+
+    n_registers = 2 ** precision
+
+    # how many registers of each group hold each rank, and so the harmonic mean of 2 ** rank (an empty register is rank 0)
+    histogram = np.bincount(codes * 64 + rank, minlength=n_groups * 64).reshape(n_groups, 64)
+    empty = n_registers - histogram.sum(axis=1)
+    alpha = 0.7213 / (1 + 1.079 / n_registers)
+    estimate = alpha * n_registers ** 2 / (histogram @ np.exp2(-np.arange(64)) + empty)
+
+    # linear counting while registers are still empty
+    with np.errstate(divide='ignore'):
+        linear = n_registers * np.log(n_registers / empty)
+    estimate = np.where((estimate > 2.5 * n_registers) | (empty == 0), estimate, linear)
+    return np.round(estimate).astype(np.int64)
+
+
+def sketch_counts(df, group_cols, agg_col, precision, grouping=None):
+
+    # this function will return the approximate distinct count of agg_col in every observed group, from one HyperLogLog
+    ## sketch pass over all of the groups at once
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### group_cols is the list of columns to group by
+    ### agg_col is the column to count the distinct values of
+    ### precision is the sketch precision, one of SKETCH_PRECISIONS
+
+    ## OPTIONAL
+    ### grouping is the (codes, groups) pair from group_codes, to share it between columns. defaults to None
+
+    import pandas as pd
+
+    if grouping == None:
+        grouping = group_codes(df, group_cols)
+    codes, groups = grouping
+    present = (df[agg_col].notna().to_numpy()) & (codes >= 0)
+    register, rank = sketch_ranks(df[agg_col][present], precision)
+    codes, register, rank = register_maxima(codes[present], register, rank, len(groups), precision)
+    return pd.Series(group_estimates(codes, rank, len(groups), precision), index=groups)
+
+
+def sketch_registers(df, group_cols, agg_col, precision):
+
+    # this function will build the HyperLogLog sketches of the distinct values of agg_col in every group, in one pass
+    ## returns a frame of (grouping columns..., agg_col) rows, one per register with a value in each group, with the register
+    ## and its rank packed into agg_col (register * 64 + rank), so sketches are merged and rolled up like distinct values
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### group_cols is the list of columns to group by
+    ### agg_col is the column to count the distinct values of
+    ### precision is the sketch precision, one of SKETCH_PRECISIONS
+
+    codes, groups = group_codes(df, group_cols)
+    present = (df[agg_col].notna().to_numpy()) & (codes >= 0)
+    register, rank = sketch_ranks(df[agg_col][present], precision)
+    codes, register, rank = register_maxima(codes[present], register, rank, len(groups), precision)
+
+    registers = groups[codes].to_frame(index=False)
+    registers[agg_col] = register * 2 ** SKETCH_RANK_BITS + rank
+    return registers
+
+
+def sketch_estimates(registers, group_cols, agg_col, precision):
+
+    # this function will estimate the distinct count of every group from its sketch registers (see sketch_registers)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### registers is the frame of packed registers from sketch_registers (merged sketches can repeat a register)
+    ### group_cols is the list of columns the sketches are grouped by
+    ### agg_col is the column holding the packed registers
+    ### precision is the sketch precision the registers were built with
+
+    import pandas as pd
+
+    codes, groups = group_codes(registers, group_cols)
+    packed = registers[agg_col].to_numpy()
+    codes, register, rank = register_maxima(codes, packed // 2 ** SKETCH_RANK_BITS, packed % 2 ** SKETCH_RANK_BITS, len(groups), \
+        precision)
+    return pd.Series(group_estimates(codes, rank, len(groups), precision), index=groups)
+
+
+class ApproxNunique:
+
+    # this class is an approximate distinct count aggregation to use in aggregations in place of pd.Series.nunique
+    ## ex: {'member_id': ApproxNunique(error=0.01)}, or the ready made approx_nunique (error=0.01)
+    ## every group is counted from a HyperLogLog sketch built for all of the groups in one vectorized pass, instead of
+    ## running pd.Series.nunique on each group, and sketches are mergeable, so it works with run_report_batch, n_jobs, margins,
+    ## IncrementalTable and stream_tables too
+    ## the error bound: each count has a relative standard error of 1.04 / sqrt(2 ** precision), which is at most error
+    ## (about 68% of counts are within one standard error of the true count and 95% within two). counts much smaller than
+    ## 2 ** precision are close to exact
+
+    # ARGUMENTS
+
+    ## OPTIONAL
+    ### error is the largest relative standard error you want, down to about 0.0025. defaults to 0.01
+    ####        error=0 is an exact distinct count, the same as pd.Series.nunique
+
+    def __init__(self, error=0.01):
+        self.error = error
+        if error == 0:
+            self.precision = None
+        else:
+            self.precision = sketch_precision(error)
+        # pandas names results columns after the aggregation
+        self.__name__ = 'approx_nunique'
+
+    def __call__(self, series):
+
+        # this method will count the distinct values of one series, for pandas calling the aggregation on its own
+
+        import pandas as pd
+
+        if self.precision == None:
+            return series.nunique()
+
+        frame = pd.DataFrame({'group': 0, 'values': series.to_numpy()})
+        estimates = sketch_counts(frame, ['group'], 'values', self.precision)
+        if len(estimates) == 0:
+            return 0
+        return int(estimates.iloc[0])
+
+    # two ApproxNunique with the same error are the same aggregation (ex: for the result cache keys)
+
+    def __repr__(self):
+        return 'ApproxNunique(error=' + repr(self.error) + ')'
+
+    def __eq__(self, other):
+        if not isinstance(other, ApproxNunique):
+            return NotImplemented
+        return self.error == other.error
+
+    def __hash__(self):
+        return hash(('ApproxNunique', self.error))
+
+    def __reduce__(self):
+        return (ApproxNunique, (self.error,))
+
+
+# the ready made approximate distinct count, with a relative standard error of at most 1%
+approx_nunique = ApproxNunique()
+
+
+def sketched_aggregate(df, group_cols, aggregations, backend='pandas'):
+
+    # this function will run an observed-only groupby with approximate distinct counts in it
+    ## every approximate distinct count is sketched for all of the groups at once, and the other aggregations run on the backend
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### group_cols is the list of columns to group by, starting with col_name
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    ## OPTIONAL
+    ### backend is one of BACKENDS. defaults to 'pandas'
+
+    import pandas as pd
+
+    pairs = aggregation_list(aggregations)
+    sketched = [aggregation_name(agg_func) == 'approx_nunique' for agg_col, agg_func in pairs]
+
+    others = {}
+    for (agg_col, agg_func), is_sketched in zip(pairs, sketched):
+        if not is_sketched:
+            others.setdefault(agg_col, []).append(agg_func)
+
+    # the groups are numbered once for every sketched column
+    grouping = group_codes(df, group_cols)
+
+    # results columns are put together by their position in aggregations
+    parts = []
+    if len(others) > 0:
+        result = observed_aggregate(df, group_cols, others, backend)
+        parts.append(result.set_axis([position for position, is_sketched in enumerate(sketched) if not is_sketched], axis=1))
+        groups = result.index
+    else:
+        groups = grouping[1]
+
+    for position, (agg_col, agg_func) in enumerate(pairs):
+        if sketched[position]:
+            estimates = sketch_counts(df, group_cols, agg_col, agg_func.precision, grouping)
+            if not estimates.index.equals(groups):
+                estimates = estimates.reindex(groups, fill_value=0)
+            parts.append(estimates.to_frame(position))
+
+    result = pd.concat(parts, axis=1)[list(range(len(pairs)))]
+    return result.set_axis(empty_group_values(df, aggregations).columns, axis=1)
+
+
+######################## PARTIAL AGGREGATES ##################################
+
+# each mergeable aggregation and the partial stats it is built from
+## 'distinct' is the set of distinct values per group and 'sketch' a distinct count sketch of them (named with its precision,
+## see sketch_stat), both kept apart from the other stats (see PartialAggregates)
+PARTIAL_STATS = {
+    'count': ['count'],
+    'size': ['size'],
+    'sum': ['sum'],
+    'min': ['min'],
+    'max': ['max'],
+    'mean': ['sum', 'count'],
+    'nunique': ['distinct'],
+    'approx_nunique': ['sketch'],
+}
+
+# how partial stats from different groups or batches are combined
+COMBINE_STATS = {
+    'count': 'sum',
+    'size': 'sum',
+    'sum': 'sum',
+    'min': 'min',
+    'max': 'max',
+}
+
+# hidden partial stat counting the rows in each group, so every group is kept even when only distinct values are aggregated
+GROUP_ROWS = ('__rows__', 'size')
+
+
+def aggregation_list(aggregations):
+
+    # this function will flatten an aggregations dictionary into a list of (column, aggregation) pairs
+    ## in the same order as the columns of the grouped results
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    pairs = []
+    for agg_col, agg_funcs in aggregations.items():
+        if not isinstance(agg_funcs, (list, tuple)):
+            agg_funcs = [agg_funcs]
+        for agg_func in agg_funcs:
+            pairs.append((agg_col, agg_func))
+    return pairs
+
+
+def aggregation_name(agg_func):
+
+    # this function will return the name of a mergeable aggregation (ex: 'sum' or 'nunique'), or None if it is not one
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### agg_func is one aggregation from your aggregations dictionary (ex: 'sum' or pd.Series.nunique)
+
+    if isinstance(agg_func, ApproxNunique):
+        if agg_func.precision == None:
+            return 'nunique'
+        return 'approx_nunique'
+    if isinstance(agg_func, str):
+        if agg_func in PARTIAL_STATS:
+            return agg_func
+        return None
+    # callables with a built-in equivalent (ex: np.sum or lambda x: x.count()) are mergeable like the built-in
+    agg_name = fast_path_aggregation(agg_func)
+    if agg_name in PARTIAL_STATS:
+        return agg_name
+    return None
+
+
+def unmergeable_aggregations(aggregations):
+
+    # this function will return the (column, aggregation) pairs that cannot be built from partial aggregates
+    ## (ex: 'median' or a lambda), so they need a full pass over the data
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    return [(agg_col, agg_func) for agg_col, agg_func in aggregation_list(aggregations) if aggregation_name(agg_func) == None]
+
+
+def partial_stats(aggregations):
+
+    # this function will return the list of (column, partial stat) pairs needed to build the aggregations
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### aggregations is the dictionary containing your analyses for the groupby
+    ####        every aggregation MUST be mergeable (see unmergeable_aggregations)
+
+    stats = []
+    for agg_col, agg_func in aggregation_list(aggregations):
+        for stat in PARTIAL_STATS[aggregation_name(agg_func)]:
+            if stat == 'sketch':
+                stat = sketch_stat(agg_func.precision)
+            if (agg_col, stat) not in stats:
+                stats.append((agg_col, stat))
+    return stats
+
+
+def distinct_frames(df, group_cols, stats):
+
+    # this function will build the partial stats kept apart from the grouped frame: the distinct (grouping columns..., value)
+    ## rows of each distinct count column, keyed by the column, and the sketch registers of each approximate distinct count,
+    ## keyed by (column, stat) (see sketch_registers)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### group_cols is the list of columns to group by
+    ### stats is the list of (column, partial stat) pairs (see partial_stats)
+
+    distinct = {}
+    for agg_col, stat in stats:
+        if stat == 'distinct':
+            distinct[agg_col] = df[group_cols + [agg_col]].dropna(subset=[agg_col]).drop_duplicates()
+        elif stat_precision(stat) != None:
+            distinct[(agg_col, stat)] = sketch_registers(df, group_cols, agg_col, stat_precision(stat))
+    return distinct
+
+
+class PartialAggregates:
+
+    # this class holds mergeable partial aggregates per group: counts, sums, mins and maxes, plus the distinct values
+    ## of any column with a distinct count
+    ## partial aggregates can be combined across batches of rows or rolled up to fewer grouping columns,
+    ## and then finished into the same grouped results grouped_aggregate gives
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### frame is the partial aggregates, indexed by the grouping columns, with a (column, stat) column per partial stat
+    ### template is a frame (can have zero rows) with the columns being aggregated and their dtypes
+
+    ## OPTIONAL
+    ### distinct is the dictionary of each distinct count column to a frame of its distinct (grouping columns..., value) rows,
+    ####        and of each (column, sketch stat) to a frame of its sketch registers (see distinct_frames)
+
+    def __init__(self, frame, template, distinct=None):
+        self.frame = frame
+        self.template = template
+        if distinct == None:
+            distinct = {}
+        self.distinct = distinct
+
+    @property
+    def group_cols(self):
+        return list(self.frame.index.names)
+
+    @classmethod
+    def from_frame(cls, df, group_cols, stats):
+
+        # this method will build partial aggregates from a dataframe
+        ## groups are kept in order of first appearance, so the order of values in the data is not lost
+
+        import pandas as pd
+
+        stat_dict = {}
+        distinct_cols = []
+        for agg_col, stat in stats:
+            if stat == 'distinct' or stat_precision(stat) != None:
+                distinct_cols.append(agg_col)
+            else:
+                stat_dict.setdefault(agg_col, []).append(stat)
+
+        grouped = df.groupby(group_cols, observed=True, sort=False)
+        frame = grouped.size().to_frame(GROUP_ROWS)
+        frame.columns = pd.MultiIndex.from_tuples([GROUP_ROWS])
+        if len(stat_dict) > 0:
+            frame = pd.concat([frame, grouped.agg(stat_dict)], axis=1)
+
+        template_cols = list(stat_dict)
+        for agg_col in distinct_cols:
+            if agg_col not in template_cols:
+                template_cols.append(agg_col)
+        return cls(frame, df[template_cols].iloc[:0], distinct_frames(df, group_cols, stats))
+
+    def combine(self, keys):
+
+        # this method will combine partial stats that share the same keys (a list of arrays, one per grouping column)
+        ## distinct values are left as they are
+
+        import pandas as pd
+
+        grouped = self.frame.groupby(keys, observed=True, sort=False)
+        parts = []
+        for combine_func in ['sum', 'min', 'max']:
+            stat_cols = [stat_col for stat_col in self.frame.columns if COMBINE_STATS[stat_col[1]] == combine_func]
+            if len(stat_cols) > 0:
+                parts.append(getattr(grouped[stat_cols], combine_func)())
+        return PartialAggregates(pd.concat(parts, axis=1)[self.frame.columns], self.template, self.distinct)
+
+    def merge(self, other):
+
+        # this method will merge these partial aggregates with another set over the same grouping columns
+
+        import pandas as pd
+
+        merged = PartialAggregates(pd.concat([self.frame, other.frame]), self.template)
+        merged = merged.combine([merged.frame.index.get_level_values(group_col) for group_col in self.group_cols])
+        merged.distinct = {agg_col: pd.concat([distinct_values, other.distinct[agg_col]]).drop_duplicates() \
+            for agg_col, distinct_values in self.distinct.items()}
+        return merged
+
+    def regroup(self, group_cols, col_name=None, label_mapper=None, column_mapping=None):
+
+        # this method will roll the partial aggregates up to fewer grouping columns
+        ## col_name values can be relabeled on the way with a LabelMapper, and the aggregated columns renamed
+        ## with column_mapping (ex: index_mapping)
+
+        import pandas as pd
+
+        keys = []
+        for group_col in group_cols:
+            key = pd.Series(self.frame.index.get_level_values(group_col), name=group_col)
+            if group_col == col_name and label_mapper != None:
+                key = label_mapper.map(key)
+            keys.append(key.array)
+
+        regrouped = self.combine(keys)
+        regrouped.frame.index = regrouped.frame.index.set_names(group_cols)
+
+        # distinct values are rolled up the same way, keeping one row per distinct (group, value)
+        distinct = {}
+        for distinct_key, distinct_values in self.distinct.items():
+            # the values (or packed sketch registers) are always the last column
+            distinct_values = distinct_values[group_cols + [distinct_values.columns[-1]]]
+            if col_name in group_cols and label_mapper != None:
+                distinct_values = distinct_values.assign(**{col_name: label_mapper.map(distinct_values[col_name])})
+            distinct[distinct_key] = distinct_values.drop_duplicates()
+        regrouped.distinct = distinct
+
+        if column_mapping != None:
+            regrouped.frame = regrouped.frame.rename(columns=column_mapping, level=0)
+            regrouped.template = regrouped.template.rename(columns=column_mapping)
+            renamed = {}
+            for distinct_key, distinct_values in distinct.items():
+                if isinstance(distinct_key, tuple):
+                    distinct_key = (column_mapping.get(distinct_key[0], distinct_key[0]), distinct_key[1])
+                else:
+                    distinct_key = column_mapping.get(distinct_key, distinct_key)
+                renamed[distinct_key] = distinct_values.rename(columns=column_mapping)
+            regrouped.distinct = renamed
+
+        return regrouped
+
+    def rollup(self, kept_cols, margins_name):
+
+        # this method will roll the partial aggregates up over every grouping column not in kept_cols
+        ## the rolled up columns keep their place in the index with margins_name as their only value (ex: a 'Total' column)
+
+        import numpy as np
+
+        rolled_cols = [group_col for group_col in self.group_cols if group_col not in kept_cols]
+
+        keys = []
+        for group_col in self.group_cols:
+            if group_col in rolled_cols:
+                keys.append(np.full(len(self.frame), margins_name, dtype=object))
+            else:
+                keys.append(self.frame.index.get_level_values(group_col).array)
+
+        rolled = self.combine(keys)
+        rolled.frame.index = rolled.frame.index.set_names(self.group_cols)
+
+        # distinct values are rolled up the same way, keeping one row per distinct (group, value)
+        rolled.distinct = {agg_col: distinct_values.assign(**{group_col: margins_name for group_col in rolled_cols}).drop_duplicates() \
+            for agg_col, distinct_values in self.distinct.items()}
+        return rolled
+
+    def finalize(self, aggregations):
+
+        # this method will finish the partial aggregates into grouped results, with every category returning a row
+
+        import pandas as pd
+
+        results = []
+        for agg_col, agg_func in aggregation_list(aggregations):
+            agg_name = aggregation_name(agg_func)
+            if agg_name == 'mean':
+                results.append(self.frame[(agg_col, 'sum')] / self.frame[(agg_col, 'count')])
+            elif agg_name == 'nunique':
+                # one distinct row per value, so the distinct count is the number of rows in each group
+                distinct_counts = self.distinct[agg_col].groupby(self.group_cols, observed=True).size()
+                results.append(distinct_counts.reindex(self.frame.index, fill_value=0))
+            elif agg_name == 'approx_nunique':
+                registers = self.distinct[(agg_col, sketch_stat(agg_func.precision))]
+                estimates = sketch_estimates(registers, self.group_cols, agg_col, agg_func.precision)
+                results.append(estimates.reindex(self.frame.index, fill_value=0))
+            else:
+                results.append(self.frame[(agg_col, agg_name)])
+
+        result = pd.concat(results, axis=1)
+        result.columns = empty_group_values(self.template, aggregations).columns
+
+        # groupby order, then every combination of categories
+        result = result.sort_index()
+        levels = [category_values(pd.Series(result.index.get_level_values(group_col))) for group_col in self.group_cols]
+        return fill_empty_groups(result, levels, self.template, aggregations)
+
+
+######################## MARGINS ##################################
+
+def margin_label(margins, normalize=None):
+
+    # this function will return the label for the margins argument of the table functions, or None for no margins
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### margins is True (label the margins 'Total'), a label of your own, or None / False for no margins
+
+    ## OPTIONAL
+    ### normalize is the table's normalize argument, since shares cannot be taken with the margins in the table
+
+    if margins == None or margins is False:
+        return None
+
+    if normalize != None:
+        raise ValueError('margins cannot be combined with normalize, the shares would count every total twice')
+
+    if margins is True:
+        return 'Total'
+    return margins
+
+
+def margin_groupings(group_cols):
+
+    # this function will return the groupings the margins are rolled up to, as the list of grouping columns each one keeps
+    ## col_name (the first grouping column) is rolled up into a total column, and the row index columns into subtotal rows
+    ## from the last one back (ex: a subtotal per index1_col value, then a grand total row), each with and without col_name
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### group_cols is the list of columns the table groups by, starting with col_name
+
+    col_name = group_cols[0]
+    row_cols = group_cols[1:]
+
+    groupings = []
+    for depth in range(len(row_cols), -1, -1):
+        for kept_cols in [[col_name] + row_cols[:depth], row_cols[:depth]]:
+            # every column kept is the table itself
+            if kept_cols != group_cols:
+                groupings.append(kept_cols)
+    return groupings
+
+
+def partial_margins(partials, aggregations, margins_name='Total'):
+
+    # this function will finish the margins of a table from its partial aggregates, one grouped results frame per margin_groupings
+    ## sums, counts, mins and maxes are combined across groups, means are rebuilt from the combined sums and counts and distinct
+    ## counts from the combined distinct values, so the data is never grouped again
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### partials is the PartialAggregates grouped by the table's grouping columns, starting with col_name
+    ### aggregations is the dictionary containing your analyses for the groupby
+    ####        every aggregation MUST be mergeable (see unmergeable_aggregations)
+
+    ## OPTIONAL
+    ### margins_name is the label of the total column and subtotal rows. defaults to 'Total'
+
+    return [partials.rollup(kept_cols, margins_name).finalize(aggregations) for kept_cols in margin_groupings(partials.group_cols)]
+
+
+def stack_margins(results, group_cols, margins_name='Total'):
+
+    # this function will stack grouped results and their margins into one grouped results frame
+    ## every grouping level becomes a categorical with margins_name as its last category, so the reshaping puts the total column
+    ## and the subtotal rows after every other value and the ordering options place the rest as usual
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### results is the list of grouped results for the table, followed by its margins (ex: from partial_margins)
+    ### group_cols is the list of columns the table groups by, starting with col_name
+
+    ## OPTIONAL
+    ### margins_name is the label of the total column and subtotal rows. defaults to 'Total'
+
+    import pandas as pd
+
+    stacked = pd.concat(results)
+
+    labels = []
+    for group_col in group_cols:
+        table_values = pd.Series(results[0].index.get_level_values(group_col))
+        categories = category_values(table_values)
+        if margins_name in categories:
+            raise ValueError(repr(margins_name) + ' is a value of ' + repr(group_col) + ', so it cannot label the margins')
+        ordered = isinstance(table_values.dtype, pd.CategoricalDtype) and table_values.cat.ordered
+        labels.append(pd.Categorical(stacked.index.get_level_values(group_col), categories=categories.append(pd.Index([margins_name])), \
+            ordered=ordered))
+
+    if len(group_cols) == 1:
+        stacked.index = pd.CategoricalIndex(labels[0], name=group_cols[0])
+    else:
+        stacked.index = pd.MultiIndex.from_arrays(labels, names=group_cols)
+    return stacked
+
+
+def split_aggregations(aggregations, mergeable):
+
+    # this function will return the part of an aggregations dictionary that is (or is not) mergeable, in the same order
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### aggregations is the dictionary containing your analyses for the groupby
+    ### mergeable is True for the mergeable aggregations (see aggregation_name), False for the rest
+
+    selected = {}
+    for agg_col, agg_func in aggregation_list(aggregations):
+        if (aggregation_name(agg_func) != None) == mergeable:
+            selected.setdefault(agg_col, []).append(agg_func)
+    return selected
+
+
+def margin_aggregate(df, group_cols, aggregations, margins_name='Total', backend='pandas', compact_dtypes=False, partition_cols=None, \
+    n_jobs=1, n_partitions=None):
+
+    # this function will run the groupby for a table with margins: the grouped results for every group, followed by a total
+    ## across the col_name values and the subtotals for the row index columns (see margin_groupings), ready for stack_margins
+    ## mergeable aggregations are grouped once into partial aggregates, and the table and all of its margins are finished from them
+    ## any other aggregation (ex: 'median') is grouped once more for each margin, with the rolled up columns set to margins_name
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### group_cols is the list of columns to group by, starting with col_name
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    ## OPTIONAL
+    ### margins_name is the label of the total column and subtotal rows. defaults to 'Total'
+    ### the rest of the arguments are the same as in grouped_aggregate and partitioned_grouped_aggregate
+
+    import pandas as pd
+
+    def aggregate(data, data_aggregations):
+        if n_jobs == 1:
+            return grouped_aggregate(data, group_cols, data_aggregations, backend, compact_dtypes)
+        return partitioned_grouped_aggregate(data, group_cols, data_aggregations, partition_cols, n_jobs, n_partitions, backend, \
+            compact_dtypes)
+
+    groupings = margin_groupings(group_cols)
+    agg_names = [aggregation_name(agg_func) for agg_col, agg_func in aggregation_list(aggregations)]
+
+    # grouped results for the table and each margin, one list per part of the aggregations, with their results positions
+    parts = []
+
+    mergeable = split_aggregations(aggregations, True)
+    if len(mergeable) > 0:
+        stat_aggregations = {}
+        distinct_cols = []
+        for agg_col, stat in partial_stats(mergeable):
+            if stat == 'distinct' or stat_precision(stat) != None:
+                distinct_cols.append(agg_col)
+            else:
+                stat_aggregations.setdefault(agg_col, []).append(stat)
+        if len(stat_aggregations) == 0:
+            # a row count keeps every group when only distinct values are aggregated
+            stat_aggregations[distinct_cols[0]] = ['size']
+
+        # one groupby pass for every partial stat, on the table's backend
+        distinct = distinct_frames(df, group_cols, partial_stats(mergeable))
+        partials = PartialAggregates(aggregate(df, stat_aggregations), df[list(mergeable)].iloc[:0], distinct)
+
+        positions = [position for position, agg_name in enumerate(agg_names) if agg_name != None]
+        parts.append((positions, [partials.finalize(mergeable)] + partial_margins(partials, mergeable, margins_name)))
+
+    unmergeable = split_aggregations(aggregations, False)
+    if len(unmergeable) > 0:
+        results = [aggregate(df, unmergeable)]
+        for kept_cols in groupings:
+            rolled = df.assign(**{group_col: margins_name for group_col in group_cols if group_col not in kept_cols})
+            results.append(aggregate(rolled, unmergeable))
+
+        positions = [position for position, agg_name in enumerate(agg_names) if agg_name == None]
+        parts.append((positions, results))
+
+    # put the results columns of both parts back in aggregations order
+    columns = empty_group_values(df, aggregations).columns
+    joined = []
+    for grouping in range(len(groupings) + 1):
+        result = pd.concat([results[grouping].set_axis(positions, axis=1) for positions, results in parts], axis=1)
+        joined.append(result[list(range(len(columns)))].set_axis(columns, axis=1))
+
+    return stack_margins(joined, group_cols, margins_name)
+
+
+######################## RESHAPING ##################################
+
+def combined_index_layout(df, col_name, value_cols):
+
+    # this function will reshape a grouped result so the value_cols become the first row index and col_name becomes the columns
+    ## it goes straight from the grouped index to the report layout, without a long format roundtrip,
+    ## and keeps the native dtypes of the results
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your grouped results, indexed by col_name (and optionally one more index column after it)
+    ### col_name is the index level whose values become your column headers
+    ### value_cols is the list of results columns to combine into one index, in their desired order
+
+    import pandas as pd
+
+    if df.index.nlevels == 1:
+        # one row per value column and one column per col_name category
+        df = df[value_cols].T
+        df.index.name = 'variable'
+        return df
+
+    # one block per value column, each with the second index as rows and col_name as columns, stacked in value_cols order
+    return pd.concat({value_col: df[value_col].unstack(col_name) for value_col in value_cols}, names=['variable'])
+
+
+# the share of total modes the pivot tables can normalize their results to (see normalize_shares)
+NORMALIZE_MODES = ['column', 'row', 'total']
+
+
+def normalize_shares(df, col_name, normalize):
+
+    # this function will turn grouped results into shares of a total, with one division over the whole result
+    ## each stat is divided by its total over a set of groups, found with a grouped sum broadcast back to every row
+    ## (a transform), instead of splitting the result into a frame per group
+    ###   'column' - share of the col_name category: each col_name value's stats add up to 1 over the row index values
+    ###   'row' - share of the row index category: each row's stats add up to 1 over the col_name values
+    ###   'total' - share of the grand total: each stat adds up to 1 over the whole table
+    ## a total of 0 gives NaN shares
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your grouped results, indexed by col_name and then your row index columns (if any), with one column per stat
+    ### col_name is the index level whose values become your column headers
+    ### normalize is one of NORMALIZE_MODES, or None to leave the results as they are
+
+    if normalize == None:
+        return df
+
+    if normalize not in NORMALIZE_MODES:
+        raise ValueError('normalize must be one of ' + ', '.join(NORMALIZE_MODES) + ' or None, not ' + repr(normalize))
+
+    row_levels = [level_name for level_name in df.index.names if level_name != col_name]
+
+    if normalize == 'column':
+        totals = df.groupby(level=col_name, observed=True, sort=False).transform('sum')
+    elif normalize == 'row' and len(row_levels) > 0:
+        totals = df.groupby(level=row_levels, observed=True, sort=False).transform('sum')
+    else:
+        # with no row index, each row's total over the col_name values is the stat's grand total
+        totals = df.sum()
+
+    return df / totals
+
+
+def double_header_layout(df, col_name):
+
+    # this function will reshape a grouped result so col_name and the stats columns become a double header
+    ## col_name values are the top header and the stats columns sit under each of them, and the remaining index
+    ## levels become the row index. the native dtypes of each stat are kept
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your grouped results, indexed by col_name and then your row index columns, with your stats_names as columns
+    ### col_name is the index level whose values become your top column header
+
+    # move col_name into the columns and put it above the stats
+    df = df.unstack(col_name).swaplevel(0, 1, axis=1)
+    df.columns = df.columns.set_names([col_name, 'variable'])
+    return df
+
+
+def fill_null_stats(df, null_to_0, stats_level=0, stats_axis='columns'):
+
+    # this function will replace nulls with 0 for the null_to_0 argument of every table function, in one step
+    ## null_to_0 can be True (every null in the table), a list of stats names (only those stats), or None / False (nothing)
+    ## the stats named in the list are found once with a mask over the stats labels, and all of their columns are filled
+    ## together, instead of searching the columns for each name
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your results table
+    ### null_to_0 is True, a list of stats names, or None / False
+
+    ## OPTIONAL
+    ### stats_level is the header (or index) level holding the stats names. defaults to 0
+    ####        ex: 'variable' for the double header tables, where the stats sit under each col_name value
+    ### stats_axis is 'columns' when the stats are columns, or 'index' when they are rows (the combined index tables).
+    ####        defaults to 'columns'
+
+    import numpy as np
+
+    if null_to_0 == None or null_to_0 == False:
+        return df
+
+    if null_to_0 == True:
+        return df.fillna(0)
+
+    if stats_axis == 'columns':
+        positions = np.flatnonzero(df.columns.get_level_values(stats_level).isin(null_to_0))
+        if len(positions) > 0:
+            df = df.copy(deep=False)
+            df.isetitem(positions, df.iloc[:, positions].fillna(0))
+    else:
+        rows = df.index.get_level_values(stats_level).isin(null_to_0)
+        if rows.any():
+            df = df.copy(deep=False)
+            df.loc[rows] = df.loc[rows].fillna(0)
+
+    return df
+
+
+######################## GROUPBY RESULTS ##################################
+
+
+def simple_groupby(df, col_name, aggregations, index_mapping=None, index_ordered_list=None, index_name=None, stats_names=None,\
+    null_to_0=None, margins=False, backend='pandas', compact_dtypes=False):
+
+    # this function will perform a simple groupby by the specified column (col_name) and has optional args for formatting
+
+    ## MANDATORY:
+    ### df is your dataframe to be analyzed
+    ### col_name is the column to perform the groupby with    
+    ### aggregations is the dictionary containing your analyses for the groupby
+
+    ## OPTIONAL:
+    ### index_mapping is the dictionary to map your values in your col_name column to their desired labels
+    ### index_ordered_list is the list of your col_name index values in their desired order
+    ####        if you are using index_mapping to change the index values, this list MUST match the new names!
+    ### index_name is the name of your index  
+    ### stats_names is the list of names of your columns containing your results
+    ####        this list MUST be in the same around as your aggregations!
+    ### null_to_0 is your list of columns (matching stats_names) to convert nulls to 0s, or True for every column. defaults to None
+    ### margins will add a total row, labelled 'Total' if True or with your own label. defaults to False
+    ### backend is what runs the groupby: 'pandas' or 'arrow' (pyarrow, multi-threaded). defaults to 'pandas'
+    ####        aggregations arrow does not have (anything but count, size, sum, min, max, mean and nunique) run on pandas
+    ### compact_dtypes will group on categorical codes and downcast integer measures, then restore the original dtypes
+    ####        (see compact_columns). can cut memory and groupby time on wide object-dtype extracts. defaults to False
+
+    # import pandas in case any aggregations require it (ex: pd.Series.nunique for unique counts)
+    import pandas as pd
+
+
+    timer = stage_timer('simple_groupby', df)
+
+    # work on a lightweight frame holding only the columns this table needs, so your df is never changed
+    df = project_columns(df, [col_name] + list(aggregations))
+    timer.lap('project_columns', df)
+
+    # observed-only groupby, reindexed so every col_name category returns a row even if there is no data
+    if margin_label(margins) == None:
+        df = grouped_aggregate(df, [col_name], aggregations, backend, compact_dtypes)
+    else:
+        # the table's groups plus the total rolled up from the same grouped results
+        df = margin_aggregate(df, [col_name], aggregations, margin_label(margins), backend, compact_dtypes)
+    timer.lap('groupby', df)
+
+    # formatting the grouped results into the report table
+    return format_simple_groupby(df, col_name, index_mapping, index_ordered_list, index_name, stats_names, null_to_0, margins)
+
+
+def format_simple_groupby(df, col_name, index_mapping=None, index_ordered_list=None, index_name=None, stats_names=None, null_to_0=None, \
+    margins=False):
+
+    # this function will format grouped results into the simple_groupby table
+    ## it is everything simple_groupby does after the groupby, so the same table can be built from results grouped elsewhere
+    ## (ex: run_report_batch)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your grouped results, indexed by col_name, with one column per aggregation
+    ### col_name is the column the results were grouped by
+
+    ## OPTIONAL
+    ### the rest of the arguments are the same as in simple_groupby
+
+    import pandas as pd
+
+    timer = stage_timer('format_simple_groupby', df)
+
+    # the total row keeps its label through index_mapping
+    margins_name = margin_label(margins)
+    if margins_name != None and index_mapping != None:
+        index_mapping = {**index_mapping, margins_name: margins_name}
+
+    # renaming index values
+    if index_mapping == None:
+        pass 
+    else:
+        # if your index name is also the name of one of your columns (ex: you took a count of your groupby var)
+        if df.index.name in list(df.columns):
+            # temporarily rename results col
+            df.rename(columns={col_name:'temp'}, inplace=True)
+            # reset the index for manipulation
+            df.reset_index(inplace=True)
+            # map the desired values onto your index
+            df[col_name] = df[col_name].map(index_mapping)
+            # set the index back
+            df.set_index(col_name, inplace=True)
+            # change the name of the column back
+            df.rename(columns={'temp':col_name}, inplace=True)
+        else:
+           # reset the index for manipulation
+            df.reset_index(inplace=True)
+            # map the desired values onto your index
+            df[col_name] = df[col_name].map(index_mapping)
+            # set the index back
+            df.set_index(col_name, inplace=True)
+    timer.lap('index_mapping', df)
+
+    # reordering the index
+    if index_ordered_list == None:
+        pass 
     else:
-        # create a name_col with label values
-        df = df.assign(name_col=df[col_name].apply(lambda x: col_mapping[x]))
+        # single reorder by each index value's integer position in index_ordered_list
+        df = reorder_rows(df, [index_ordered_list])
+    timer.lap('reorder_rows', df)
 
-    ## map the order to the label values for the column
-    if col_order == None and col_mapping == None:
-        pass
-    elif col_mapping == None:
-        # if there is not col mapping but is col order, create a order_col based off col from raw data
-        df = df.assign(order_col=df[col_name].apply(lambda x: col_order[x]))
-    elif col_order != None:
-        # if there is a col mapping and col ordering, create order_col based off mapping
-        df = df.assign(order_col=df.name_col.apply(lambda x: col_order[x]))
+    # renaming index
+    if index_name == None:
+        pass 
     else:
+        df.index.name = index_name
+
+    # renaming results columns
+    if stats_names == None:
         pass
+    else:
+        df.columns = stats_names
+    timer.lap('rename', df)
+
+    # replace nulls with 0 in one step for the null_to_0 columns (or every column if True)
+    df = fill_null_stats(df, null_to_0)
+    timer.lap('null_to_0', df)
+
+    # turning the categorical margins labels back into plain index values
+    if margins_name != None:
+        df.index = plain_labels(df.index)
+
+    return df
+
+
+######################## PIVOTED RESULTS ##################################
+
+#####       SINGLE ROW INDEX SINGLE HEADER ROW              #####
+
+def col_pivot_row_combined_index_results(df, col_name, index_ordered_list, aggregations, col_mapping=None, col_order=None, index_mapping=None, \
+    index_name=None, null_to_0=False, normalize=None, margins=False, backend='pandas', compact_dtypes=False):
+
+    # this function will perform an analysis of the data by the col_name and index columns with groupby by col_name
+    # it will then reshape and clean the results table to a report-ready format
+
+    ## this function should be used when you have data in a column you wish to analyze by and then pivot so each
+    ## data label in that column is the heading of a column 
+    ###       ex: FY19-20, FY20-21, etc. that were in a single 'Fiscal Year' column
+    ## the data should also have values in multiple columns you wish to analyze and combine into one index
+    ###       ex: counts for 'inpatient', 'outpatient', 'emergency_care' columns to be combined into one 'Care Type' index
+     
+    # ARGUMENTS
+    
+    ## MANDATORY:
+    ### df is your dataframe to be analyzed
+    ### col_name is the column to perform the groupby with and whose values will become your column headers    
+    ### index_ordered_list is the list of columns you wish to make your index after groupby, in their desired order
+    ####        if you are using index_mapping to change the column names, this list MUST match the new names!
+    ### aggregations is the dictionary containing your analyses for the groupby
+    ####        if you are using index_mapping to change the column names, this dictionary MUST match the new names!
+    
+    ## OPTIONAL:
+    ### col_mapping is the dictionary to map your data values in col_name to you desired labels
+    ### col_order is the dictionary to map your desired labels to their desired order
+    ####    if you are using col_mapping, this dcitionary MUST match the new names!
+    ### index_mapping is the dictionary to map your index col names in your data to their desired labels
+    ### index_name is the name of your index 
+    ### null_to_0 will convert all nulls to 0 if True, or only in the rows of a list of index_ordered_list values. defaults to False
+    ### normalize will turn your results into shares of a total: 'column' (share of each col_name category),
+    ####        'row' (share of each row), 'total' (share of the grand total) or None. defaults to None
+    ### margins will add a total column across the col_name values, labelled 'Total' if True or with your own label. defaults to False
+    ### backend is what runs the groupby: 'pandas' or 'arrow' (pyarrow, multi-threaded). defaults to 'pandas'
+    ####        aggregations arrow does not have (anything but count, size, sum, min, max, mean and nunique) run on pandas
+    ### compact_dtypes will group on categorical codes and downcast integer measures, then restore the original dtypes
+    ####        (see compact_columns). can cut memory and groupby time on wide object-dtype extracts. defaults to False
 
-    ## drop the orginal data column and the one with names--will be remapped to the order column later
-    if col_mapping == None:
+    import pandas as pd
+
+    timer = stage_timer('col_pivot_row_combined_index_results', df)
+
+    # work on a lightweight frame holding only the columns this table needs, so your df is never changed
+    df = project_columns(df, [col_name] + list(aggregations), index_mapping)
+    timer.lap('project_columns', df)
+
+    # set up ordering for the pivot column
+
+    ## map the labels and the order onto the data values for the column in one step
+    ## with col_order the labels come back as an ordered categorical, so the groupby and pivot follow col_order
+    if col_mapping == None and col_order == None:
         pass 
     else:
-        # if there is no col order
-        if col_order == None:
-            # rename original column (code will break if you don't)
-            df.rename(columns={col_name:'temp'}, inplace=True)
-            # rename name_col to orignal column name
-            df.rename(columns={'name_col':col_name}, inplace=True)
-            # drop old column
-            df.drop(columns=['temp'], inplace=True)
-        else:
-            # if there IS an order column, then drop name_col
-            df.drop(columns=['name_col'], inplace=True)
+        df[col_name] = compile_label_mapper(col_mapping, col_order).map(df[col_name])
+    timer.lap('label_mapping', df)
+
+    # observed-only groupby, reindexed so every col_name category returns a row even if there is no data
+    if margin_label(margins) == None:
+        df = grouped_aggregate(df, [col_name], aggregations, backend, compact_dtypes)
+    else:
+        # the table's groups plus the total rolled up from the same grouped results
+        df = margin_aggregate(df, [col_name], aggregations, margin_label(margins), backend, compact_dtypes)
+    timer.lap('groupby', df)
+
+    # formatting the grouped results into the report table
+    return format_combined_index_results(df, col_name, index_ordered_list, index_name, null_to_0, normalize, margins)
+
+
+def format_combined_index_results(df, col_name, index_ordered_list, index_name=None, null_to_0=False, normalize=None, margins=False):
+
+    # this function will format grouped results into the col_pivot_row_combined_index_results table
+    ## it is everything col_pivot_row_combined_index_results does after the groupby, so the same table can be built from results grouped elsewhere
+    ## (ex: run_report_batch)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your grouped results, indexed by col_name, with one column per aggregation
+    ### col_name is the column the results were grouped by and whose values will become your column headers
+    ### index_ordered_list is the list of results columns to make your index, in their desired order
+
+    ## OPTIONAL
+    ### the rest of the arguments are the same as in col_pivot_row_combined_index_results
+
+    import pandas as pd
+
+    timer = stage_timer('format_combined_index_results', df)
+
+    # checks margins can be shown with normalize
+    margin_label(margins, normalize)
+
+    # shares of the total for each stat, before the stats become rows
+    df = normalize_shares(df[index_ordered_list], col_name, normalize)
+    timer.lap('normalize', df)
+
+    # reshaping data
+
+    # index_ordered_list results become the rows and col_name values become the columns, straight from the groupby result
+    ## the rows come out in index_ordered_list order, so no reordering is needed afterwards
+    df = combined_index_layout(df, col_name, index_ordered_list)
+    timer.lap('reshape', df)
+
+    # setting index name if necessary
+    if index_name == None:
+        df.index.name = 'variable'
+    else:
+        df.index.name = index_name
+
+    # turning ordered categorical col_order labels back into plain column headers
+    df.columns = plain_labels(df.columns)
+    timer.lap('rename', df)
+
+    # replace nulls with 0 in one step for the whole table if True (or only the null_to_0 rows for a list)
+    df = fill_null_stats(df, null_to_0, stats_axis='index')
+    timer.lap('null_to_0', df)
+
+    return df
+
+
+#####       TWO VAR ROW MULTIINDEX SINGLE HEADER ROW              #####
+
+
+def col_pivot_row_combined_multiindex_results(df, col_name, index_ordered_list, index_col, aggregations, col_mapping=None, col_order=None, index_mapping=None, \
+    index2_ordered_list=None, index1_name=None, index2_name=None, reorder_row_indices=True, pct_index1cat=False, null_to_0=False, \
+    normalize=None, margins=False, backend='pandas', compact_dtypes=False):
+
+    # this function will perform an analysis of the data by the col_name and index columns with groupby by col_name and index_col
+    # it will then reshape and clean the results table to a report-ready format
+
+    ## this function should be used when you have data in a column you wish to analyze by and then pivot so each
+    ## data label in that column is the heading of a column 
+    ###       ex: FY19-20, FY20-21, etc. that were in a single 'Fiscal Year' column
+    ## the data should also have values in multiple columns you wish to analyze and combine into one index
+    ###       ex: counts for 'inpatient', 'outpatient', 'emergency_care' columns to be combined into one 'Care Type' index
+    ## it should also have one categorical column to be used as index_col in the groupby (ex: a column for race or gender)
+     
+    # ARGUMENTS
+    
+    ## MANDATORY:
+    ### df is your dataframe to be analyzed
+    ### col_name is the column to perform the groupby with and whose values will become your column headers    
+    ### index_ordered_list is the list of columns you wish to make your index after groupby, in their desired order
+    ####        if you are using index_mapping to change the column names, this list MUST match the new names!
+    ### aggregations is the dictionary containing your analyses for the groupby
+    ####        if you are using index_mapping to change the column names, this dictionary MUST match the new names!
     
-    ## rename order column to original col name--order column should take precedence if it exists
-    if col_order == None:
+    ## OPTIONAL:
+    ### col_mapping is the dictionary to map your data values in col_name to you desired labels
+    ### col_order is the dictionary to map your desired labels to their desired order
+    ####    if you are using col_mapping, this dcitionary MUST match the new names!
+    ### index_mapping is the dictionary to map your index col names in your data to their desired labels
+    ### index2_ordered_list is the list of your index 2 values in order. while not mandatatory, highly recommended
+    ### index1_name is the name of your first index (created from the index_ordered_list columns)
+    ### index2_name is the name of your second index (created from the index_col)
+    ### reorder_row_indices will reorder your results df in ascending order for both indices. defaults to True
+    ####        this will reorder accourding to index_ordered_list (always) and index2_ordered_list (when present)
+    ### pct_index1cat will convert your data into percentage form per category in index1 for each column. defaults to False
+    ####        the same as normalize='column'
+    ### null_to_0 will convert all nulls to 0 if True, or only in the rows of a list of index_ordered_list values. defaults to False
+    ### normalize will turn your results into shares of a total: 'column' (share of each col_name category),
+    ####        'row' (share of each row), 'total' (share of the grand total) or None. defaults to None
+    ### margins will add a total column across the col_name values and a subtotal row under each index_ordered_list value,
+    ####        labelled 'Total' if True or with your own label. defaults to False
+    ####        the totals are rolled up from the grouped results instead of grouping the data again (see margin_aggregate)
+    ### backend is what runs the groupby: 'pandas' or 'arrow' (pyarrow, multi-threaded). defaults to 'pandas'
+    ####        aggregations arrow does not have (anything but count, size, sum, min, max, mean and nunique) run on pandas
+    ### compact_dtypes will group on categorical codes and downcast integer measures, then restore the original dtypes
+    ####        (see compact_columns). can cut memory and groupby time on wide object-dtype extracts. defaults to False
+
+    import pandas as pd
+
+    timer = stage_timer('col_pivot_row_combined_multiindex_results', df)
+
+    if reorder_row_indices == True and index2_ordered_list == None:
+        index2_ordered_list = [value for value in pd.unique(df[index_col])]
+    timer.lap('appearance_order', df)
+
+    # work on a lightweight frame holding only the columns this table needs, so your df is never changed
+    df = project_columns(df, [col_name, index_col] + list(aggregations), index_mapping)
+    timer.lap('project_columns', df)
+
+    # set up ordering for the pivot column
+
+    ## map the labels and the order onto the data values for the column in one step
+    ## with col_order the labels come back as an ordered categorical, so the groupby and pivot follow col_order
+    if col_mapping == None and col_order == None:
         pass 
     else:
-        # rename original column (code will break if you don't)
-        df.rename(columns={col_name:'temp'}, inplace=True)
-        # rename order_col to orignal column name
-        df.rename(columns={'order_col':col_name}, inplace=True)
-        # drop old column
-        df.drop(columns=['temp'], inplace=True)
-
-    # groupby var needs to be cateogorical so all rows return data even if there is none, which needs to be categorical dtype
-    ## but categorical dtype cols cannot be sorted
-    ## create a copy var and set that as categorical type
-    df['copy'] = df[col_name]
-    df['copy'] = df['copy'].astype('category') 
-
-    # groupby analysis
-    df = df.groupby([col_name, 'copy', index_col]).agg(aggregations)
-
-    # reset the index
-    df.reset_index(inplace=True)
-    # get rid of duplicates by only keeping rows where the copy matches the col_name
-    df = df[df[col_name]==df['copy']]
-    # drop the copy column
-    df.drop(columns=['copy'],inplace=True)
-    # set the index back to just col_name
-    df.set_index([col_name, index_col], inplace=True)
-
-    # if you do not have col_mapping but you do have col_order
-    if col_mapping == None and col_order != None:
-        # reset index to manipulate it
-        df.reset_index(inplace=True)   
-        # sort by col_order values ascending 
-        df.sort_values(by=[col_name], inplace=True)
-        # set index back in place
-        df.set_index([col_name], inplace=True)
-        # create dictionary to return order name to original data labels
-        index_rename = {v: k for k, v in col_order.items()}
-        # rename index values with dictionary
-        df.rename(index=index_rename, level=0, inplace=True)
+        df[col_name] = compile_label_mapper(col_mapping, col_order).map(df[col_name])
+    timer.lap('label_mapping', df)
+
+    # observed-only groupby, reindexed so every col_name category returns a row even if there is no data
+    if margin_label(margins) == None:
+        df = grouped_aggregate(df, [col_name, index_col], aggregations, backend, compact_dtypes)
     else:
-        pass
+        # the table's groups plus the total and subtotals rolled up from the same grouped results
+        df = margin_aggregate(df, [col_name, index_col], aggregations, margin_label(margins), backend, compact_dtypes)
+    timer.lap('groupby', df)
 
-    # setting names of stats columns
-    df.columns = stats_names
+    # formatting the grouped results into the report table
+    return format_combined_multiindex_results(df, col_name, index_ordered_list, index_col, index2_ordered_list, index1_name, index2_name, \
+        reorder_row_indices, pct_index1cat, null_to_0, normalize, margins)
+
+
+def format_combined_multiindex_results(df, col_name, index_ordered_list, index_col, index2_ordered_list=None, index1_name=None, index2_name=None, \
+    reorder_row_indices=True, pct_index1cat=False, null_to_0=False, normalize=None, margins=False):
+
+    # this function will format grouped results into the col_pivot_row_combined_multiindex_results table
+    ## it is everything col_pivot_row_combined_multiindex_results does after the groupby, so the same table can be built from results grouped elsewhere
+    ## (ex: run_report_batch)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your grouped results, indexed by col_name and index_col, with one column per aggregation
+    ### col_name is the column the results were grouped by and whose values will become your column headers
+    ### index_ordered_list is the list of results columns to make your first index, in their desired order
+    ### index_col is the column that will be your second index
+
+    ## OPTIONAL
+    ### the rest of the arguments are the same as in col_pivot_row_combined_multiindex_results
+
+    import pandas as pd
+
+    timer = stage_timer('format_combined_multiindex_results', df)
+
+    # pct_index1cat is the share of each col_name category for each index_ordered_list stat
+    if pct_index1cat == True and normalize == None:
+        normalize = 'column'
+    margins_name = margin_label(margins, normalize)
+
+    # shares of the total for each stat, before the stats become rows
+    df = normalize_shares(df[index_ordered_list], col_name, normalize)
+    timer.lap('normalize', df)
 
     # reshaping data
 
-    # code to convert from wide to long format, and then pivot so the timepoints are columns and locs are rows
+    # index_ordered_list results and index_col become the two row indices and col_name values become the columns,
+    ## straight from the groupby result
+    df = combined_index_layout(df, col_name, index_ordered_list)
+    timer.lap('reshape', df)
 
-    # the index must be reset to a normal column in order to manipulate the data
-    ## the inplace argument makes the change persist
-    df.reset_index(inplace=True)
+    # cleaning up dataframe
 
-    # wide to long format--must be done before a pivot is possible
-    ## will output a dataframe that gives a row with the index column and stats per index category per col_name category
-    df = pd.melt(df, 
-                 id_vars=[col_name, index_col], 
-                 value_vars=stats_names)
+    # reordering row indices
+    if reorder_row_indices == False:
+        # keep both indices in sorted order
+        df = reorder_rows(df, [sorted(index_ordered_list), None])
+    else:
+        # single reorder by the integer positions of both index levels in their ordered lists
+        df = reorder_rows(df, [index_ordered_list, index2_ordered_list])
+    timer.lap('reorder_rows', df)
 
-    # pivot--will assign the col_name values to the columns and the index values to the index row
-    df = df.pivot(index=index_col,columns=[col_name, 'variable'],values='value')
+    # renaming indices
+    if index1_name == None:
+        pass 
+    else:
+        df.index.set_names(index1_name, level=0, inplace=True)
 
-    # replace nulls with 0
-    if null_to_0 == None:
-        pass
+    if index2_name == None:
+        pass 
+    else:
+        df.index.set_names(index2_name, level=1, inplace=True)
+
+    # turning ordered categorical col_order labels back into plain column headers
+    df.columns = plain_labels(df.columns)
+
+    # turning the categorical margins labels back into plain index values
+    if margins_name != None:
+        df.index = plain_labels(df.index)
+    timer.lap('rename', df)
+
+    # replace nulls with 0 in one step for the whole table if True (or only the null_to_0 rows for a list)
+    df = fill_null_stats(df, null_to_0, stats_axis='index')
+    timer.lap('null_to_0', df)
+
+      
+    return df
+
+
+#####       SINGLE ROW INDEX DOUBLE HEADER ROW              #####
+
+def col_pivot_row_index_dbl_header_results(df, col_name, index_col, stats_names, aggregations, col_mapping=None, col_order=None, \
+    index_mapping=None, index_order=None, index_name=None, null_to_0=None, normalize=None, margins=False, backend='pandas', \
+    compact_dtypes=False):
+
+    # this function will perform an analysis of the data by the col_name and index_col with specificed aggregations 
+    # and groupby by col_name and index_col
+    ## it will then reshape and clean the results table to a report-ready format
+
+    ## this function should be used when you have data in a column you wish to analyze by and then pivot so each
+    ## data label in that column is the heading of a column 
+    ###       ex: FY19-20, FY20-21, etc. that were in a single 'Fiscal Year' column
+    ## the data should also have values in an index column
+    ###       ex: months in a month column for 'Jan', 'Feb', 'Mar' etc
+     
+    # ARGUMENTS
+    
+    ## MANDATORY:
+    ### df is your dataframe to be analyzed
+    ### col_name is the column to perform the groupby with and whose values will become your column headers    
+    ### index_col is the column that will be your row index
+    ### stats_names is your list of what each analysis should be called in your able, in desired order
+    ####        MUST be in the same order as your aggregations!
+    ### aggregations is the dictionary containing your analyses for the groupby, in desired order
+    ####        MUST be in the same order as stats_names!
+    
+    ## OPTIONAL:
+    ### col_mapping is the dictionary to map your data values in col_name to you desired labels
+    ### col_order is the dictionary to map your desired labels to their desired order
+    ####    if you are using col_mapping, this dcitionary MUST match the new names!
+    ### index_mapping is the dictionary to map your index col names in your data to their desired labels
+    ### index_order is the list of index values in the order you want them to be in
+    ####    if you are changing your index values with index_mapping, they MUST match the new values!
+    ### index_name is the name of your index
+    ### null_to_0 is your list of stats (matching stats_names) to convert nulls to 0s, or True for every column. defaults to None
+    ### normalize will turn your results into shares of a total: 'column' (share of each col_name category),
+    ####        'row' (share of each row), 'total' (share of the grand total) or None. defaults to None
+    ### margins will add a total column across the col_name values and a total row, labelled 'Total' if True or with your own label.
+    ####        defaults to False
+    ### backend is what runs the groupby: 'pandas' or 'arrow' (pyarrow, multi-threaded). defaults to 'pandas'
+    ####        aggregations arrow does not have (anything but count, size, sum, min, max, mean and nunique) run on pandas
+    ### compact_dtypes will group on categorical codes and downcast integer measures, then restore the original dtypes
+    ####        (see compact_columns). can cut memory and groupby time on wide object-dtype extracts. defaults to False
+
+    import pandas as pd
+
+    timer = stage_timer('col_pivot_row_index_dbl_header_results', df)
+
+    # work on a lightweight frame holding only the columns this table needs, so your df is never changed
+    df = project_columns(df, [col_name, index_col] + list(aggregations))
+    timer.lap('project_columns', df)
+
+    # set up ordering for the pivot column
+
+    ## map the labels and the order onto the data values for the column in one step
+    ## with col_order the labels come back as an ordered categorical, so the groupby and pivot follow col_order
+    if col_mapping == None and col_order == None:
+        pass 
+    else:
+        df[col_name] = compile_label_mapper(col_mapping, col_order).map(df[col_name])
+    timer.lap('label_mapping', df)
+
+    # observed-only groupby, reindexed so every col_name category returns a row even if there is no data
+    if margin_label(margins) == None:
+        df = grouped_aggregate(df, [col_name, index_col], aggregations, backend, compact_dtypes)
     else:
-        for null_col_name in null_to_0:
-            for col_num, df_col_name in enumerate(df.columns):
-                if null_col_name == df_col_name:
-                    df[df_col_name] = df[df_col_name].fillna(0)   
+        # the table's groups plus the total and subtotals rolled up from the same grouped results
+        df = margin_aggregate(df, [col_name, index_col], aggregations, margin_label(margins), backend, compact_dtypes)
+    timer.lap('groupby', df)
+
+    # formatting the grouped results into the report table
+    return format_index_dbl_header_results(df, col_name, index_col, stats_names, index_mapping, index_order, index_name, null_to_0, \
+        normalize, margins)
+
+
+def format_index_dbl_header_results(df, col_name, index_col, stats_names, index_mapping=None, index_order=None, index_name=None, null_to_0=None, \
+    normalize=None, margins=False):
+
+    # this function will format grouped results into the col_pivot_row_index_dbl_header_results table
+    ## it is everything col_pivot_row_index_dbl_header_results does after the groupby, so the same table can be built from results grouped elsewhere
+    ## (ex: run_report_batch)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your grouped results, indexed by col_name and index_col, with one column per aggregation
+    ### col_name is the column the results were grouped by and whose values will become your column headers
+    ### index_col is the column that will be your row index
+    ### stats_names is your list of what each analysis should be called in your table, in the same order as the results columns
+
+    ## OPTIONAL
+    ### the rest of the arguments are the same as in col_pivot_row_index_dbl_header_results
+
+    import pandas as pd
+
+    timer = stage_timer('format_index_dbl_header_results', df)
+
+    # the total row keeps its label through index_mapping
+    margins_name = margin_label(margins, normalize)
+    if margins_name != None and index_mapping != None:
+        index_mapping = {**index_mapping, margins_name: margins_name}
+
+    # shares of the total for each stat
+    df = normalize_shares(df, col_name, normalize)
+    timer.lap('normalize', df)
+
+    # setting names of stats columns
+    df.columns = stats_names
+
+    # reshaping data
+
+    # col_name values become the top column header with the stats under each of them, and the index columns become the rows,
+    ## straight from the groupby result
+    df = double_header_layout(df, col_name)
+    timer.lap('reshape', df)
+
+    # replace nulls with 0 in one step for the null_to_0 stats under every col_name value (or every column if True)
+    df = fill_null_stats(df, null_to_0, stats_level='variable')
+    timer.lap('null_to_0', df)
     
     # cleaning up dataframe
 
-    # this will resort the columns to keep header level 0 values together
-    ## list of columns in desired order created with sorted()
-    col_names = sorted(df)
-    ## column ordering list applied to dataframe with reindex()
-    df = df.reindex(columns=col_names)
-    ## making our stats columns in the right order after using sorted() to fix level 0
-    df = df.reindex(stats_names, axis=1, level=1)
+    # this will reorder the columns in one step to keep header level 0 values together in col_name order
+    ## (col_order when it is given), with the stats columns in stats_names order under each of them
+    df = reorder_columns(df, [list(df.columns.levels[0]), stats_names])
    
-    # relabeling columns without leading number
-   
-    if col_mapping == None:    
-        pass
-    elif col_order == None:
-        pass
-    else:        
-        # reverse key and value pairs of col_order dict
-        col_rename = {v: k for k, v in col_order.items()}  
-        # putting labels back on columns
-        df.rename(columns=col_rename, inplace=True) 
+    # turning ordered categorical col_order labels back into plain column headers
+    df.columns = plain_labels(df.columns)
+    timer.lap('reorder_columns', df)
 
     # renaming index values
     if index_mapping == None:
@@ -755,22 +2843,16 @@ def col_pivot_row_index_dbl_header_results(df, col_name, index_col, stats_names,
             df[index_col] = df[index_col].map(index_mapping)
             # set the index back
             df.set_index(index_col, inplace=True)
+    timer.lap('index_mapping', df)
 
     # # code to order the index values in the order they are meant to be in for visualization and reporting
 
     if index_order == None:
         pass
     else:
-        # must reset index to manipulate it
-        df.reset_index(inplace=True)
-        # assigning int value to each index value in ascending order
-        mapping = {index_order: i for i, index_order in enumerate(index_order)}
-        # mapping those int values onto the index variable to create a key
-        key = df[index_col].map(mapping)
-        # reordering the dataframe by the key
-        df = df.iloc[key.argsort()]
-        # setting index
-        df.set_index(index_col, inplace=True)
+        # single reorder by each index value's integer position in index_order
+        df = reorder_rows(df, [index_order])
+    timer.lap('reorder_rows', df)
 
     # set index name
     if index_name == None:
@@ -784,6 +2866,11 @@ def col_pivot_row_index_dbl_header_results(df, col_name, index_col, stats_names,
     # assign that to the df columns
     df.columns = header_cols
 
+    # turning the categorical margins labels back into plain index values
+    if margins_name != None:
+        df.index = plain_labels(df.index)
+    timer.lap('rename', df)
+
     return df
 
 
@@ -792,7 +2879,8 @@ def col_pivot_row_index_dbl_header_results(df, col_name, index_col, stats_names,
 
 def col_pivot_row_multiindex_dbl_header_results(df, col_name, index1_col, index2_col, stats_names, aggregations, col_mapping=None, col_order=None, \
     index1_mapping=None, index1_ordered_list=None, index1_name=None, index2_mapping=None, index2_ordered_list=None, index2_name=None, \
-    null_to_0=None, reorder_row_indices=True):
+    null_to_0=None, reorder_row_indices=True, normalize=None, margins=False, n_jobs=1, n_partitions=None, backend='pandas', \
+    compact_dtypes=False):
 
     # this function will perform an analysis of the data by the col_name and index_col with specificed aggregations 
     # and groupby by col_name and index_col
@@ -828,12 +2916,26 @@ def col_pivot_row_multiindex_dbl_header_results(df, col_name, index1_col, index2
     ### index2_ordered_list is the list of your second index values in the order you want them to be in
     ####    if you are changing your second index values with index2_mapping, they MUST match the new values!
     ### index2_name is the name of your second index  
-    ### null_to_0 is your list of columns (matching stats_names) to convert nulls to 0s. defaults to None    
+    ### null_to_0 is your list of stats (matching stats_names) to convert nulls to 0s, or True for every column. defaults to None
     ### reorder_row_indices will reorder your results df in ascending order for both indices. defaults to True
     ####        this will reorder accourding to index_ordered_list (when present) and index2_ordered_list (when present)      
+    ### n_jobs is the number of worker processes to run the groupby in. defaults to 1 (no worker processes)
+    ####        the rows are split by a hash of index1_col and index2_col, so the results are exactly the same as with 1
+    ### n_partitions is the number of pieces the rows are split into when n_jobs is more than 1. defaults to 4 per worker
+    ### normalize will turn your results into shares of a total: 'column' (share of each col_name category),
+    ####        'row' (share of each row), 'total' (share of the grand total) or None. defaults to None
+    ### margins will add a total column across the col_name values, a subtotal row under each index1_col value and a total row,
+    ####        labelled 'Total' if True or with your own label. defaults to False
+    ####        the totals are rolled up from the grouped results instead of grouping the data again (see margin_aggregate)
+    ### backend is what runs the groupby: 'pandas' or 'arrow' (pyarrow, multi-threaded). defaults to 'pandas'
+    ####        aggregations arrow does not have (anything but count, size, sum, min, max, mean and nunique) run on pandas
+    ### compact_dtypes will group on categorical codes and downcast integer measures, then restore the original dtypes
+    ####        (see compact_columns). can cut memory and groupby time on wide object-dtype extracts. defaults to False
 
     import pandas as pd
 
+    timer = stage_timer('col_pivot_row_multiindex_dbl_header_results', df)
+
     if reorder_row_indices == True and index1_ordered_list == None:
         index1_ordered_list = [value for value in pd.unique(df[index1_col])]
     else:
@@ -843,139 +2945,99 @@ def col_pivot_row_multiindex_dbl_header_results(df, col_name, index1_col, index2
         index2_ordered_list = [value for value in pd.unique(df[index2_col])]
     else:
         pass 
+    timer.lap('appearance_order', df)
+
+    # work on a lightweight frame holding only the columns this table needs, so your df is never changed
+    df = project_columns(df, [col_name, index1_col, index2_col] + list(aggregations))
+    timer.lap('project_columns', df)
 
     # set up ordering for the pivot column
 
-    ## map the labels to the data values for the column
-    if col_mapping == None:
+    ## map the labels and the order onto the data values for the column in one step
+    ## with col_order the labels come back as an ordered categorical, so the groupby and pivot follow col_order
+    if col_mapping == None and col_order == None:
         pass 
     else:
-        # create a name_col with label values
-        df = df.assign(name_col=df[col_name].apply(lambda x: col_mapping[x]))
-
-    ## map the order to the label values for the column
-    if col_order == None and col_mapping == None:
-        pass
-    elif col_mapping == None:
-        # if there is not col mapping but is col order, create a order_col based off col from raw data
-        df = df.assign(order_col=df[col_name].apply(lambda x: col_order[x]))
-    elif col_order != None:
-        # if there is a col mapping and col ordering, create order_col based off mapping
-        df = df.assign(order_col=df.name_col.apply(lambda x: col_order[x]))
+        df[col_name] = compile_label_mapper(col_mapping, col_order).map(df[col_name])
+    timer.lap('label_mapping', df)
+
+    # observed-only groupby, reindexed so every col_name category returns a row even if there is no data
+    if margin_label(margins) != None:
+        # the table's groups plus the total and subtotals rolled up from the same grouped results
+        df = margin_aggregate(df, [col_name, index1_col, index2_col], aggregations, margin_label(margins), backend, compact_dtypes, \
+            [index1_col, index2_col], n_jobs, n_partitions)
+    elif n_jobs == 1:
+        df = grouped_aggregate(df, [col_name, index1_col, index2_col], aggregations, backend, compact_dtypes)
     else:
-        pass
+        # groupby split by the row index columns across worker processes
+        df = partitioned_grouped_aggregate(df, [col_name, index1_col, index2_col], aggregations, [index1_col, index2_col], \
+            n_jobs, n_partitions, backend, compact_dtypes)
+    timer.lap('groupby', df)
 
-    ## drop the orginal data column and the one with names--will be remapped to the order column later
-    if col_mapping == None:
-        pass 
-    else:
-        # if there is no col order
-        if col_order == None:
-            # rename original column (code will break if you don't)
-            df.rename(columns={col_name:'temp'}, inplace=True)
-            # rename name_col to orignal column name
-            df.rename(columns={'name_col':col_name}, inplace=True)
-            # drop old column
-            df.drop(columns=['temp'], inplace=True)
-        else:
-            # if there IS an order column, then drop name_col
-            df.drop(columns=['name_col'], inplace=True)
-    
-    ## rename order column to original col name--order column should take precedence if it exists
-    if col_order == None:
-        pass 
-    else:
-        # rename original column (code will break if you don't)
-        df.rename(columns={col_name:'temp'}, inplace=True)
-        # rename order_col to orignal column name
-        df.rename(columns={'order_col':col_name}, inplace=True)
-        # drop old column
-        df.drop(columns=['temp'], inplace=True)
-
-    # groupby var needs to be cateogorical so all rows return data even if there is none, which needs to be categorical dtype
-    ## but categorical dtype cols cannot be sorted
-    ## create a copy var and set that as categorical type
-    df['copy'] = df[col_name]
-    df['copy'] = df['copy'].astype('category') 
-
-    # groupby analysis
-    df = df.groupby([col_name, 'copy', index1_col, index2_col]).agg(aggregations)
-
-    # reset the index
-    df.reset_index(inplace=True)
-    # get rid of duplicates by only keeping rows where the copy matches the col_name
-    df = df[df[col_name]==df['copy']]
-    # drop the copy column
-    df.drop(columns=['copy'],inplace=True)
-    # set the index back to just col_name
-    df.set_index([col_name, index1_col, index2_col], inplace=True)    
-
-    # if you do not have col_mapping but you do have col_order
-    if col_mapping == None and col_order != None:
-        # reset index to manipulate it
-        df.reset_index(inplace=True)   
-        # sort by col_order values ascending 
-        df.sort_values(by=[col_name], inplace=True)
-        # set index back in place
-        df.set_index([col_name], inplace=True)
-        # create dictionary to return order name to original data labels
-        index_rename = {v: k for k, v in col_order.items()}
-        # rename index values with dictionary
-        df.rename(index=index_rename, level=0, inplace=True)
-    else:
-        pass
+    # formatting the grouped results into the report table
+    return format_multiindex_dbl_header_results(df, col_name, index1_col, index2_col, stats_names, index1_mapping, index1_ordered_list, \
+        index1_name, index2_mapping, index2_ordered_list, index2_name, null_to_0, reorder_row_indices, normalize, margins)
 
-    # setting names of stats columns
-    df.columns = stats_names
 
-    # reshaping data
+def format_multiindex_dbl_header_results(df, col_name, index1_col, index2_col, stats_names, index1_mapping=None, index1_ordered_list=None, index1_name=None, \
+    index2_mapping=None, index2_ordered_list=None, index2_name=None, null_to_0=None, reorder_row_indices=True, normalize=None, \
+    margins=False):
+
+    # this function will format grouped results into the col_pivot_row_multiindex_dbl_header_results table
+    ## it is everything col_pivot_row_multiindex_dbl_header_results does after the groupby, so the same table can be built from results grouped elsewhere
+    ## (ex: run_report_batch)
 
-    # code to convert from wide to long format, and then pivot so the timepoints are columns and locs are rows
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your grouped results, indexed by col_name, index1_col and index2_col, with one column per aggregation
+    ### col_name is the column the results were grouped by and whose values will become your column headers
+    ### index1_col is the column that will be your first row index
+    ### index2_col is the column that will be your second row index
+    ### stats_names is your list of what each analysis should be called in your table, in the same order as the results columns
 
-    # the index must be reset to a normal column in order to manipulate the data
-    ## the inplace argument makes the change persist
-    df.reset_index(inplace=True)
+    ## OPTIONAL
+    ### the rest of the arguments are the same as in col_pivot_row_multiindex_dbl_header_results
 
-    # wide to long format--must be done before a pivot is possible
-    ## will output a dataframe that gives a row with the index column and stats per index category per col_name category
-    df = pd.melt(df, 
-                 id_vars=[col_name, index1_col, index2_col], 
-                 value_vars=stats_names)
+    import pandas as pd
 
-    # pivot--will assign the col_name values to the columns and the index values to the index row
-    df = df.pivot(index=[index1_col, index2_col],columns=[col_name, 'variable'],values='value')
+    timer = stage_timer('format_multiindex_dbl_header_results', df)
 
-    # replace nulls with 0
-    if null_to_0 == None:
-        pass
-    else:
-        for null_col_name in null_to_0:
-            for col_num, df_col_name in enumerate(df.columns):
-                if null_col_name in df_col_name:
-                    df[df_col_name] = df[df_col_name].fillna(0)
+    # the subtotal and total rows keep their label through the index mappings
+    margins_name = margin_label(margins, normalize)
+    if margins_name != None and index1_mapping != None:
+        index1_mapping = {**index1_mapping, margins_name: margins_name}
+    if margins_name != None and index2_mapping != None:
+        index2_mapping = {**index2_mapping, margins_name: margins_name}
+
+    # shares of the total for each stat
+    df = normalize_shares(df, col_name, normalize)
+    timer.lap('normalize', df)
+
+    # setting names of stats columns
+    df.columns = stats_names
+
+    # reshaping data
+
+    # col_name values become the top column header with the stats under each of them, and the index columns become the rows,
+    ## straight from the groupby result
+    df = double_header_layout(df, col_name)
+    timer.lap('reshape', df)
+
+    # replace nulls with 0 in one step for the null_to_0 stats under every col_name value (or every column if True)
+    df = fill_null_stats(df, null_to_0, stats_level='variable')
+    timer.lap('null_to_0', df)
             
     
     # cleaning up dataframe
 
-    # this will resort the columns to keep header level 0 values together
-    ## list of columns in desired order created with sorted()
-    col_names = sorted(df)
-    ## column ordering list applied to dataframe with reindex()
-    df = df.reindex(columns=col_names)
-    ## making our stats columns in the right order after using sorted() to fix level 0
-    df = df.reindex(stats_names, axis=1, level=1)
+    # this will reorder the columns in one step to keep header level 0 values together in col_name order
+    ## (col_order when it is given), with the stats columns in stats_names order under each of them
+    df = reorder_columns(df, [list(df.columns.levels[0]), stats_names])
    
-    # relabeling columns without leading number
-   
-    if col_mapping == None:    
-        pass
-    elif col_order == None:
-        pass
-    else:        
-        # reverse key and value pairs of col_order dict
-        col_rename = {v: k for k, v in col_order.items()}  
-        # putting labels back on columns
-        df.rename(columns=col_rename, inplace=True) 
+    # turning ordered categorical col_order labels back into plain column headers
+    df.columns = plain_labels(df.columns)
+    timer.lap('reorder_columns', df)
 
     # renaming index values
     if index1_mapping == None:
@@ -1023,6 +3085,7 @@ def col_pivot_row_multiindex_dbl_header_results(df, col_name, index1_col, index2
             df[index2_col] = df[index2_col].map(index2_mapping)
             # set the index back
             df.set_index([index1_col, index2_col], inplace=True)
+    timer.lap('index_mapping', df)
     
     # # code to order the index values in the order they are meant to be in for visualization and reporting
 
@@ -1030,27 +3093,9 @@ def col_pivot_row_multiindex_dbl_header_results(df, col_name, index1_col, index2
     if reorder_row_indices == False:
         pass 
     else:
-        # must reset index to manipulate it
-        df.reset_index(inplace=True)
-        
-        # assigning int value to each index value in ascending order
-        mapping1 = {index_order: i for i, index_order in enumerate(index1_ordered_list)}
-        mapping2 = {index_order: i for i, index_order in enumerate(index2_ordered_list)}
-        
-        # mapping those int values onto the index variable to create a key
-        key1 = df[index1_col].map(mapping1)
-        key2 = df[index2_col].map(mapping2)
-        
-        # reordering the dataframe by the key
-        ## creating int columns based off key values (iloc method will not work for multiindex reordering more than one of the indices)
-        df['key1'] = key1
-        df['key2'] = key2
-
-        # sorting by the new columns and then dropping them
-        df.sort_values(by=['key1','key2'], inplace=True)
-        df.drop(['key1','key2'], axis=1, inplace=True)
-        # setting the index back
-        df.set_index([index1_col, index2_col], inplace=True)
+        # single reorder by the integer positions of both index levels in their ordered lists
+        df = reorder_rows(df, [index1_ordered_list, index2_ordered_list])
+    timer.lap('reorder_rows', df)
     
     # renaming indices
     if index1_name == None:
@@ -1070,4 +3115,777 @@ def col_pivot_row_multiindex_dbl_header_results(df, col_name, index1_col, index2
     # assign that to the df columns
     df.columns = header_cols
 
-    return df
\ No newline at end of file
+    # turning the categorical margins labels back into plain index values
+    if margins_name != None:
+        df.index = plain_labels(df.index)
+    timer.lap('rename', df)
+
+    return df
+
+
+
+
+######################## BATCH REPORTS ##################################
+
+# how each table function is laid out, so tables can be planned and built from shared grouped results
+## index_args are the arguments naming the row index columns grouped with col_name
+## column_mapping_arg is the argument that renames data columns before the groupby (if any)
+## format_args are the arguments passed on to the table's format function
+## appearance_orders are the ordered list arguments that default to the order values appear in the data
+TABLE_LAYOUTS = {
+    'simple_groupby': {
+        'index_args': [],
+        'column_mapping_arg': None,
+        'format': format_simple_groupby,
+        'format_args': ['col_name', 'index_mapping', 'index_ordered_list', 'index_name', 'stats_names', 'null_to_0', 'margins'],
+        'appearance_orders': {},
+    },
+    'col_pivot_row_combined_index_results': {
+        'index_args': [],
+        'column_mapping_arg': 'index_mapping',
+        'format': format_combined_index_results,
+        'format_args': ['col_name', 'index_ordered_list', 'index_name', 'null_to_0', 'normalize', 'margins'],
+        'appearance_orders': {},
+    },
+    'col_pivot_row_combined_multiindex_results': {
+        'index_args': ['index_col'],
+        'column_mapping_arg': 'index_mapping',
+        'format': format_combined_multiindex_results,
+        'format_args': ['col_name', 'index_ordered_list', 'index_col', 'index2_ordered_list', 'index1_name', 'index2_name', \
+            'reorder_row_indices', 'pct_index1cat', 'null_to_0', 'normalize', 'margins'],
+        'appearance_orders': {'index2_ordered_list': 'index_col'},
+    },
+    'col_pivot_row_index_dbl_header_results': {
+        'index_args': ['index_col'],
+        'column_mapping_arg': None,
+        'format': format_index_dbl_header_results,
+        'format_args': ['col_name', 'index_col', 'stats_names', 'index_mapping', 'index_order', 'index_name', 'null_to_0', 'normalize', \
+            'margins'],
+        'appearance_orders': {},
+    },
+    'col_pivot_row_multiindex_dbl_header_results': {
+        'index_args': ['index1_col', 'index2_col'],
+        'column_mapping_arg': None,
+        'format': format_multiindex_dbl_header_results,
+        'format_args': ['col_name', 'index1_col', 'index2_col', 'stats_names', 'index1_mapping', 'index1_ordered_list', \
+            'index1_name', 'index2_mapping', 'index2_ordered_list', 'index2_name', 'null_to_0', 'reorder_row_indices', 'normalize', \
+            'margins'],
+        'appearance_orders': {'index1_ordered_list': 'index1_col', 'index2_ordered_list': 'index2_col'},
+    },
+}
+
+
+def table_plan(function, kwargs):
+
+    # this function will describe one table: which data columns it groups and aggregates and how it is formatted
+    ## the arguments are checked against the table function and filled in with its defaults
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### function is the table function (or its name), ex: simple_groupby or 'col_pivot_row_combined_index_results'
+    ### kwargs is the dictionary of arguments you would pass to the function, without df
+
+    import inspect
+
+    if isinstance(function, str):
+        function = globals()[function]
+
+    layout = TABLE_LAYOUTS[function.__name__]
+
+    # bind the arguments like a call would, so missing or unknown arguments fail the same way
+    bound = inspect.signature(function).bind(None, **kwargs)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    arguments.pop('df')
+
+    # data column names for anything renamed before the groupby
+    column_mapping = None
+    if layout['column_mapping_arg'] != None:
+        column_mapping = arguments[layout['column_mapping_arg']]
+    raw_names = {}
+    if column_mapping != None:
+        raw_names = {new_name: df_col_name for df_col_name, new_name in column_mapping.items()}
+
+    col_name = arguments['col_name']
+    group_cols = [col_name] + [arguments[index_arg] for index_arg in layout['index_args']]
+    aggregations = arguments['aggregations']
+
+    return {
+        'function': function,
+        'layout': layout,
+        'arguments': arguments,
+        'col_name': col_name,
+        'group_cols': group_cols,
+        'aggregations': aggregations,
+        'column_mapping': column_mapping,
+        'raw_group_cols': [raw_names.get(group_col, group_col) for group_col in group_cols],
+        'raw_aggregations': {raw_names.get(agg_col, agg_col): agg_funcs for agg_col, agg_funcs in aggregations.items()},
+        'label_mapper': compile_label_mapper(arguments.get('col_mapping'), arguments.get('col_order')),
+    }
+
+
+def table_from_partials(partials, plan):
+
+    # this function will build one table from shared partial aggregates instead of grouping the data again
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### partials is the PartialAggregates grouped by (at least) every column the table groups by
+    ### plan is the table description from table_plan
+
+    import pandas as pd
+
+    layout = plan['layout']
+    arguments = dict(plan['arguments'])
+
+    # ordered lists that default to the order values appear in the data (partials keep groups in order of first appearance)
+    raw_names = dict(zip(plan['group_cols'], plan['raw_group_cols']))
+    for order_arg, index_arg in layout['appearance_orders'].items():
+        if arguments['reorder_row_indices'] == True and arguments[order_arg] == None:
+            index_values = partials.frame.index.get_level_values(raw_names[arguments[index_arg]])
+            arguments[order_arg] = [value for value in pd.unique(index_values)]
+
+    # roll the shared partials up to this table's groups, relabeling col_name on the small grouped frame
+    regrouped = partials.regroup(plan['raw_group_cols'], plan['col_name'], plan['label_mapper'], plan['column_mapping'])
+    regrouped.frame.index = regrouped.frame.index.set_names(plan['group_cols'])
+    grouped = regrouped.finalize(plan['aggregations'])
+
+    # the total and subtotals are rolled up from the same partials
+    margins_name = margin_label(arguments['margins'])
+    if margins_name != None:
+        grouped = stack_margins([grouped] + partial_margins(regrouped, plan['aggregations'], margins_name), plan['group_cols'], margins_name)
+
+    return layout['format'](grouped, **{format_arg: arguments[format_arg] for format_arg in layout['format_args']})
+
+
+def run_report_batch(df, table_specs):
+
+    # this function will build many tables from the same dataframe with one groupby pass over the data
+    ## the finest grouping every table needs (all of their col_name and index columns together) is aggregated once
+    ## into partial aggregates, and each table is then rolled up from those, so the data is scanned once per batch
+    ## tables with aggregations that cannot be rolled up (ex: pd.Series.nunique or 'median') are run on their own
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### table_specs is the list of (function, kwargs) pairs, one per table
+    ####        function is one of the table functions (or its name) and kwargs are its arguments without df
+    ####        ex: [(simple_groupby, {'col_name': 'fiscal_year', 'aggregations': {'member_id': 'count'}}), ...]
+
+    # returns the list of tables in the same order as table_specs
+
+    plans = [table_plan(function, kwargs) for function, kwargs in table_specs]
+    shared_plans = [plan for plan in plans if len(unmergeable_aggregations(plan['raw_aggregations'])) == 0]
+
+    # one pass over the data for every table that can share it
+    if len(shared_plans) > 0:
+        group_cols = []
+        stats = []
+        for plan in shared_plans:
+            group_cols += [group_col for group_col in plan['raw_group_cols'] if group_col not in group_cols]
+            stats += [stat for stat in partial_stats(plan['raw_aggregations']) if stat not in stats]
+        projected = project_columns(df, group_cols + [agg_col for agg_col, stat in stats])
+        partials = PartialAggregates.from_frame(projected, group_cols, stats)
+
+    tables = []
+    for plan in plans:
+        if any(plan is shared_plan for shared_plan in shared_plans):
+            tables.append(table_from_partials(partials, plan))
+        else:
+            tables.append(plan['function'](df, **plan['arguments']))
+
+    return tables
+
+
+######################## CONCURRENT REPORTS ##################################
+
+def run_report_pool(table_specs, max_workers=None, timeout=None):
+
+    # this function will run many independent tables on a pool of threads and hand each one back as soon as it is done
+    ## most of the time in a table call is spent in pandas and numpy, which let other threads run in the meantime,
+    ## so a pack of small tables over different dataframes finishes sooner than calling them one after another
+    ## a table that raises an error (ex: a value missing from its col_mapping) does not stop the others, its error is
+    ## handed back in its place. a table that runs past its timeout is handed back as a TimeoutError, but python cannot
+    ## stop a running thread, so it keeps its worker until it finishes on its own
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### table_specs is the list of (function, kwargs) or (function, kwargs, timeout) specs, one per table
+    ####        function is one of the table functions (or its name) and kwargs are its arguments INCLUDING df
+    ####        timeout is the number of seconds that table may run for, and overrides the timeout argument
+
+    ## OPTIONAL
+    ### max_workers is the number of threads. defaults to the concurrent.futures default
+    ### timeout is the number of seconds each table may run for, counted from when it starts. defaults to None (no limit)
+
+    # yields (position, table, error) as each table finishes, where position is its place in table_specs
+    ## error is None when the table was built, otherwise table is None and error is the exception it raised
+    # ex: for position, table, error in run_report_pool(specs, max_workers=8, timeout=60):
+
+    import concurrent.futures
+    import time
+
+    started = {}
+
+    def run_spec(position, function, kwargs):
+        started[position] = time.monotonic()
+        if isinstance(function, str):
+            function = globals()[function]
+        return function(**kwargs)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    futures = {}
+    timeouts = {}
+    for position, table_spec in enumerate(table_specs):
+        timeouts[position] = timeout
+        if len(table_spec) > 2:
+            timeouts[position] = table_spec[2]
+        futures[executor.submit(run_spec, position, table_spec[0], table_spec[1])] = position
+
+    pending = set(futures)
+    try:
+        while len(pending) > 0:
+
+            # hand back the tables past their timeout, and wait no longer than the next timeout
+            wait_for = None
+            now = time.monotonic()
+            for future in list(pending):
+                position = futures[future]
+                if timeouts[position] == None or future.done():
+                    continue
+                if position not in started:
+                    # not started yet, check back shortly for when it does
+                    wait_for = 0.05 if wait_for == None else min(wait_for, 0.05)
+                    continue
+                remaining = started[position] + timeouts[position] - now
+                if remaining <= 0:
+                    pending.remove(future)
+                    yield position, None, TimeoutError('table ' + str(position) + ' ran for more than ' \
+                        + str(timeouts[position]) + ' seconds')
+                else:
+                    wait_for = remaining if wait_for == None else min(wait_for, remaining)
+
+            if len(pending) == 0:
+                break
+
+            done, pending = concurrent.futures.wait(pending, timeout=wait_for, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error == None:
+                    yield futures[future], future.result(), None
+                else:
+                    yield futures[future], None, error
+    finally:
+        # don't wait on tables past their timeout (or left behind when the caller stops early)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+######################## INCREMENTAL AGGREGATION ##################################
+
+class IncrementalTable:
+
+    # this class will keep one table up to date as new rows arrive, without going back over rows it has already seen
+    ## it holds mergeable partial aggregates per group (counts, sums, mins, maxes, means as sum and count, and the
+    ## distinct values behind distinct counts), merges each new batch of rows into them, and builds the same table
+    ## the table function would give for all of the rows seen so far
+    ## aggregations that cannot be merged (ex: 'median' or a lambda) are rejected when the table is created
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### function is the table function (or its name), ex: col_pivot_row_multiindex_dbl_header_results
+    ### kwargs is the dictionary of arguments you would pass to the function, without df
+
+    # ex: table = IncrementalTable(simple_groupby, {'col_name': 'fiscal_year', 'aggregations': {'paid': 'sum'}})
+    ##    table.update(new_rows)
+    ##    report = table.render()
+
+    def __init__(self, function, kwargs):
+        self.plan = table_plan(function, kwargs)
+        self.partials = None
+        self.rows_seen = 0
+
+        unmergeable = unmergeable_aggregations(self.plan['raw_aggregations'])
+        if len(unmergeable) > 0:
+            raise ValueError('these aggregations cannot be merged across batches: ' + \
+                ', '.join('%s: %s' % (agg_col, getattr(agg_func, '__name__', agg_func)) for agg_col, agg_func in unmergeable))
+
+    def update(self, df):
+
+        # this method will merge a new batch of rows into the table
+
+        group_cols = self.plan['raw_group_cols']
+        stats = partial_stats(self.plan['raw_aggregations'])
+        projected = project_columns(df, group_cols + [agg_col for agg_col, stat in stats])
+        batch_partials = PartialAggregates.from_frame(projected, group_cols, stats)
+
+        if self.partials == None:
+            self.partials = batch_partials
+        else:
+            self.partials = self.partials.merge(batch_partials)
+        self.rows_seen += len(df)
+
+    def render(self):
+
+        # this method will return the table for every row seen so far
+
+        if self.partials == None:
+            raise ValueError('no rows have been added yet, call update first')
+        return table_from_partials(self.partials, self.plan)
+
+
+######################## STREAMING ##################################
+
+def read_in_chunks(source, columns, chunksize=1000000):
+
+    # this function will read a data source one chunk of rows at a time, keeping only the columns needed
+    ## source can be a path to a csv file (.csv, .txt, optionally compressed ex: .csv.gz) or a parquet file (.parquet, .pq),
+    ## or any iterable of dataframes you already have (ex: pd.read_sql(..., chunksize=...))
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### source is the file path or iterable of dataframe chunks
+    ### columns is the list of columns to read
+
+    ## OPTIONAL
+    ### chunksize is the number of rows read at a time from a file. defaults to 1,000,000
+
+    import pandas as pd
+
+    if not isinstance(source, str):
+        for chunk in source:
+            yield chunk
+        return
+
+    if source.endswith('.parquet') or source.endswith('.pq'):
+        # parquet needs pyarrow to be read in pieces
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(source)
+        for record_batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield record_batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(source, usecols=lambda df_col_name: df_col_name in columns, chunksize=chunksize):
+            yield chunk
+
+
+def stream_tables(source, table_specs, chunksize=1000000):
+
+    # this function will build tables from data that is too big to fit in memory, one chunk of rows at a time
+    ## each chunk is aggregated into mergeable partial aggregates and merged in, and the tables are built from
+    ## the merged partials at the end, using the same reshaping, ordering and naming as the table functions
+    ## peak memory depends on the chunksize and the number of groups, not on the number of rows in the source
+    ## (distinct counts also keep each distinct value per group, so they depend on the number of distinct values too)
+    ## col_mapping and col_order are applied to the small aggregated results rather than to every row
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### source is a csv or parquet file path, or an iterable of dataframe chunks (see read_in_chunks)
+    ### table_specs is the list of (function, kwargs) pairs, one per table (see run_report_batch)
+    ####        every aggregation MUST be mergeable (see IncrementalTable)
+
+    ## OPTIONAL
+    ### chunksize is the number of rows read at a time from a file. defaults to 1,000,000
+
+    # returns the list of tables in the same order as table_specs
+
+    tables = [IncrementalTable(function, kwargs) for function, kwargs in table_specs]
+
+    # only read the columns some table needs
+    columns = []
+    for table in tables:
+        columns += [df_col_name for df_col_name in table.plan['raw_group_cols'] + list(table.plan['raw_aggregations']) \
+            if df_col_name not in columns]
+
+    for chunk in read_in_chunks(source, columns, chunksize):
+        for table in tables:
+            table.update(chunk)
+
+    return [table.render() for table in tables]
+
+
+def stream_table(source, function, kwargs, chunksize=1000000):
+
+    # this function will build one table from data that is too big to fit in memory (see stream_tables)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### source is a csv or parquet file path, or an iterable of dataframe chunks (see read_in_chunks)
+    ### function is the table function (or its name)
+    ### kwargs is the dictionary of arguments you would pass to the function, without df
+
+    ## OPTIONAL
+    ### chunksize is the number of rows read at a time from a file. defaults to 1,000,000
+
+    return stream_tables(source, [(function, kwargs)], chunksize)[0]
+
+
+######################## REPORT SPECS ##################################
+
+def load_report_spec(path):
+
+    # this function will read a report spec from a json or yaml file (.json, .yaml or .yml)
+    ## a report spec describes every table in a report by its table function and arguments, instead of a call for each:
+    ##   {"tables": [
+    ##       {"name": "members_by_year", "source": "claims", "function": "simple_groupby",
+    ##        "arguments": {"col_name": "fiscal_year", "aggregations": {"member_id": "nunique"}}},
+    ##       ...]}
+    ## name is the name the table is returned under, source is the name of the data it is built from (defaults to 'default'),
+    ## and arguments are the arguments you would pass to the function, without df
+    ## aggregations are written as pandas names (ex: 'sum', 'count', 'nunique'), since json and yaml cannot hold functions
+    ## yaml files need the pyyaml package
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### path is the path to the spec file
+
+    import json
+
+    with open(path) as spec_file:
+        if path.endswith('.yaml') or path.endswith('.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('reading a yaml report spec needs the pyyaml package (pip install pyyaml), or write the spec as json')
+            return yaml.safe_load(spec_file)
+        return json.load(spec_file)
+
+
+def compile_report_spec(spec):
+
+    # this function will compile a report spec into a plan for building all of its tables
+    ## every table is checked against its function's arguments here, so a bad spec fails before any data is read
+    ## the plan has one step per source, in the order the sources first appear in the spec, so each source is loaded
+    ## once and can be let go of before the next one is loaded (only one source is in memory at a time when sources
+    ## are given as file paths or functions, see run_report_plan)
+    ## within a step identical tables are only built once, and the tables are built with run_report_batch, so
+    ## tables that can be rolled up from shared partial aggregates share one pass over the data
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### spec is the report spec dictionary (see load_report_spec), or a path to a spec file
+
+    # returns the plan, a dictionary with:
+    ##   'names' - the table names in spec order
+    ##   'steps' - a list of steps, each a dictionary with:
+    ###      'source' - the source name
+    ###      'columns' - the data columns the step's tables read
+    ###      'table_specs' - the (function, kwargs) pairs for run_report_batch, with identical tables only once
+    ###      'names' - for each of table_specs, the list of table names it is returned as
+
+    import json
+
+    if isinstance(spec, str):
+        spec = load_report_spec(spec)
+
+    names = []
+    steps = []
+    steps_by_source = {}
+    built = {}
+
+    for position, table in enumerate(spec['tables']):
+        name = table.get('name', 'table_' + str(position))
+        if name in names:
+            raise ValueError('report spec has more than one table named ' + repr(name))
+        names.append(name)
+
+        source = table.get('source', 'default')
+        arguments = table.get('arguments', {})
+
+        # checks the function and arguments, and finds the data columns the table reads
+        plan = table_plan(table['function'], arguments)
+
+        if source not in steps_by_source:
+            steps_by_source[source] = {'source': source, 'columns': [], 'table_specs': [], 'names': []}
+            steps.append(steps_by_source[source])
+        step = steps_by_source[source]
+
+        for df_col_name in plan['raw_group_cols'] + list(plan['raw_aggregations']):
+            if df_col_name not in step['columns']:
+                step['columns'].append(df_col_name)
+
+        # identical tables (same source, function and arguments) are built once
+        table_key = (source, plan['function'].__name__, json.dumps(plan['arguments'], sort_keys=True, default=repr))
+        if table_key in built:
+            step['names'][built[table_key]].append(name)
+        else:
+            built[table_key] = len(step['table_specs'])
+            step['table_specs'].append((plan['function'], arguments))
+            step['names'].append([name])
+
+    return {'names': names, 'steps': steps}
+
+
+def load_source(source, columns):
+
+    # this function will load one report source, keeping only the columns the report needs
+    ## source can be a dataframe, a function taking no arguments that returns a dataframe,
+    ## or a path to a csv file or a parquet file
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### source is the dataframe, function or file path
+    ### columns is the list of columns the report reads from it
+
+    import pandas as pd
+
+    if isinstance(source, str):
+        if source.endswith('.parquet') or source.endswith('.pq'):
+            return pd.read_parquet(source, columns=columns)
+        return pd.read_csv(source, usecols=lambda df_col_name: df_col_name in columns)
+
+    if callable(source):
+        source = source()
+
+    return project_columns(source, columns)
+
+
+def run_report_plan(plan, sources):
+
+    # this function will build every table in a plan made by compile_report_spec
+    ## the steps run one source at a time: the source is loaded (only the columns the report needs), its tables are built,
+    ## and the loaded data is let go of before the next source, so peak memory is set by the largest single source
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### plan is the plan from compile_report_spec
+    ### sources is the dictionary of source name to dataframe, function returning a dataframe, or csv / parquet path
+    ####        a single dataframe can be given instead when every table uses the 'default' source
+
+    # returns a dictionary of table name to table, in spec order
+
+    if not isinstance(sources, dict):
+        sources = {'default': sources}
+
+    built = {}
+    for step in plan['steps']:
+        if step['source'] not in sources:
+            raise KeyError('report spec source ' + repr(step['source']) + ' was not given in sources')
+
+        df = load_source(sources[step['source']], step['columns'])
+        tables = run_report_batch(df, step['table_specs'])
+        del df
+
+        # tables asked for under more than one name are copied, so each name has its own table
+        for table_names, table in zip(step['names'], tables):
+            built[table_names[0]] = table
+            for name in table_names[1:]:
+                built[name] = table.copy()
+
+    return {name: built[name] for name in plan['names']}
+
+
+def run_report_spec(spec, sources):
+
+    # this function will compile a report spec and build all of its tables (see compile_report_spec and run_report_plan)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### spec is the report spec dictionary, or a path to a json or yaml spec file
+    ### sources is the dictionary of source name to dataframe, function returning a dataframe, or csv / parquet path
+
+    # returns a dictionary of table name to table, in spec order
+
+    return run_report_plan(compile_report_spec(spec), sources)
+
+
+######################## LAZY QUERIES ##################################
+
+class ReportQuery:
+
+    # this class will build up a table's options step by step and only run it when collect() is called
+    ## nothing is computed while the query is built, so collect() can plan the whole table before touching the data:
+    ###   only the columns the table reads are picked out of df
+    ###   when every aggregation can be rolled up (count, size, sum, min, max, mean, nunique) the rows are grouped by their
+    ###   raw values first, and col_mapping / col_order labels and index_mapping renames are applied to the grouped results
+    ###   (one row per group) instead of to every row
+    ###   rows and columns that are already in order are not reordered
+    ## collect() returns the same table as calling the table function with the same options (tables whose col_mapping merges
+    ## labels and that sum or average a float column are run through the function, see merges_float_sums)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### function is the table function (or its name), ex: 'col_pivot_row_multiindex_dbl_header_results'
+
+    ## OPTIONAL
+    ### kwargs is a dictionary of arguments to start from (the same as the function's arguments, without df)
+
+    # ex: query = ReportQuery(df, 'col_pivot_row_index_dbl_header_results').group_by('fiscal_year', 'department') \
+    ##        .aggregate({'member_id': 'count', 'paid': 'mean'}, stats_names=['Claims', 'Mean Paid']) \
+    ##        .label_columns(col_mapping, col_order).fill_nulls(['Claims'])
+    ##    table = query.collect()
+
+    def __init__(self, df, function, kwargs=None):
+
+        if isinstance(function, str):
+            function = globals()[function]
+
+        if function.__name__ not in TABLE_LAYOUTS:
+            raise ValueError(function.__name__ + ' is not one of the table functions: ' + ', '.join(TABLE_LAYOUTS))
+
+        self.df = df
+        self.function = function
+        self.kwargs = {}
+        if kwargs != None:
+            self.kwargs.update(kwargs)
+
+    def with_options(self, **kwargs):
+
+        # this method will return a new query with more of the function's arguments set (ex: index_name='Department')
+
+        kwargs = dict(self.kwargs, **kwargs)
+        return ReportQuery(self.df, self.function, kwargs)
+
+    def group_by(self, col_name, *index_cols):
+
+        # this method will set the column to pivot on (col_name) and the row index columns, in the function's order
+        ## ex: group_by('fiscal_year', 'department', 'month') for col_pivot_row_multiindex_dbl_header_results
+
+        index_args = TABLE_LAYOUTS[self.function.__name__]['index_args']
+        if len(index_cols) != len(index_args):
+            raise ValueError(self.function.__name__ + ' groups by col_name and ' + str(len(index_args)) \
+                + ' index columns (' + ', '.join(index_args) + '), got ' + str(len(index_cols)))
+
+        return self.with_options(col_name=col_name, **dict(zip(index_args, index_cols)))
+
+    def aggregate(self, aggregations, stats_names=None):
+
+        # this method will set the aggregations, and the stats_names for the functions that take them
+
+        if stats_names == None:
+            return self.with_options(aggregations=aggregations)
+        return self.with_options(aggregations=aggregations, stats_names=stats_names)
+
+    def label_columns(self, col_mapping=None, col_order=None):
+
+        # this method will set col_mapping and col_order for the pivoted column headers
+
+        return self.with_options(col_mapping=col_mapping, col_order=col_order)
+
+    def fill_nulls(self, null_to_0):
+
+        # this method will set null_to_0 (a list of stats names, or True for the combined index functions)
+
+        return self.with_options(null_to_0=null_to_0)
+
+    def plan(self):
+
+        # this method will check the options against the function and describe the table (see table_plan)
+
+        return table_plan(self.function, self.kwargs)
+
+    def mergeable(self):
+
+        # this method will return True when the table can be built from grouped raw values (see collect)
+
+        return len(unmergeable_aggregations(self.plan()['raw_aggregations'])) == 0
+
+    def explain(self):
+
+        # this method will return the list of steps collect() would run, in order, without running them
+
+        plan = self.plan()
+        columns = plan['raw_group_cols'] + [agg_col for agg_col in plan['raw_aggregations'] if agg_col not in plan['raw_group_cols']]
+
+        steps = ['read columns ' + ', '.join(str(df_col_name) for df_col_name in columns)]
+        if self.mergeable() == True:
+            steps.append('group rows by raw ' + ', '.join(str(group_col) for group_col in plan['raw_group_cols']))
+            if plan['label_mapper'] != None:
+                steps.append('map col_mapping / col_order labels onto the grouped ' + str(plan['col_name']) + ' values')
+            if plan['column_mapping'] != None:
+                steps.append('rename grouped columns with ' + plan['layout']['column_mapping_arg'])
+            steps.append('roll groups up to the mapped labels')
+        else:
+            if plan['column_mapping'] != None:
+                steps.append('rename columns with ' + plan['layout']['column_mapping_arg'])
+            if plan['label_mapper'] != None:
+                steps.append('map col_mapping / col_order labels onto every ' + str(plan['col_name']) + ' row')
+            steps.append('group rows by ' + ', '.join(str(group_col) for group_col in plan['group_cols']))
+        steps.append(plan['layout']['format'].__name__ + ' (reshape, order, rename, null_to_0)')
+
+        return steps
+
+    def merges_float_sums(self, plan, partials):
+
+        # this method will return True when col_mapping maps more than one raw col_name value onto one label and the table sums
+        ## or averages a float column: rolling the raw groups' sums up to the label adds the floats up in a different order
+        ## than the table function does, which can change the last digits
+
+        import pandas as pd
+
+        if plan['label_mapper'] == None:
+            return False
+        float_sums = [agg_col for agg_col, agg_func in aggregation_list(plan['raw_aggregations']) \
+            if aggregation_name(agg_func) in ['sum', 'mean'] and self.df[agg_col].dtype.kind == 'f']
+        if len(float_sums) == 0:
+            return False
+
+        raw_values = pd.Series(pd.unique(partials.frame.index.get_level_values(plan['raw_group_cols'][0])))
+        return plan['label_mapper'].map(raw_values).nunique(dropna=False) < len(raw_values)
+
+    def collect(self):
+
+        # this method will run the query and return the table
+
+        plan = self.plan()
+
+        if self.mergeable() == False:
+            # aggregations that need every row of a group (ex: 'median') run through the table function
+            return self.function(self.df, **self.kwargs)
+
+        # only the columns the table reads, grouped by their raw values
+        group_cols = plan['raw_group_cols']
+        stats = partial_stats(plan['raw_aggregations'])
+        projected = project_columns(self.df, group_cols + [agg_col for agg_col, stat in stats])
+        partials = PartialAggregates.from_frame(projected, group_cols, stats)
+
+        # float sums over merged labels run through the table function, so they are exactly its results
+        if self.merges_float_sums(plan, partials) == True:
+            return self.function(self.df, **self.kwargs)
+
+        # labels, renames and formatting on the grouped results
+        return table_from_partials(partials, plan)
+
+
+def collect_all(queries):
+
+    # this function will run many queries, sharing one groupby pass between the queries on the same dataframe
+    ## (see run_report_batch). sums and means rolled up from the shared pass can differ from collect() in the last
+    ## floating point digits, since the values are added up in a different order
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### queries is the list of ReportQuery objects
+
+    # returns the list of tables in the same order as queries
+
+    tables = [None] * len(queries)
+
+    # queries on the same dataframe (the same object) are run as one batch
+    batches = {}
+    for position, query in enumerate(queries):
+        batches.setdefault(id(query.df), []).append(position)
+
+    for positions in batches.values():
+        df = queries[positions[0]].df
+        batch_tables = run_report_batch(df, [(queries[position].function, queries[position].kwargs) for position in positions])
+        for position, table in zip(positions, batch_tables):
+            tables[position] = table
+
+    return tables
@@ -0,0 +1,385 @@
+######################## BENCHMARKS ##################################
+
+# times and memory profiles every table function in analysis_functions.py on synthetic claims-like data
+## run it before and after a change and compare the two results files to see whether the reports got faster or slower
+## ex: python benchmark.py --output before.json
+##     (make your change)
+##     python benchmark.py --output after.json --compare before.json
+
+import analysis_functions
+
+
+TABLE_FUNCTIONS = [
+    'simple_groupby',
+    'col_pivot_row_combined_index_results',
+    'col_pivot_row_combined_multiindex_results',
+    'col_pivot_row_index_dbl_header_results',
+    'col_pivot_row_multiindex_dbl_header_results',
+]
+
+# the data columns the benchmark tables aggregate, in the order they are added as the number of aggregations goes up
+## all of them are aggregated with a single function so they can also be the index values of the combined index tables
+AGGREGATION_COLUMNS = [('paid', 'sum'), ('member_id', 'count'), ('length_of_stay', 'mean'), ('allowed', 'max'), \
+    ('inpatient', 'sum'), ('outpatient', 'sum')]
+
+# the formatting options every table is timed with
+## pct_index1cat only applies to col_pivot_row_combined_multiindex_results
+OPTIONS = ['plain', 'col_mapping', 'col_order', 'null_to_0', 'pct_index1cat', 'margins']
+
+
+######################## SYNTHETIC DATA ##################################
+
+def make_claims_data(n_rows, n_col_values=10, n_index_values=8, n_index2_values=12, n_members=None, seed=0):
+
+    # this function will make a synthetic claims-like dataframe with a reproducible random seed
+    ## one row per claim, with a fiscal year column to pivot on, two categorical columns to use as row indices,
+    ## a member id and a few numeric columns with some nulls, like a claims extract would have
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### n_rows is the number of rows
+
+    ## OPTIONAL
+    ### n_col_values is the number of distinct fiscal years (the col_name cardinality). defaults to 10
+    ### n_index_values is the number of distinct departments (the first row index cardinality). defaults to 8
+    ### n_index2_values is the number of distinct months (the second row index cardinality). defaults to 12
+    ### n_members is the number of distinct member ids. defaults to one per 10 rows
+    ### seed is the random seed. defaults to 0
+
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+
+    if n_members == None:
+        n_members = max(n_rows // 10, 1)
+
+    fiscal_years = np.array(['FY' + str(year).zfill(3) for year in range(n_col_values)], dtype=object)
+    departments = np.array(['dept_' + str(dept).zfill(4) for dept in range(n_index_values)], dtype=object)
+    months = np.array(['month_' + str(month).zfill(3) for month in range(n_index2_values)], dtype=object)
+
+    paid = rng.gamma(2.0, 500.0, n_rows)
+    length_of_stay = rng.poisson(3, n_rows).astype(float)
+    length_of_stay[rng.random(n_rows) < 0.1] = np.nan
+    inpatient = rng.random(n_rows) < 0.2
+
+    return pd.DataFrame({
+        'fiscal_year': fiscal_years[rng.integers(0, n_col_values, n_rows)],
+        'department': departments[rng.integers(0, n_index_values, n_rows)],
+        'month': months[rng.integers(0, n_index2_values, n_rows)],
+        'member_id': rng.integers(0, n_members, n_rows),
+        'paid': paid,
+        'allowed': paid * rng.uniform(1.0, 1.5, n_rows),
+        'length_of_stay': length_of_stay,
+        'inpatient': inpatient.astype(int),
+        'outpatient': (~inpatient).astype(int),
+    })
+
+
+def benchmark_kwargs(function_name, df, n_aggregations, option):
+
+    # this function will make the arguments for one benchmark table (everything but df)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### function_name is the name of the table function
+    ### df is the synthetic data (see make_claims_data), used for the col_mapping and col_order labels
+    ### n_aggregations is the number of aggregations (up to the length of AGGREGATION_COLUMNS)
+    ### option is one of OPTIONS
+
+    import pandas as pd
+
+    aggregations = dict(AGGREGATION_COLUMNS[:n_aggregations])
+    stats_names = [agg_col + '_' + agg_func for agg_col, agg_func in aggregations.items()]
+
+    if function_name == 'simple_groupby':
+        kwargs = {'col_name': 'fiscal_year', 'aggregations': aggregations, 'stats_names': stats_names}
+    elif function_name == 'col_pivot_row_combined_index_results':
+        kwargs = {'col_name': 'fiscal_year', 'index_ordered_list': list(aggregations), 'aggregations': aggregations}
+    elif function_name == 'col_pivot_row_combined_multiindex_results':
+        kwargs = {'col_name': 'fiscal_year', 'index_ordered_list': list(aggregations), 'index_col': 'department', \
+            'aggregations': aggregations}
+    elif function_name == 'col_pivot_row_index_dbl_header_results':
+        kwargs = {'col_name': 'fiscal_year', 'index_col': 'department', 'stats_names': stats_names, 'aggregations': aggregations}
+    else:
+        kwargs = {'col_name': 'fiscal_year', 'index1_col': 'department', 'index2_col': 'month', 'stats_names': stats_names, \
+            'aggregations': aggregations}
+
+    fiscal_years = sorted(pd.unique(df['fiscal_year']))
+    labels = ['Fiscal Year ' + str(position + 1) for position in range(len(fiscal_years))]
+
+    if option == 'col_mapping' and function_name != 'simple_groupby':
+        kwargs['col_mapping'] = analysis_functions.create_label_mapping(fiscal_years, labels)
+        kwargs['col_order'] = analysis_functions.create_label_order_dict(labels)
+    elif option == 'col_order' and function_name != 'simple_groupby':
+        kwargs['col_order'] = analysis_functions.create_label_order_dict(fiscal_years[::-1])
+    elif option == 'null_to_0':
+        if function_name in ['col_pivot_row_combined_index_results', 'col_pivot_row_combined_multiindex_results']:
+            kwargs['null_to_0'] = True
+        else:
+            kwargs['null_to_0'] = stats_names
+    elif option == 'pct_index1cat':
+        kwargs['pct_index1cat'] = True
+    elif option == 'margins':
+        kwargs['margins'] = True
+
+    return kwargs
+
+
+def benchmark_cases(function_names=None, n_aggregations=(1, 3), options=None):
+
+    # this function will list the (function_name, n_aggregations, option) cases to run on every dataset
+    ## options that do not apply to a function are skipped (ex: pct_index1cat, or col_mapping for simple_groupby)
+
+    # ARGUMENTS
+
+    ## OPTIONAL
+    ### function_names is the list of table functions to time. defaults to all of TABLE_FUNCTIONS
+    ### n_aggregations is the list of numbers of aggregations to time. defaults to (1, 3)
+    ### options is the list of OPTIONS to time. defaults to all of OPTIONS
+
+    if function_names == None:
+        function_names = TABLE_FUNCTIONS
+    if options == None:
+        options = OPTIONS
+
+    cases = []
+    for function_name in function_names:
+        for n_aggs in n_aggregations:
+            for option in options:
+                if option == 'pct_index1cat' and function_name != 'col_pivot_row_combined_multiindex_results':
+                    continue
+                if option in ['col_mapping', 'col_order'] and function_name == 'simple_groupby':
+                    continue
+                cases.append((function_name, n_aggs, option))
+
+    return cases
+
+
+######################## MEASURING ##################################
+
+def measure_call(function, df, kwargs, repeat=3):
+
+    # this function will time one table call and measure its peak memory
+    ## the timings are taken without tracemalloc running (it slows python down), then one more call is made under
+    ## tracemalloc for the peak memory allocated by the call
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### function is the table function
+    ### df is the dataframe to pass in
+    ### kwargs is the dictionary of the other arguments
+
+    ## OPTIONAL
+    ### repeat is the number of timed calls. defaults to 3
+
+    # returns a dictionary of the fastest and median seconds, the peak MB and the shape of the table
+
+    import gc
+    import statistics
+    import time
+    import tracemalloc
+
+    seconds = []
+    for run in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        table = function(df, **kwargs)
+        seconds.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(df, **kwargs)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'min_seconds': min(seconds),
+        'median_seconds': statistics.median(seconds),
+        'peak_mb': peak / 2**20,
+        'table_shape': list(table.shape),
+    }
+
+
+def run_benchmarks(row_counts=(10000, 100000, 1000000), col_cardinalities=(10,), index_cardinalities=(8, 100), \
+    function_names=None, n_aggregations=(1, 3), options=None, repeat=3, seed=0, progress=None):
+
+    # this function will run every benchmark case on every synthetic dataset
+    ## a case that raises an error is recorded with its error rather than stopping the run
+
+    # ARGUMENTS
+
+    ## OPTIONAL
+    ### row_counts is the list of numbers of rows. defaults to 10,000, 100,000 and 1,000,000
+    ### col_cardinalities is the list of numbers of distinct col_name values. defaults to 10
+    ### index_cardinalities is the list of numbers of distinct row index values. defaults to 8 and 100
+    ### function_names, n_aggregations and options pick the cases to run (see benchmark_cases)
+    ### repeat is the number of timed calls per case. defaults to 3
+    ### seed is the random seed for the data. defaults to 0
+    ### progress is a function called with each result as it is measured (ex: print). defaults to None
+
+    # returns the list of results, one dictionary per case and dataset
+
+    cases = benchmark_cases(function_names, n_aggregations, options)
+
+    results = []
+    for n_rows in row_counts:
+        for n_col_values in col_cardinalities:
+            for n_index_values in index_cardinalities:
+                df = make_claims_data(n_rows, n_col_values, n_index_values, n_index_values, seed=seed)
+                for function_name, n_aggs, option in cases:
+                    result = {
+                        'function': function_name,
+                        'rows': n_rows,
+                        'col_cardinality': n_col_values,
+                        'index_cardinality': n_index_values,
+                        'aggregations': n_aggs,
+                        'option': option,
+                    }
+                    try:
+                        kwargs = benchmark_kwargs(function_name, df, n_aggs, option)
+                        result.update(measure_call(getattr(analysis_functions, function_name), df, kwargs, repeat))
+                        result['error'] = None
+                    except Exception as error:
+                        result['error'] = type(error).__name__ + ': ' + str(error)
+                    results.append(result)
+                    if progress != None:
+                        progress(result)
+
+    return results
+
+
+######################## RESULTS FILES ##################################
+
+def environment_info():
+
+    # this function will describe the machine and library versions, so results files can be matched up
+
+    import platform
+
+    import numpy as np
+    import pandas as pd
+
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+def result_key(result):
+
+    # this function will return the fields that identify one benchmark case, for matching results across files
+
+    return (result['function'], result['rows'], result['col_cardinality'], result['index_cardinality'], \
+        result['aggregations'], result['option'])
+
+
+def write_results(results, path):
+
+    # this function will write the results and the environment to a json file
+
+    import json
+
+    with open(path, 'w') as results_file:
+        json.dump({'environment': environment_info(), 'results': results}, results_file, indent=1)
+
+
+def read_results(path):
+
+    # this function will read a results file written by write_results and return the list of results
+
+    import json
+
+    with open(path) as results_file:
+        return json.load(results_file)['results']
+
+
+def compare_results(old_results, new_results):
+
+    # this function will compare two benchmark runs case by case
+    ## ratios above 1 mean the new run is slower (or uses more memory)
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### old_results is the list of results to compare against (ex: read_results('before.json'))
+    ### new_results is the list of results to compare
+
+    # returns a list of dictionaries with the case, both timings and peaks, and the new / old ratios
+
+    old_by_key = {result_key(result): result for result in old_results}
+
+    comparison = []
+    for new in new_results:
+        old = old_by_key.get(result_key(new))
+        if old == None or old['error'] != None or new['error'] != None:
+            continue
+        comparison.append({
+            'case': list(result_key(new)),
+            'old_seconds': old['min_seconds'],
+            'new_seconds': new['min_seconds'],
+            'time_ratio': new['min_seconds'] / old['min_seconds'],
+            'old_peak_mb': old['peak_mb'],
+            'new_peak_mb': new['peak_mb'],
+            'memory_ratio': new['peak_mb'] / old['peak_mb'] if old['peak_mb'] > 0 else None,
+        })
+
+    return comparison
+
+
+######################## COMMAND LINE ##################################
+
+def format_result(result):
+
+    # this function will format one result as a line of text for the progress output
+
+    case = result['function'] + ' rows=' + str(result['rows']) + ' col=' + str(result['col_cardinality']) \
+        + ' index=' + str(result['index_cardinality']) + ' aggs=' + str(result['aggregations']) + ' ' + result['option']
+    if result['error'] != None:
+        return case + '  ERROR ' + result['error']
+    return case + '  ' + format(result['min_seconds'], '.4f') + 's  ' + format(result['peak_mb'], '.1f') + 'MB'
+
+
+def main(argv=None):
+
+    # this function will run the benchmarks from the command line (see python benchmark.py --help)
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='time and memory profile the analysis_functions table functions')
+    parser.add_argument('--rows', type=float, nargs='+', default=[1e4, 1e5, 1e6], \
+        help='numbers of rows, ex: --rows 1e4 1e6 1e8 (defaults to 1e4 1e5 1e6)')
+    parser.add_argument('--col-cardinality', type=int, nargs='+', default=[10], help='numbers of distinct col_name values')
+    parser.add_argument('--index-cardinality', type=int, nargs='+', default=[8, 100], help='numbers of distinct row index values')
+    parser.add_argument('--aggregations', type=int, nargs='+', default=[1, 3], \
+        help='numbers of aggregations (up to ' + str(len(AGGREGATION_COLUMNS)) + ')')
+    parser.add_argument('--functions', nargs='+', default=None, choices=TABLE_FUNCTIONS, help='table functions to time')
+    parser.add_argument('--options', nargs='+', default=None, choices=OPTIONS, help='formatting options to time')
+    parser.add_argument('--repeat', type=int, default=3, help='timed calls per case')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the synthetic data')
+    parser.add_argument('--output', default='benchmark_results.json', help='json file to write the results to')
+    parser.add_argument('--compare', default=None, help='results file from an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks([int(n_rows) for n_rows in args.rows], args.col_cardinality, args.index_cardinality, \
+        args.functions, args.aggregations, args.options, args.repeat, args.seed, progress=lambda result: print(format_result(result)))
+    write_results(results, args.output)
+    print('results written to ' + args.output)
+
+    if args.compare != None:
+        print('new / old (above 1 is slower):')
+        for compared in compare_results(read_results(args.compare), results):
+            print(' '.join(str(field) for field in compared['case']) + '  time ' + format(compared['time_ratio'], '.2f') \
+                + '  memory ' + (format(compared['memory_ratio'], '.2f') if compared['memory_ratio'] != None else '-'))
+
+
+if __name__ == '__main__':
+    main()
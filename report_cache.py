@@ -0,0 +1,636 @@
+# RESULT CACHES FOR THE TABLE FUNCTIONS
+
+## ResultCache keeps finished tables in memory and DiskResultCache keeps them on disk between runs
+## caching is opt-in: nothing is cached until you wrap a function with cached_table_function or call enable_result_cache
+
+import collections
+import functools
+import threading
+
+import analysis_functions
+
+
+# the functions that can be wrapped by the cache
+CACHEABLE_FUNCTIONS = list(analysis_functions.TABLE_LAYOUTS) + ['run_report_batch']
+
+
+######################## FINGERPRINTS ##################################
+
+def frame_fingerprint(df, columns, sample_rows=None):
+
+    # this function will fingerprint the columns of df that a table uses
+    ## the fingerprint is the column names, dtypes, row count and a hash of the column contents and index
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### df is your dataframe to be analyzed
+    ### columns is the list of columns the table reads
+
+    ## OPTIONAL
+    ### sample_rows will only hash this many evenly spaced rows (plus the first and last) instead of every row. defaults to None
+    ####        much cheaper on very large frames, but a change to a row that is not sampled will NOT be noticed
+
+    import hashlib
+
+    import pandas as pd
+
+    columns = [df_col_name for df_col_name in df.columns if df_col_name in columns]
+    projected = df[columns]
+
+    if sample_rows != None and len(projected) > sample_rows:
+        step = len(projected) // sample_rows
+        positions = list(range(0, len(projected), step)) + [len(projected) - 1]
+        projected = projected.iloc[positions]
+
+    content_hash = hashlib.sha256(pd.util.hash_pandas_object(projected, index=True).values.tobytes()).hexdigest()
+    dtypes = tuple((str(df_col_name), str(dtype)) for df_col_name, dtype in df[columns].dtypes.items())
+    return (len(df), dtypes, content_hash)
+
+
+def importable_name(value):
+
+    # this function will return the (module, qualified name) a function or class is imported by, or None
+    ## only when importing that name gives back the very same object, so a lambda, a function defined inside another one,
+    ## a bound method, a functools.partial or a callable instance (ex: ApproxNunique(0.2)) is never identified by a name
+
+    import sys
+
+    module_name = getattr(value, '__module__', None)
+    qualname = getattr(value, '__qualname__', None)
+    if not isinstance(module_name, str) or not isinstance(qualname, str) or '<' in qualname:
+        return None
+
+    found = sys.modules.get(module_name)
+    for name in qualname.split('.'):
+        found = getattr(found, name, None)
+    # the name can also hold a wrapper of it (ex: a table function swapped for its cached version by enable_result_cache)
+    if found is not value and getattr(found, '__wrapped__', None) is not value:
+        return None
+    return (module_name, qualname)
+
+
+def normalize_argument(value):
+
+    # this function will turn an argument into a hashable value that is equal for equal arguments
+    ## dictionaries keep their order (the order of aggregations sets the order of your results columns), sets are sorted
+    ## (their order, and so their repr, changes from one process to the next with the string hash seed)
+    ## functions that can be imported by name are identified by name, partials by their function and arguments, callable
+    ## instances of an importable class by their class and state (what pickle would save), anything else (ex: a lambda) by
+    ## the object itself
+
+    import functools
+
+    if isinstance(value, dict):
+        return ('dict', tuple((normalize_argument(key), normalize_argument(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(normalize_argument(item) for item in value))
+    if isinstance(value, (set, frozenset)):
+        return ('set', tuple(sorted((normalize_argument(item) for item in value), key=repr)))
+    if callable(value):
+        name = importable_name(value)
+        if name != None:
+            return ('function',) + name
+        if isinstance(value, functools.partial):
+            return ('partial', normalize_argument(value.func), normalize_argument(value.args), normalize_argument(value.keywords))
+        class_name = importable_name(type(value))
+        if class_name != None:
+            try:
+                reduced = value.__reduce_ex__(4)
+            except Exception:
+                return ('object', value)
+            if isinstance(reduced, tuple):
+                return ('instance',) + class_name + (normalize_argument(reduced[1:3]),)
+        return ('object', value)
+    try:
+        hash(value)
+    except TypeError:
+        return ('repr', repr(value))
+    return value
+
+
+def table_columns(function_name, kwargs):
+
+    # this function will return the data columns a table function call reads
+
+    if function_name == 'run_report_batch':
+        columns = []
+        for function, spec_kwargs in kwargs['table_specs']:
+            columns += table_columns(getattr(function, '__name__', function), spec_kwargs)
+        return columns
+
+    plan = analysis_functions.table_plan(function_name, kwargs)
+    return plan['raw_group_cols'] + list(plan['raw_aggregations'])
+
+
+def cache_key(function_name, df, kwargs, sample_rows=None):
+
+    # this function will build the cache key for one call: the function, the fingerprint of its columns and its arguments
+
+    columns = table_columns(function_name, kwargs)
+    return (function_name, frame_fingerprint(df, columns, sample_rows), normalize_argument(kwargs))
+
+
+######################## MEMORY CACHE ##################################
+
+def result_size(result):
+
+    # this function will return the memory used by a result (a dataframe or a list of dataframes) in bytes
+
+    if isinstance(result, list):
+        return sum(result_size(item) for item in result)
+    return int(result.memory_usage(deep=True, index=True).sum())
+
+
+def copy_result(result):
+
+    # this function will return a deep copy of a result, so changes to it never reach the cached copy
+
+    if isinstance(result, list):
+        return [copy_result(item) for item in result]
+    return result.copy(deep=True)
+
+
+class ResultCache:
+
+    # this class is a least recently used cache of finished tables
+    ## entries are evicted (least recently used first) once there are more than max_entries of them
+    ## or they use more than max_bytes in total
+    ## every result is copied going into and coming out of the cache
+
+    # ARGUMENTS
+
+    ## OPTIONAL
+    ### max_entries is the most results the cache will hold. defaults to 128
+    ### max_bytes is the most memory the cached results can use, in bytes. defaults to 512 MB
+    ### sample_rows is passed on to frame_fingerprint. defaults to None (hash every row)
+
+    def __init__(self, max_entries=128, max_bytes=512 * 2**20, sample_rows=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sample_rows = sample_rows
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+
+        # this method will return a copy of the cached result for key, or None if it is not cached
+
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            result, size = self.entries[key]
+        return copy_result(result)
+
+    def put(self, key, result):
+
+        # this method will cache a copy of result under key, evicting old entries when the cache is full
+
+        size = result_size(result)
+        if size > self.max_bytes:
+            # never cache a result bigger than the whole cache
+            return
+
+        result = copy_result(result)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (result, size)
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                evicted_key, (evicted_result, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+
+        # this method will empty the cache (the counters are kept)
+
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+
+        # this method will return the cache counters as a dictionary, ready to export to a metrics system
+
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+            }
+
+
+def cached_table_function(function, cache):
+
+    # this function will wrap a table function (or run_report_batch) so its results are cached in cache
+    ## the wrapped function takes the same arguments as the original
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### function is the function to wrap, ex: analysis_functions.col_pivot_row_multiindex_dbl_header_results
+    ### cache is the ResultCache (or DiskResultCache) to use
+
+    import inspect
+
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        # name every argument so positional and keyword calls share cache entries
+        bound = signature.bind(*args, **kwargs)
+        arguments = dict(bound.arguments)
+        df = arguments.pop('df')
+
+        key = cache_key(function.__name__, df, arguments, cache.sample_rows)
+        result = cache.get(key)
+        if result is None:
+            result = function(df, **arguments)
+            cache.put(key, result)
+        return result
+
+    wrapper.cache = cache
+    return wrapper
+
+
+# original functions, kept while the cache is enabled
+_uncached_functions = {}
+
+
+def enable_result_cache(cache=None):
+
+    # this function will replace every cacheable function in analysis_functions with a cached version
+    ## calls like analysis_functions.simple_groupby(...) then use the cache. returns the ResultCache in use
+
+    # ARGUMENTS
+
+    ## OPTIONAL
+    ### cache is the ResultCache (or DiskResultCache) to use. defaults to a new ResultCache with default limits
+
+    if cache == None:
+        cache = ResultCache()
+
+    disable_result_cache()
+    for function_name in CACHEABLE_FUNCTIONS:
+        function = getattr(analysis_functions, function_name)
+        _uncached_functions[function_name] = function
+        setattr(analysis_functions, function_name, cached_table_function(function, cache))
+
+    return cache
+
+
+def disable_result_cache():
+
+    # this function will put the original uncached functions back in analysis_functions
+
+    for function_name, function in _uncached_functions.items():
+        setattr(analysis_functions, function_name, function)
+    _uncached_functions.clear()
+
+
+######################## DISK CACHE ##################################
+
+def key_digest(key):
+
+    # this function will turn a cache key into a content address (a sha256 hex digest) that is the same in every process
+    ## returns None when the key holds something only this process can identify (ex: a lambda in aggregations),
+    ## since those calls cannot be matched up across processes
+
+    import hashlib
+
+    def persistable(value):
+        if isinstance(value, tuple):
+            if len(value) == 2 and value[0] == 'object':
+                return False
+            return all(persistable(item) for item in value)
+        return isinstance(value, (str, int, float, bool, type(None)))
+
+    if not persistable(key):
+        return None
+    return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+
+def label_layout(label):
+
+    # this function will turn a row index name, column header or category into a value json can store
+    ## raises TypeError for labels it cannot store, so the table is not cached
+
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(label, np.generic):
+        label = label.item()
+    if isinstance(label, pd.Timestamp):
+        return {'timestamp': label.isoformat()}
+    if label == None or isinstance(label, (str, int, float, bool)):
+        return label
+    raise TypeError('cannot store the label ' + repr(label))
+
+
+def layout_label(stored):
+
+    # this function will turn a value from label_layout back into the label
+
+    import pandas as pd
+
+    if isinstance(stored, dict):
+        return pd.Timestamp(stored['timestamp'])
+    return stored
+
+
+def dtype_layout(dtype):
+
+    # this function will turn a dtype into a value json can store
+    ## categoricals keep their categories and order, and string dtypes their storage and missing value
+    ## raises TypeError for dtypes that cannot be rebuilt from their name, so the table is not cached
+
+    import pandas as pd
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        return {'categories': index_layout(dtype.categories), 'ordered': bool(dtype.ordered)}
+    if isinstance(dtype, pd.StringDtype):
+        return {'string': dtype.storage, 'na_value': 'NA' if dtype.na_value is pd.NA else 'nan'}
+    if pd.api.types.pandas_dtype(str(dtype)) != dtype:
+        raise TypeError('cannot store the dtype ' + repr(dtype))
+    return str(dtype)
+
+
+def layout_dtype(stored):
+
+    # this function will turn a value from dtype_layout back into the dtype
+
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(stored, str):
+        return pd.api.types.pandas_dtype(stored)
+    if 'categories' in stored:
+        return pd.CategoricalDtype(layout_index(stored['categories']), ordered=stored['ordered'])
+    return pd.StringDtype(stored['string'], na_value=pd.NA if stored['na_value'] == 'NA' else np.nan)
+
+
+def index_layout(index):
+
+    # this function will turn an index (ex: double header MultiIndex columns) into a value json can store
+
+    import pandas as pd
+
+    if isinstance(index, pd.MultiIndex):
+        return {
+            'levels': [index_layout(level) for level in index.levels],
+            'codes': [level_codes.tolist() for level_codes in index.codes],
+            'names': [label_layout(name) for name in index.names],
+        }
+    return {'values': [label_layout(label) for label in index], 'dtype': dtype_layout(index.dtype), 'name': label_layout(index.name)}
+
+
+def layout_index(stored):
+
+    # this function will turn a value from index_layout back into the index
+
+    import pandas as pd
+
+    if 'levels' in stored:
+        return pd.MultiIndex(levels=[layout_index(level) for level in stored['levels']], codes=stored['codes'], \
+            names=[layout_label(name) for name in stored['names']])
+    return pd.Index([layout_label(label) for label in stored['values']], dtype=layout_dtype(stored['dtype']), \
+        name=layout_label(stored['name']))
+
+
+def write_table(df, path):
+
+    # this function will write one table to a parquet file
+    ## the row index is stored as ordinary columns and every column gets a plain name, and the real row index names,
+    ## column headers (including double header MultiIndex columns) and dtypes are returned as a value json can store, so they
+    ## can be stored alongside it (see index_layout)
+
+    import pandas as pd
+
+    index_frame = df.index.to_frame(index=False)
+    index_frame.columns = ['index_%d' % level for level in range(df.index.nlevels)]
+    values = df.reset_index(drop=True)
+    values.columns = ['column_%d' % position for position in range(df.shape[1])]
+
+    pd.concat([index_frame, values], axis=1).to_parquet(path, index=False)
+    return {
+        'index_names': [label_layout(name) for name in df.index.names],
+        'index_dtypes': [dtype_layout(dtype) for dtype in index_frame.dtypes],
+        'columns': index_layout(df.columns),
+        'dtypes': [dtype_layout(dtype) for dtype in df.dtypes],
+    }
+
+
+def read_table(path, layout):
+
+    # this function will read one table written by write_table and put its row index and column headers back
+
+    import pandas as pd
+
+    table = pd.read_parquet(path)
+    index_names = [layout_label(name) for name in layout['index_names']]
+    dtypes = [layout_dtype(dtype) for dtype in layout['index_dtypes'] + layout['dtypes']]
+    index_cols = ['index_%d' % level for level in range(len(index_names))]
+    value_cols = ['column_%d' % position for position in range(len(dtypes) - len(index_names))]
+
+    # parquet can bring some dtypes back in a different flavour (ex: the storage of string columns), so put the originals back
+    table = table.astype(dict(zip(index_cols + value_cols, dtypes)))
+    if len(index_cols) == 1:
+        index = pd.Index(table[index_cols[0]], name=index_names[0])
+    else:
+        index = pd.MultiIndex.from_frame(table[index_cols], names=index_names)
+
+    df = table.drop(columns=index_cols)
+    df.index = index
+    df.columns = layout_index(layout['columns'])
+    return df
+
+
+class DiskResultCache:
+
+    # this class is a persistent cache of finished tables, shared between processes and runs
+    ## entries are content addressed: the key is a hash of the columns the table reads plus the call, so an
+    ## unchanged source gives the same key tomorrow. tables are stored as parquet files (pyarrow or fastparquet is needed)
+    ## with their row index, column headers and dtypes stored next to them as json (nothing read from cache_dir is unpickled),
+    ## so MultiIndex rows and double headers come back as they were. tables json cannot describe are not cached
+    ## once the cache is bigger than max_bytes, the least recently used entries are deleted
+
+    ## parallel jobs can share a cache_dir: each entry is written into a temporary folder and then renamed into place in one step,
+    ## so readers only ever see complete entries, and if two jobs write the same entry the second one simply drops its copy
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### cache_dir is the folder holding the cache. it is created if it does not exist
+
+    ## OPTIONAL
+    ### max_bytes is the most disk space the cache can use, in bytes. defaults to 5 GB
+    ### sample_rows is passed on to frame_fingerprint. defaults to None (hash every row)
+
+    def __init__(self, cache_dir, max_bytes=5 * 2**30, sample_rows=None):
+        import os
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.sample_rows = sample_rows
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, digest):
+        import os
+
+        return os.path.join(self.cache_dir, digest)
+
+    def get(self, key):
+
+        # this method will return the cached result for key, or None if it is not cached
+
+        import json
+        import os
+
+        digest = key_digest(key)
+        if digest == None:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        path = self.entry_path(digest)
+        try:
+            with open(os.path.join(path, 'layout.json'), 'r', encoding='utf-8') as layout_file:
+                layouts = json.load(layout_file)
+            tables = [read_table(os.path.join(path, 'table_%d.parquet' % position), layout) \
+                for position, layout in enumerate(layouts['tables'])]
+            # mark the entry as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            # not cached, or deleted by another job while reading
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        if layouts['is_list']:
+            return tables
+        return tables[0]
+
+    def put(self, key, result):
+
+        # this method will write result to the cache under key, then evict old entries if the cache is too big
+
+        import json
+        import os
+        import shutil
+        import uuid
+
+        digest = key_digest(key)
+        if digest == None:
+            return
+
+        path = self.entry_path(digest)
+        if os.path.exists(path):
+            if os.path.exists(os.path.join(path, 'layout.json')):
+                return
+            # an entry written before layouts were stored as json, replaced by this one
+            shutil.rmtree(path, ignore_errors=True)
+
+        tables = result if isinstance(result, list) else [result]
+        temp_path = os.path.join(self.cache_dir, '.tmp-%s' % uuid.uuid4().hex)
+        os.makedirs(temp_path)
+        try:
+            layouts = {'is_list': isinstance(result, list), 'tables': []}
+            for position, table in enumerate(tables):
+                layouts['tables'].append(write_table(table, os.path.join(temp_path, 'table_%d.parquet' % position)))
+            with open(os.path.join(temp_path, 'layout.json'), 'w', encoding='utf-8') as layout_file:
+                json.dump(layouts, layout_file)
+            # one step publish: either the whole entry appears or (if another job got there first) nothing changes
+            os.rename(temp_path, path)
+        except Exception:
+            # tables parquet or the json layout cannot store (ex: mixed type columns) are just not cached
+            shutil.rmtree(temp_path, ignore_errors=True)
+            return
+
+        with self.lock:
+            self.writes += 1
+        self.evict()
+
+    def entries(self):
+
+        # this method will return (last used time, size in bytes, path) for every complete entry in the cache
+
+        import os
+
+        found = []
+        for entry_name in os.listdir(self.cache_dir):
+            if entry_name.startswith('.tmp-'):
+                continue
+            path = self.entry_path(entry_name)
+            try:
+                size = sum(os.path.getsize(os.path.join(path, file_name)) for file_name in os.listdir(path))
+                found.append((os.path.getmtime(path), size, path))
+            except OSError:
+                # deleted by another job
+                continue
+        return found
+
+    def evict(self):
+
+        # this method will delete the least recently used entries until the cache fits in max_bytes
+
+        import os
+        import shutil
+        import uuid
+
+        found = sorted(self.entries())
+        total_bytes = sum(size for last_used, size, path in found)
+        for last_used, size, path in found:
+            if total_bytes <= self.max_bytes:
+                break
+            # move the entry out of the way in one step before deleting it, so readers never see half an entry
+            trash_path = os.path.join(self.cache_dir, '.tmp-%s' % uuid.uuid4().hex)
+            try:
+                os.rename(path, trash_path)
+            except OSError:
+                continue
+            shutil.rmtree(trash_path, ignore_errors=True)
+            total_bytes -= size
+            with self.lock:
+                self.evictions += 1
+
+    def clear(self):
+
+        # this method will delete every entry in the cache (the counters are kept)
+
+        import shutil
+
+        for last_used, size, path in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
+
+    def stats(self):
+
+        # this method will return the cache counters as a dictionary, ready to export to a metrics system
+
+        found = self.entries()
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'entries': len(found),
+                'bytes': sum(size for last_used, size, path in found),
+            }
@@ -0,0 +1,365 @@
+# EXPORT FOR THE TABLE FUNCTIONS
+
+## export_tables writes many finished tables in one writer session: an excel workbook with a sheet per table (or the tables
+## stacked in blocks on one sheet), one csv file with the tables stacked in blocks, or a columnar parquet dump with a file per table
+## rows are written one at a time as each table arrives, so tables can be built lazily (ex: from a generator) and let go of
+## once they are written
+
+import os
+
+
+# the file formats export_tables can write, by file extension
+## a path with no extension is a directory for the parquet dump
+EXPORT_FORMATS = {
+    '.xlsx': 'excel',
+    '.csv': 'csv',
+    '': 'parquet',
+}
+
+# how the tables are laid out in a workbook: a sheet per table, or stacked in blocks on one sheet
+EXPORT_LAYOUTS = ['sheets', 'blocks']
+
+# the excel engines, in the order they are tried
+EXCEL_ENGINES = ['xlsxwriter', 'openpyxl']
+
+# excel sheet names are at most 31 characters and cannot hold any of these
+SHEET_NAME_LENGTH = 31
+SHEET_NAME_CHARACTERS = '[]:*?/\\'
+
+
+######################## ROWS ##################################
+
+def cell_value(value):
+
+    # this function will turn one value from a table into a plain python value a writer can take
+    ## nulls become empty cells, numpy scalars their python equivalents and anything without a cell type its string
+
+    import datetime
+    import numbers
+
+    import numpy as np
+    import pandas as pd
+
+    if value is None:
+        return None
+    if isinstance(value, (str, bool)):
+        return value
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, (numbers.Number, datetime.date, datetime.datetime)):
+        return value
+    return str(value)
+
+
+def sparse_labels(labels, levels):
+
+    # this function will blank out each label that repeats the one before it in every level up to and including its own
+    ## (ex: a department name is shown once above its months), like a report shows grouped headers
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### labels is the list of label tuples (one value per level), in table order
+    ### levels is the number of levels to blank out repeats in, from the first one
+
+    sparse = []
+    previous = None
+    for label in labels:
+        shown = list(label)
+        if previous != None:
+            for level in range(levels):
+                if label[:level + 1] != previous[:level + 1]:
+                    break
+                shown[level] = None
+        sparse.append(shown)
+        previous = label
+    return sparse
+
+
+def table_rows(table, sparse=True):
+
+    # this function will yield the rows of one table the way it looks in a report, one list of cells at a time
+    ## one header row per column header level (ex: col_name values above the stats of a double header) with the index names
+    ## on their own row under them, then one row per table row with its row index values first
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### table is the dataframe from one of the table functions
+
+    ## OPTIONAL
+    ### sparse will show repeated outer index values and top header values once instead of on every row / column. defaults to True
+
+    n_index = table.index.nlevels
+    n_headers = table.columns.nlevels
+
+    # column headers
+    if n_headers == 1:
+        yield list(table.index.names) + list(table.columns)
+    else:
+        header_labels = list(table.columns)
+        if sparse == True:
+            header_labels = sparse_labels(header_labels, n_headers - 1)
+        for level in range(n_headers):
+            yield [None] * (n_index - 1) + [table.columns.names[level]] + [label[level] for label in header_labels]
+        yield list(table.index.names) + [None] * table.shape[1]
+
+    # one row at a time, so a table is never copied into another layout to be written
+    index_labels = table.index
+    if n_index == 1:
+        index_labels = [(label,) for label in index_labels]
+    if sparse == True and n_index > 1:
+        index_labels = sparse_labels(list(index_labels), n_index - 1)
+
+    for index_label, values in zip(index_labels, table.itertuples(index=False, name=None)):
+        yield list(index_label) + list(values)
+
+
+######################## WRITERS ##################################
+
+def unique_name(name, used_names, max_length=SHEET_NAME_LENGTH):
+
+    # this function will turn a table name into a sheet (or file) name that is valid and not used yet
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### name is the name of the table
+    ### used_names is the list of names already used
+
+    ## OPTIONAL
+    ### max_length is the longest the name can be, or None for no limit. defaults to SHEET_NAME_LENGTH
+
+    name = str(name)
+    for character in SHEET_NAME_CHARACTERS:
+        name = name.replace(character, '_')
+    if name == '':
+        name = 'Sheet'
+    if max_length == None:
+        max_length = len(name) + 10
+    name = name[:max_length]
+
+    # names are unique regardless of case, like excel sheets and the files on some systems
+    used = [used_name.lower() for used_name in used_names]
+    candidate = name
+    copy_number = 2
+    while candidate.lower() in used:
+        suffix = ' (' + str(copy_number) + ')'
+        candidate = name[:max_length - len(suffix)] + suffix
+        copy_number += 1
+    return candidate
+
+
+class ExcelRowWriter:
+
+    # this class writes rows to an excel workbook one row at a time, in one writer session
+    ## xlsxwriter is run in constant memory mode (each row is flushed to disk as soon as the next one starts) and
+    ## openpyxl in write only mode, so memory does not grow with the number of rows in the workbook
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### path is the path to the .xlsx file to write
+
+    ## OPTIONAL
+    ### engine is one of EXCEL_ENGINES, or None for the first one installed. defaults to None
+
+    def __init__(self, path, engine=None):
+        if engine == None:
+            for excel_engine in EXCEL_ENGINES:
+                try:
+                    __import__(excel_engine)
+                except ImportError:
+                    continue
+                engine = excel_engine
+                break
+            else:
+                raise ImportError('writing an excel workbook needs the xlsxwriter or openpyxl package (pip install xlsxwriter)')
+
+        if engine == 'xlsxwriter':
+            import xlsxwriter
+            # text is always written as text (ex: a label starting with '=' is not a formula)
+            self.workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_formulas': False, \
+                'strings_to_urls': False})
+        elif engine == 'openpyxl':
+            import openpyxl
+            self.workbook = openpyxl.Workbook(write_only=True)
+        else:
+            raise ValueError('engine must be one of ' + ', '.join(EXCEL_ENGINES) + ' or None, not ' + repr(engine))
+
+        self.path = path
+        self.engine = engine
+        self.sheet = None
+        self.sheet_names = []
+        self.row = 0
+
+    def add_sheet(self, name):
+
+        # this method will start a new sheet and return its name, which rows are written to from then on
+
+        name = unique_name(name, self.sheet_names)
+        if self.engine == 'xlsxwriter':
+            self.sheet = self.workbook.add_worksheet(name)
+        else:
+            self.sheet = self.workbook.create_sheet(name)
+        self.sheet_names.append(name)
+        self.row = 0
+        return name
+
+    def write_row(self, values):
+
+        # this method will write the next row of the current sheet
+
+        values = [cell_value(value) for value in values]
+        if self.engine == 'xlsxwriter':
+            self.sheet.write_row(self.row, 0, values)
+        else:
+            self.sheet.append(values)
+        self.row += 1
+
+    def close(self):
+
+        # this method will finish the workbook file
+
+        if self.engine == 'xlsxwriter':
+            self.workbook.close()
+        else:
+            self.workbook.save(self.path)
+
+
+def columnar_table(table):
+
+    # this function will make a table ready for parquet, which needs every column and index level to hold one type
+    ## object columns, row index levels and column header levels with mixed types (ex: a margins 'Total' label in a row index
+    ## of month numbers) are written as strings. everything else, including double header MultiIndex columns, is kept as it is
+
+    import pandas as pd
+
+    def single_type(index):
+        if isinstance(index, pd.MultiIndex):
+            return index.set_levels([single_type(level) for level in index.levels])
+        if index.dtype == object and pd.api.types.infer_dtype(index, skipna=True).startswith('mixed'):
+            return index.astype(str)
+        return index
+
+    table = table.copy(deep=False)
+    table.index = single_type(table.index)
+    table.columns = single_type(table.columns)
+    for position in range(table.shape[1]):
+        values = table.iloc[:, position]
+        if values.dtype == object and pd.api.types.infer_dtype(values, skipna=True).startswith('mixed'):
+            table.isetitem(position, values.astype(str))
+    return table
+
+
+######################## EXPORT ##################################
+
+def export_format(path, file_format=None):
+
+    # this function will return the file format export_tables writes to path (see EXPORT_FORMATS)
+
+    if file_format != None:
+        if file_format not in EXPORT_FORMATS.values():
+            raise ValueError('file_format must be one of ' + ', '.join(EXPORT_FORMATS.values()) + ' or None, not ' + repr(file_format))
+        return file_format
+
+    extension = os.path.splitext(path.rstrip('/\\'))[1].lower()
+    if extension not in EXPORT_FORMATS:
+        raise ValueError('cannot tell the file format from ' + repr(path) + ', use an ' + ', '.join(ext for ext in EXPORT_FORMATS if ext) \
+            + ' path, a directory path for parquet, or file_format')
+    return EXPORT_FORMATS[extension]
+
+
+def named_tables(tables):
+
+    # this function will iterate over the (name, table) pairs of a dictionary of tables or of an iterable of pairs
+
+    if isinstance(tables, dict):
+        return iter(tables.items())
+    return iter(tables)
+
+
+def export_tables(tables, path, layout='sheets', file_format=None, engine=None, sheet='Report', sparse=True):
+
+    # this function will write many tables from the table functions in one writer session
+    ## an .xlsx path writes one workbook: a sheet per table (layout='sheets'), or every table stacked on one sheet under its name
+    ## with a blank row between them (layout='blocks'). a .csv path writes one csv file with the tables stacked in blocks the same way
+    ## a path with no extension is a directory for a columnar dump: one parquet file per table (needs pyarrow or fastparquet), which
+    ## keeps the row index, double header MultiIndex columns and dtypes. pd.read_parquet gives the table back, except that index
+    ## levels and columns mixing types (ex: a margins 'Total' label in a row index of month numbers) come back as strings (see
+    ## columnar_table)
+    ## each table is written one row at a time as soon as it arrives, so memory is one table at most plus what the writer buffers
+
+    # ARGUMENTS
+
+    ## MANDATORY
+    ### tables is a dictionary of table name to table, or an iterable of (name, table) pairs
+    ####        ex: a generator calling the table functions, so each table is only built when it is written
+    ### path is the path of the .xlsx or .csv file, or of the directory for a parquet dump
+
+    ## OPTIONAL
+    ### layout is one of EXPORT_LAYOUTS for a workbook. defaults to 'sheets'
+    ### file_format is 'excel', 'csv' or 'parquet' to write regardless of the path's extension. defaults to None
+    ### engine is the excel engine, one of EXCEL_ENGINES, or None for the first one installed. defaults to None
+    ### sheet is the name of the sheet the tables are stacked on with layout='blocks'. defaults to 'Report'
+    ### sparse will show repeated outer index values and top header values once (not in the parquet dump). defaults to True
+
+    # returns the list of where each table was written, in order: its sheet name for a workbook of sheets, the row its name is
+    ## written on (counting from 0) for stacked blocks, or its file path for a parquet dump
+
+    import csv
+
+    file_format = export_format(path, file_format)
+    if layout not in EXPORT_LAYOUTS:
+        raise ValueError('layout must be one of ' + ', '.join(EXPORT_LAYOUTS) + ', not ' + repr(layout))
+
+    locations = []
+
+    if file_format == 'parquet':
+        os.makedirs(path, exist_ok=True)
+        file_names = []
+        for name, table in named_tables(tables):
+            file_name = unique_name(name, file_names, None)
+            file_names.append(file_name)
+            table_path = os.path.join(path, file_name + '.parquet')
+            columnar_table(table).to_parquet(table_path)
+            locations.append(table_path)
+        return locations
+
+    if file_format == 'csv':
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            row = 0
+            for name, table in named_tables(tables):
+                if row > 0:
+                    writer.writerow([])
+                    row += 1
+                locations.append(row)
+                writer.writerow([name])
+                row += 1
+                for values in table_rows(table, sparse):
+                    writer.writerow([cell_value(value) for value in values])
+                    row += 1
+        return locations
+
+    writer = ExcelRowWriter(path, engine)
+    try:
+        if layout == 'blocks':
+            writer.add_sheet(sheet)
+        for name, table in named_tables(tables):
+            if layout == 'sheets':
+                locations.append(writer.add_sheet(name))
+            else:
+                if writer.row > 0:
+                    writer.write_row([])
+                locations.append(writer.row)
+                writer.write_row([name])
+            for values in table_rows(table, sparse):
+                writer.write_row(values)
+    finally:
+        writer.close()
+    return locations
@@ -0,0 +1,6 @@
+# the modules live at the top of the repo, next to this folder
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,37 @@
+# TESTS FOR THE AGGREGATION FAST PATH (see plan_aggregations)
+
+import numpy as np
+import pandas as pd
+
+import analysis_functions
+
+
+def missing_value_frame():
+
+    # this function will return a small frame with a missing value in group 'a'
+
+    return pd.DataFrame({'g': ['a', 'a', 'a', 'b', 'b'], 'v': [1.0, np.nan, 3.0, 4.0, 5.0]})
+
+
+def test_np_median_keeps_missing_values():
+
+    # np.median gives NaN for a group with a missing value, so it is not rewritten into the built-in 'median'
+
+    df = missing_value_frame()
+    for agg_func in [np.median, lambda x: np.median(x)]:
+        assert analysis_functions.fast_path_aggregation(agg_func) == None
+        expected = df.groupby('g').agg({'v': agg_func})
+        result = analysis_functions.simple_groupby(df, 'g', {'v': agg_func})
+        pd.testing.assert_frame_equal(result, expected)
+        assert np.isnan(result.loc['a', 'v']) and result.loc['b', 'v'] == 4.5
+
+
+def test_nanmedian_is_rewritten():
+
+    # np.nanmedian and pd.Series.median skip missing values like the built-in 'median'
+
+    df = missing_value_frame()
+    for agg_func in [np.nanmedian, pd.Series.median, lambda x: x.median()]:
+        assert analysis_functions.fast_path_aggregation(agg_func) == 'median'
+        result = analysis_functions.simple_groupby(df, 'g', {'v': agg_func})
+        assert result['v'].tolist() == [2.0, 4.5]
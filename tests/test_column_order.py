@@ -0,0 +1,39 @@
+# TESTS FOR col_order WHEN SOME col_name x INDEX COMBINATIONS ARE NOT IN THE DATA
+
+import pandas as pd
+import pytest
+
+import analysis_functions
+
+
+def unobserved_frame():
+
+    # this function will return a small frame where FY2 has no 'b' rows and FY3 no 'a' rows
+
+    return pd.DataFrame({'fy': ['FY1', 'FY1', 'FY2', 'FY3'], 'dept': ['a', 'b', 'a', 'b'], 'unit': ['x', 'y', 'x', 'y'], \
+        'm': [1, 2, 3, 4]})
+
+
+def pivot_tables(aggregation, col_order):
+
+    # this function will build the three pivot tables with a col_name x index combination missing from the data
+
+    df = unobserved_frame()
+    aggregations = {'m': aggregation}
+    return [
+        analysis_functions.col_pivot_row_index_dbl_header_results(df, 'fy', 'dept', ['m'], aggregations, col_order=col_order),
+        analysis_functions.col_pivot_row_combined_multiindex_results(df, 'fy', ['m'], 'dept', aggregations, col_order=col_order),
+        analysis_functions.col_pivot_row_multiindex_dbl_header_results(df, 'fy', 'dept', 'unit', ['m'], aggregations, \
+            col_order=col_order),
+    ]
+
+
+# 'sum', 'count' and 'mean' of the integer column run on the dense kernel (see dense_aggregate), the others on pandas
+@pytest.mark.parametrize('aggregation', ['median', 'max', 'sum', 'count', 'mean'])
+def test_col_order_is_kept_with_unobserved_combinations(aggregation):
+
+    # the columns follow col_order, not the alphabetical order of the labels
+
+    col_order = analysis_functions.create_label_order_dict(['FY3', 'FY2', 'FY1'])
+    for table in pivot_tables(aggregation, col_order):
+        assert list(table.columns.get_level_values(0)) == ['FY3', 'FY2', 'FY1']
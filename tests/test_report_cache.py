@@ -0,0 +1,97 @@
+# TESTS FOR THE RESULT CACHE KEYS (see normalize_argument)
+
+import functools
+
+import numpy as np
+import pandas as pd
+
+import analysis_functions
+import report_cache
+
+
+def claims_frame():
+
+    # this function will return a small frame with many members in each department
+
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({'dept': rng.choice(['onc', 'peds'], 20000), 'member': rng.integers(0, 5000, 20000)})
+
+
+def test_partials_are_keyed_by_their_arguments(tmp_path):
+
+    # two partials of the same function with different arguments get their own cache entries, on disk too
+
+    df = claims_frame()
+    cache = report_cache.DiskResultCache(str(tmp_path))
+    cached_groupby = report_cache.cached_table_function(analysis_functions.simple_groupby, cache)
+
+    for q in [90, 10]:
+        aggregations = {'member': functools.partial(np.percentile, q=q)}
+        result = cached_groupby(df, 'dept', aggregations)
+        pd.testing.assert_frame_equal(result, analysis_functions.simple_groupby(df, 'dept', aggregations))
+    assert cache.stats()['hits'] == 0
+
+
+def test_named_functions_are_keyed_by_name():
+
+    # functions imported by name are keyed by name, a lambda by the object itself
+
+    assert report_cache.normalize_argument(np.sum) == ('function', 'numpy', 'sum')
+    assert report_cache.normalize_argument(analysis_functions.simple_groupby) == \
+        ('function', 'analysis_functions', 'simple_groupby')
+    assert report_cache.normalize_argument(lambda x: x.count())[0] == 'object'
+
+
+def test_approx_nunique_precisions_are_keyed_apart(tmp_path):
+
+    # an approximate distinct count and an exact one (error=0) cached one after the other each give their own counts
+
+    df = claims_frame()
+    cache = report_cache.DiskResultCache(str(tmp_path))
+    cached_groupby = report_cache.cached_table_function(analysis_functions.simple_groupby, cache)
+
+    approximate = cached_groupby(df, 'dept', {'member': analysis_functions.ApproxNunique(0.2)})
+    exact = cached_groupby(df, 'dept', {'member': analysis_functions.ApproxNunique(0)})
+    assert cache.stats()['hits'] == 0
+    assert exact['member'].tolist() == df.groupby('dept')['member'].nunique().tolist()
+    assert approximate['member'].tolist() != exact['member'].tolist()
+
+    # the same precision again is a hit
+    again = cached_groupby(df, 'dept', {'member': analysis_functions.ApproxNunique(0.2)})
+    pd.testing.assert_frame_equal(again, approximate)
+    assert cache.stats()['hits'] == 1
+    assert report_cache.normalize_argument(analysis_functions.ApproxNunique(0.2)) != \
+        report_cache.normalize_argument(analysis_functions.ApproxNunique(0))
+
+
+def test_sets_are_keyed_the_same_in_every_process():
+
+    # the order of a set of strings changes with the hash seed, its cache key does not
+
+    import os
+    import subprocess
+    import sys
+
+    code = 'import report_cache; print(report_cache.key_digest(report_cache.normalize_argument({"onc", "peds", "ortho", "cardio"})))'
+    digests = {subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, \
+        cwd=os.path.dirname(os.path.abspath(report_cache.__file__)), env={'PYTHONHASHSEED': str(seed)}).stdout for seed in range(4)}
+    assert len(digests) == 1
+
+
+def test_disk_entries_store_their_layout_as_json(tmp_path):
+
+    # a double header table with an ordered categorical row index comes back as it was, read from json and parquet only
+
+    df = claims_frame()
+    df['dept'] = pd.Categorical(df['dept'], categories=['peds', 'onc'], ordered=True)
+    df['fy'] = np.where(df['member'] % 2 == 0, 'FY1', 'FY2')
+    cache = report_cache.DiskResultCache(str(tmp_path))
+    cached_pivot = report_cache.cached_table_function(analysis_functions.col_pivot_row_index_dbl_header_results, cache)
+
+    arguments = (df, 'fy', 'dept', ['Members'], {'member': 'nunique'})
+    first = cached_pivot(*arguments)
+    again = cached_pivot(*arguments)
+    assert cache.stats()['hits'] == 1
+    pd.testing.assert_frame_equal(again, first)
+    [entry] = [path for path in tmp_path.iterdir() if not path.name.startswith('.')]
+    assert sorted(path.name for path in entry.iterdir()) == ['layout.json', 'table_0.parquet']
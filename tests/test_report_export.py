@@ -0,0 +1,44 @@
+# TESTS FOR THE PARQUET DUMP OF export_tables
+
+import pandas as pd
+
+import analysis_functions
+import report_export
+
+
+def claims_frame():
+
+    # this function will return a small frame with month numbers to pivot on
+
+    return pd.DataFrame({'fy': ['FY1', 'FY1', 'FY2', 'FY2', 'FY2'], 'dept': ['a', 'b', 'a', 'b', 'b'], 'month': [1, 2, 1, 2, 3], \
+        'paid': [10.5, 20.0, 30.25, 40.0, 50.0], 'member': [1, 2, 3, 4, 5]})
+
+
+def round_trip(table, tmp_path):
+
+    # this function will dump one table to parquet with export_tables and read it back
+
+    [table_path] = report_export.export_tables({'table': table}, str(tmp_path / 'dump'))
+    return pd.read_parquet(table_path)
+
+
+def test_double_header_table_comes_back_as_it_is(tmp_path):
+
+    table = analysis_functions.col_pivot_row_index_dbl_header_results(claims_frame(), 'fy', 'dept', ['Paid', 'Members'], \
+        {'paid': 'sum', 'member': 'nunique'})
+    assert isinstance(table.columns, pd.MultiIndex)
+
+    pd.testing.assert_frame_equal(round_trip(table, tmp_path), table)
+
+
+def test_margins_labels_come_back_as_strings(tmp_path):
+
+    # the 'Total' row and column share their levels with month numbers, so those levels are written as strings
+
+    table = analysis_functions.col_pivot_row_index_dbl_header_results(claims_frame(), 'fy', 'month', ['Paid'], {'paid': 'sum'}, \
+        margins=True)
+    assert 'Total' in table.index
+
+    expected = report_export.columnar_table(table)
+    assert list(expected.index) == ['1', '2', '3', 'Total']
+    pd.testing.assert_frame_equal(round_trip(table, tmp_path), expected)